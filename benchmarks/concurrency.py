@@ -0,0 +1,84 @@
+"""
+Cycle latency against local Slack / GitHub stand-ins
+as API concurrency goes up:
+
+    python -m benchmarks.concurrency --messages 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from benchmarks.servers import FakeGitHubServer, FakeSlackServer
+from clients import GitHubClient, SlackClient
+from helpers import (Context, PullRequestCache, PullRequestResolver,
+                     Scheduler, TierLimiter)
+import main
+
+
+async def run_cycle(args: argparse.Namespace, concurrency: int):
+    """
+    Run a single processing cycle against fresh stand-ins
+    :param args:        benchmark arguments
+    :param concurrency: per-service concurrency limit (int)
+    :return: tuple of cycle duration and API call counts
+    """
+    slack_server = FakeSlackServer(args.messages, args.replies,
+                                   args.pulls, args.latency)
+    github_server = FakeGitHubServer(args.latency)
+    slack_url = await slack_server.start()
+    github_url = await github_server.start()
+
+    cycle_args = argparse.Namespace(time_window=60,
+                                    reaction_name="white_check_mark",
+                                    sleep_period=0)
+    # stand-ins are not rate limited, measure concurrency only
+    limiter = TierLimiter(rates={tier: 10 ** 9 for tier in range(1, 5)})
+    slack_client = SlackClient("xoxb-bench", base_url=f"{slack_url}/api/",
+                               limiter=limiter)
+    github_client = GitHubClient("ghp-bench", base_url=github_url)
+    scheduler = Scheduler({"slack": concurrency, "github": concurrency})
+    cache = PullRequestCache()
+    resolver = PullRequestResolver(github_client, cache) \
+        if args.graphql else None
+    try:
+        started = time.perf_counter()
+        await main.process_messages(Context(cycle_args,
+                                            {"C0BENCH": slack_client},
+                                            github_client, scheduler,
+                                            cache, resolver=resolver))
+        duration = time.perf_counter() - started
+    finally:
+        await github_client.close()
+        await slack_server.stop()
+        await github_server.stop()
+    return duration, {**slack_server.calls, **github_server.calls}
+
+
+async def run(args: argparse.Namespace):
+    """
+    Run benchmark for every concurrency level
+    :param args: benchmark arguments
+    :return: None
+    """
+    print(f"{'concurrency':>11} {'cycle (s)':>10}  api calls")
+    for concurrency in args.concurrency:
+        duration, calls = await run_cycle(args, concurrency)
+        print(f"{concurrency:>11} {duration:>10.3f}  {calls}")
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--replies", type=int, default=2)
+    parser.add_argument("--pulls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--graphql", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(get_arguments()))
@@ -0,0 +1,102 @@
+"""
+Cost of re-evaluating messages after pull request state changes:
+every message (per-message evaluation) against only the messages
+referencing the changed pull requests (PullRequestIndex):
+
+    python -m benchmarks.index --messages 1000 10000 --pulls 500 5000
+"""
+import argparse
+import logging
+import random
+import time
+from types import SimpleNamespace
+
+from helpers import PullRequestIndex
+
+
+def build_messages(messages: int, pulls: int, per_message: int):
+    """
+    Build synthetic messages referencing random pull requests
+    :param messages:    number of messages (int)
+    :param pulls:       number of distinct pull requests (int)
+    :param per_message: pull requests per message (int)
+    :return: list of message stand-ins
+    """
+    return [SimpleNamespace(
+        timestamp=f"{1000000 + index}.000100",
+        pull_keys=[("acme", "repo", number)
+                   for number in random.sample(range(1, pulls + 1),
+                                               min(per_message, pulls))])
+        for index in range(messages)]
+
+
+def per_message(messages: list, changes: list):
+    """
+    Re-evaluate every message after each change
+    :param messages: list of message stand-ins
+    :param changes:  list of changed pull request numbers
+    :return: number of ready messages (int)
+    """
+    approved = set()
+    ready = 0
+    for number in changes:
+        approved.add(number)
+        for message in messages:
+            numbers = [number for _, _, number in message.pull_keys]
+            if all(number in approved for number in numbers):
+                ready += 1
+    return ready
+
+
+def indexed(messages: list, changes: list):
+    """
+    Re-evaluate only messages referencing each change
+    :param messages: list of message stand-ins
+    :param changes:  list of changed pull request numbers
+    :return: number of ready messages (int)
+    """
+    index = PullRequestIndex()
+    for message in messages:
+        index.add("C0BENCH", message)
+    ready = 0
+    for number in changes:
+        ready += len(index.update(("acme", "repo", number), True))
+    return ready
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, nargs="+",
+                        default=[100, 1000, 5000])
+    parser.add_argument("--pulls", type=int, nargs="+",
+                        default=[50, 500, 2500])
+    parser.add_argument("--per_message", type=int, default=3)
+    parser.add_argument("--changes", type=int, default=100)
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+    print(f"{'messages':>8} {'pulls':>6} {'per-message (s)':>16} "
+          f"{'indexed (s)':>12}")
+    for messages_count in args.messages:
+        for pulls in args.pulls:
+            messages = build_messages(messages_count, pulls,
+                                      args.per_message)
+            changes = random.sample(range(1, pulls + 1),
+                                    min(args.changes, pulls))
+
+            started = time.perf_counter()
+            per_message(messages, changes)
+            naive = time.perf_counter() - started
+
+            started = time.perf_counter()
+            indexed(messages, changes)
+            index = time.perf_counter() - started
+            print(f"{messages_count:>8} {pulls:>6} {naive:>16.4f} "
+                  f"{index:>12.4f}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,175 @@
+"""
+End-to-end load test: consecutive main.process_messages cycles over
+synthetic channels (N messages, M threads, K PRs) served by local
+Slack / GitHub stand-ins with configurable latency, rate limits,
+page size and payload size. Reports throughput, p50 / p99 cycle
+time and API calls per approved message:
+
+    python -m benchmarks.load --channels 4 --messages 500 --threads 100
+    python -m benchmarks.load --latency 0.05 --jitter 0.05 --page_size 50
+    python -m benchmarks.load --slack_rate_limit 100 --tier_limits --state
+    python -m benchmarks.load --reviews 250 --merged
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import tempfile
+import time
+
+from benchmarks.servers import FakeGitHubServer, FakeSlackServer
+from clients import GitHubClient, HTTPTransport, SlackClient
+from helpers import (Context, Metrics, PullRequestCache, PullRequestResolver,
+                     Scheduler, SQLiteState, TierLimiter)
+import main
+
+
+def percentile(values: list, quantile: float):
+    """
+    Get nearest-rank percentile
+    :param values:   observed values (list of float)
+    :param quantile: quantile between 0 and 1 (float)
+    :return: percentile (float)
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(quantile * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def api_calls(*servers):
+    """
+    Sum API calls served by stand-ins
+    :param servers: instances of FakeServer cls
+    :return: number of calls (int)
+    """
+    # 304 responses are counted as list_reviews calls already
+    return sum(count for server in servers
+               for name, count in server.calls.items()
+               if name != "not_modified")
+
+
+async def run(args: argparse.Namespace):
+    """
+    Run processing cycles against the stand-ins and report
+    :param args: benchmark arguments
+    :return: None
+    """
+    slack_server = FakeSlackServer(args.messages, args.replies, args.pulls,
+                                   latency=args.latency,
+                                   jitter=args.jitter,
+                                   rate_limit=args.slack_rate_limit,
+                                   threads=args.threads,
+                                   page_size=args.page_size,
+                                   padding=args.padding)
+    github_server = FakeGitHubServer(latency=args.latency,
+                                     approved=not args.pending,
+                                     reviews=args.reviews,
+                                     merged=args.merged,
+                                     jitter=args.jitter,
+                                     rate_limit=args.github_rate_limit)
+    slack_url = await slack_server.start()
+    github_url = await github_server.start()
+
+    # stand-in timestamps are decades old, keep them in the window
+    cycle_args = argparse.Namespace(time_window=60 * 24 * 365 * 100,
+                                    reaction_name="white_check_mark",
+                                    sleep_period=0)
+    # without client-side tier limits only the server ones apply
+    limiter = TierLimiter() if args.tier_limits else \
+        TierLimiter(rates={tier: 10 ** 9 for tier in range(1, 5)})
+    metrics = Metrics()
+    transport = HTTPTransport(metrics=metrics)
+    slack_client = SlackClient("xoxb-bench", base_url=f"{slack_url}/api/",
+                               limiter=limiter, metrics=metrics,
+                               transport=transport)
+    github_client = GitHubClient("ghp-bench", base_url=github_url,
+                                 metrics=metrics, transport=transport)
+    scheduler = Scheduler({"slack": args.slack_concurrency,
+                           "github": args.github_concurrency})
+    state_dir = tempfile.TemporaryDirectory() if args.state else None
+    state = SQLiteState(os.path.join(state_dir.name, "state.db")) \
+        if state_dir else None
+    cache = PullRequestCache(args.cache_ttl, backend=state)
+    resolver = PullRequestResolver(github_client, cache) \
+        if args.graphql else None
+    channels = {f"C{index:04d}BENCH": slack_client
+                for index in range(args.channels)}
+    context = Context(cycle_args, channels, github_client, scheduler,
+                      cache, state, resolver=resolver, metrics=metrics)
+
+    messages = args.channels * sum(len(thread) for thread
+                                   in slack_server.threads.values())
+    print(f"{'cycle':>5} {'time (s)':>9} {'msg/s':>9} {'api calls':>10} "
+          f"{'approved':>9}")
+    durations = []
+    try:
+        for cycle in range(args.cycles):
+            calls = api_calls(slack_server, github_server)
+            approved = len(slack_server.reactions)
+            started = time.perf_counter()
+            await main.process_messages(context)
+            duration = time.perf_counter() - started
+            durations.append(duration)
+            print(f"{cycle:>5} {duration:>9.3f} {messages / duration:>9.0f} "
+                  f"{api_calls(slack_server, github_server) - calls:>10} "
+                  f"{len(slack_server.reactions) - approved:>9}")
+    finally:
+        await transport.close()
+        await slack_server.stop()
+        await github_server.stop()
+        if state:
+            state.close()
+            state_dir.cleanup()
+
+    calls = api_calls(slack_server, github_server)
+    approved = len(slack_server.reactions)
+    print(f"\nthroughput: {messages * len(durations) / sum(durations):.0f} "
+          f"msg/s over {messages} messages per cycle")
+    print(f"cycle time: p50 {percentile(durations, 0.5):.3f}s, "
+          f"p99 {percentile(durations, 0.99):.3f}s")
+    per_message = f"{calls / approved:.2f}" if approved else "n/a"
+    print(f"api calls: {calls} total, {per_message} per approved message "
+          f"({approved} approved)")
+    print(f"rate limited: slack {slack_server.throttled}, "
+          f"github {github_server.throttled}")
+    print(f"calls by method: {slack_server.calls} {github_server.calls}")
+    for host, stats in transport.stats().items():
+        print(f"connections {host}: {stats['created']} opened, "
+              f"{stats['reused']} reused")
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--messages", type=int, default=200)
+    # messages with replies, defaults to all messages
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--replies", type=int, default=2)
+    parser.add_argument("--pulls", type=int, default=50)
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--page_size", type=int, default=1000)
+    parser.add_argument("--padding", type=int, default=0)
+    # requests per minute and method, 0 for unlimited
+    parser.add_argument("--slack_rate_limit", type=int, default=0)
+    parser.add_argument("--github_rate_limit", type=int, default=5000)
+    # throttle Slack calls client-side by the real tier rates
+    parser.add_argument("--tier_limits", action="store_true")
+    parser.add_argument("--slack_concurrency", type=int, default=4)
+    parser.add_argument("--github_concurrency", type=int, default=8)
+    parser.add_argument("--cache_ttl", type=int, default=300)
+    parser.add_argument("--graphql", action="store_true")
+    parser.add_argument("--state", action="store_true")
+    # leave every PR awaiting approval
+    parser.add_argument("--pending", action="store_true")
+    # reviews per PR, all but the first one are comments
+    parser.add_argument("--reviews", type=int, default=1)
+    parser.add_argument("--merged", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(get_arguments()))
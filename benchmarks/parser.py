@@ -0,0 +1,241 @@
+"""
+Slack message parsing over a corpus of large synthetic payloads:
+the former multi-pass parser (blocks -> elements -> urls -> PR urls,
+raw message kept, payloads logged) against the single-pass
+SlackMessage parser, comparing throughput and memory retained per
+parsed message. The single-pass parser also scans message text and
+attachments, which the former one skipped:
+
+    python -m benchmarks.parser --messages 2000 --blocks 20
+    python -m benchmarks.parser --log_level WARNING
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import time
+import tracemalloc
+
+from helpers import SlackMessage
+
+
+def build_message(index: int, blocks: int, pulls: int):
+    """
+    Build synthetic Slack message with rich text, mrkdwn
+    and context blocks, attachments and a text fallback
+    :param index:  message sequence number (int)
+    :param blocks: number of layout blocks (int)
+    :param pulls:  number of distinct PRs linked (int)
+    :return: Slack message (dict)
+    """
+    urls = [f"https://github.com/acme/repo-{number % 7}/pull/{number}"
+            for number in random.sample(range(1, pulls + 1), 3)]
+    layout = []
+    for block in range(blocks):
+        url = urls[block % len(urls)]
+        layout.append({
+            "type": "rich_text",
+            "block_id": f"b{index}-{block}",
+            "elements": [{
+                "type": "rich_text_section",
+                "elements": [
+                    {"type": "text", "text": "please have a look at "},
+                    {"type": "link", "url": url},
+                    {"type": "text", "text": " and the docs at "},
+                    {"type": "link",
+                     "url": "https://docs.example.com/guide"}
+                ]
+            }, {
+                "type": "rich_text_list",
+                "style": "bullet",
+                "elements": [{
+                    "type": "rich_text_section",
+                    "elements": [{"type": "text",
+                                  "text": f"item {item} " * 8}]
+                } for item in range(4)]
+            }]
+        })
+        layout.append({
+            "type": "section",
+            "text": {"type": "mrkdwn",
+                     "text": f"*build* passed for <{url}|#{block}>"}
+        })
+    return {
+        "type": "message",
+        "ts": f"{1000000 + index}.000100",
+        "user": "U0BENCH",
+        "text": " ".join(f"<{url}>" for url in urls),
+        "blocks": layout,
+        "attachments": [{"fallback": "CI report",
+                         "title_link": urls[0],
+                         "text": "lint, unit, e2e " * 20}],
+        "reactions": [{"name": "eyes", "count": 1, "users": ["U0"]}]
+    }
+
+
+class LegacyMessageData:
+    """ Former multi-pass Slack message parser, as it was shipped """
+
+    def __init__(self, slack_message: dict):
+        self.raw_message = slack_message
+
+        self.timestamp = self.raw_message["ts"]
+        self.blocks = self.parse_msg_blocks()
+        self.elements = self.parse_elements()
+
+    def parse_msg_blocks(self):
+        if "blocks" in self.raw_message.keys():
+            msg_blocks = [msg_block for msg_block
+                          in self.raw_message.get("blocks")]
+
+            logging.info(f"found {len(msg_blocks)} message blocks")
+            logging.debug(f"message blocks: {msg_blocks}")
+            return msg_blocks
+        else:
+            logging.info("message has no blocks")
+            return []
+
+    def get_block_elements(self, block: dict, block_elements: [] = None):
+        if block_elements is None:
+            block_elements = []
+
+        if block.get("elements"):
+
+            for block_element in block.get("elements"):
+                if "elements" not in block_element.keys():
+                    block_elements.append(block_element)
+                else:
+
+                    for element in block_element.get("elements"):
+                        if "elements" not in element.keys():
+                            block_elements.append(element)
+                        else:
+                            self.get_block_elements(
+                                element, block_elements)
+
+        return block_elements
+
+    def parse_elements(self):
+        if self.blocks:
+            message_elements = []
+            for block in self.blocks:
+                block_elements = self.get_block_elements(block)
+                message_elements.extend(block_elements)
+
+            logging.info(f"found {len(message_elements)} message"
+                         f" elements")
+            logging.debug(f"message elements: {message_elements}")
+            return message_elements
+        else:
+            logging.info("message has no elements")
+            return []
+
+
+class LegacyMessage(LegacyMessageData):
+    """ Former Slack message model, keeps the raw payload """
+
+    def __init__(self, slack_message: dict, slack_reaction: str):
+        self.reaction = slack_reaction
+        super().__init__(slack_message)
+
+        self.is_approved = self.lookup_reaction()
+        self.urls = self.get_msg_urls()
+        self.pull_reqs = self.parse_pr_urls()
+
+    def lookup_reaction(self):
+        if "reactions" in self.raw_message.keys():
+            reactions = [msg_reaction.get("name")
+                         for msg_reaction
+                         in self.raw_message.get("reactions")]
+            logging.info(f"found {len(reactions)} message user reactions")
+            logging.debug(f"user reactions: {reactions}")
+        else:
+            logging.info("message has no user reactions")
+            reactions = []
+        if reactions and self.reaction in reactions:
+            logging.info(f"message has reaction '{self.reaction}'")
+            return True
+        logging.info(f"message has no reaction '{self.reaction}'")
+        return False
+
+    def get_msg_urls(self):
+        urls = [element.get("url")
+                for element in self.elements
+                if element.get("type") == "link"]
+        if urls:
+            logging.info(f"found {len(urls)} message urls")
+            logging.debug(f"urls: {urls}")
+            return urls
+        else:
+            logging.info("message has no urls")
+            return []
+
+    def parse_pr_urls(self):
+        re_pattern = r"http[s]://github.com/.+/pull/\d+"
+        pr_urls = [match.group() for url in self.urls
+                   if (match := re.search(re_pattern, url)
+                       )]
+        if pr_urls:
+            logging.info(f"found {len(pr_urls)} pull requests")
+            logging.debug(f"pull requests: {pr_urls}")
+            return pr_urls
+        else:
+            logging.info("message has no pull requests")
+            return []
+
+
+def measure(parser, corpus: list, payloads: list):
+    """
+    Parse corpus, measuring time and memory kept alive by parsed
+    messages once the decoded API payloads are dropped
+    :param parser:   message class (cls)
+    :param corpus:   list of Slack messages (dict)
+    :param payloads: list of JSON encoded Slack messages (str)
+    :return: tuple of duration (s) and retained bytes per message
+    """
+    started = time.perf_counter()
+    for message in corpus:
+        parser(message, "white_check_mark")
+    duration = time.perf_counter() - started
+
+    tracemalloc.start()
+    parsed = [parser(json.loads(payload), "white_check_mark")
+              for payload in payloads]
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del parsed
+    return duration, retained / len(payloads)
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--blocks", type=int, nargs="+",
+                        default=[1, 5, 20])
+    parser.add_argument("--pulls", type=int, default=500)
+    # records are created but not written, INFO is the app default
+    parser.add_argument("--log_level", default="INFO")
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+    logging.basicConfig(level=args.log_level,
+                        handlers=[logging.NullHandler()])
+    random.seed(0)
+    print(f"{'blocks':>6} {'parser':>11} {'msg/s':>10} "
+          f"{'retained (B/msg)':>17}")
+    for blocks in args.blocks:
+        corpus = [build_message(index, blocks, args.pulls)
+                  for index in range(args.messages)]
+        payloads = [json.dumps(message) for message in corpus]
+        for name, parser in (("legacy", LegacyMessage),
+                             ("single-pass", SlackMessage)):
+            duration, retained = measure(parser, corpus, payloads)
+            print(f"{blocks:>6} {name:>11} "
+                  f"{args.messages / duration:>10.0f} {retained:>17.0f}")
+
+
+if __name__ == '__main__':
+    main()
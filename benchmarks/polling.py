@@ -0,0 +1,120 @@
+"""
+Fixed sleep_period polling against adaptive polling over a channel of
+pull requests posted over time: the newest ones are discussed and get
+approved while the benchmark runs, older ones stay idle. Reports
+reaction delay after approval and API calls of both loops:
+
+    python -m benchmarks.polling --duration 60 --sleep_period 20
+    python -m benchmarks.polling --messages 500 --hot 20 --activity 0
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from benchmarks.load import api_calls, percentile
+from benchmarks.servers import FakeGitHubServer, FakeSlackServer
+from clients import GitHubClient, SlackClient
+from helpers import (Context, PollQueue, PullRequestCache, Scheduler,
+                     TierLimiter)
+import main
+
+
+async def run_loop(args: argparse.Namespace, adaptive: bool):
+    """
+    Run a polling loop against fresh stand-ins for the benchmark duration
+    :param args:     benchmark arguments
+    :param adaptive: adaptive polling if set, otherwise fixed (bool)
+    :return: tuple of reaction delays (list of float) and API calls (int)
+    """
+    started = time.time()
+    random.seed(0)
+    # the newest pull requests get approved while the loop runs
+    approve_at = {number: started + random.uniform(0, args.duration * 0.8)
+                  for number in range(args.messages - args.hot + 1,
+                                      args.messages + 1)}
+    slack_server = FakeSlackServer(args.messages, 0, args.messages,
+                                   latency=args.latency, newest=started,
+                                   spacing=args.spacing)
+    github_server = FakeGitHubServer(latency=args.latency, approved=False,
+                                     approve_at=approve_at,
+                                     activity=args.activity)
+    slack_url = await slack_server.start()
+    github_url = await github_server.start()
+
+    cycle_args = argparse.Namespace(time_window=60 * 24 * 365,
+                                    reaction_name="white_check_mark",
+                                    sleep_period=args.sleep_period / 60)
+    limiter = TierLimiter(rates={tier: 10 ** 9 for tier in range(1, 5)})
+    slack_client = SlackClient("xoxb-bench", base_url=f"{slack_url}/api/",
+                               limiter=limiter)
+    github_client = GitHubClient("ghp-bench", base_url=github_url)
+    poller = PollQueue(args.min_interval, args.max_interval,
+                       age_ratio=args.age_ratio) if adaptive else None
+    context = Context(cycle_args, {"C0BENCH": slack_client}, github_client,
+                      Scheduler({"slack": 4, "github": 8}),
+                      PullRequestCache(args.sleep_period), poller=poller)
+    cycle = main.poll_messages if adaptive else main.process_messages
+
+    async def loop():
+        while True:
+            await cycle(context)
+
+    try:
+        await asyncio.wait_for(loop(), args.duration)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        await github_client.close()
+        await slack_server.stop()
+        await github_server.stop()
+
+    # message n links pull request n + 1
+    numbers = {ts: index + 1
+               for index, ts in enumerate(slack_server.threads)}
+    delays = [reacted - approve_at[numbers[ts]]
+              for (_, ts, _), reacted in slack_server.reactions.items()]
+    missed = len([at for at in approve_at.values()
+                  if at < started + args.duration]) - len(delays)
+    return delays, missed, api_calls(slack_server, github_server)
+
+
+async def run(args: argparse.Namespace):
+    """
+    Run benchmark for both polling loops
+    :param args: benchmark arguments
+    :return: None
+    """
+    print(f"{'polling':>8} {'delay p50 (s)':>14} {'delay max (s)':>14} "
+          f"{'not reacted':>12} {'api calls':>10}")
+    for adaptive in (False, True):
+        delays, missed, calls = await run_loop(args, adaptive)
+        name = "adaptive" if adaptive else "fixed"
+        p50 = f"{percentile(delays, 0.5):.1f}" if delays else "-"
+        worst = f"{max(delays):.1f}" if delays else "-"
+        print(f"{name:>8} {p50:>14} {worst:>14} {missed:>12} {calls:>10}")
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    # newest pull requests approved during the run
+    parser.add_argument("--hot", type=int, default=10)
+    # seconds between messages
+    parser.add_argument("--spacing", type=float, default=30)
+    parser.add_argument("--duration", type=float, default=60)
+    # fixed polling period, channels are scanned at least as often
+    parser.add_argument("--sleep_period", type=float, default=20)
+    parser.add_argument("--min_interval", type=float, default=2)
+    parser.add_argument("--max_interval", type=float, default=120)
+    parser.add_argument("--age_ratio", type=float, default=0.1)
+    # seconds between comments on PRs awaiting approval, 0 for none
+    parser.add_argument("--activity", type=float, default=5)
+    parser.add_argument("--latency", type=float, default=0.02)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(get_arguments()))
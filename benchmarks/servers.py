@@ -0,0 +1,569 @@
+import asyncio
+import logging
+import random
+import time
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+
+class FakeServer:
+    """ Local HTTP stand-in base class """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 rate_limit: int = 0, window: float = 60.0):
+        """
+        Instantiate class instance
+        :param latency:    response delay in seconds (float)
+        :param jitter:     random extra delay up to seconds (float)
+        :param rate_limit: requests allowed per window and
+                           rate limit bucket, 0 for unlimited (int)
+        :param window:     rate limit window in seconds (float)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.limit = rate_limit
+        self.window = window
+        # bucket -> [window start (float), requests (int)]
+        self.windows = {}
+        # rejected requests per bucket
+        self.throttled = {}
+        # keep-alive client connections are not waited for on stop
+        self.shutdown_timeout = 0.1
+        self.calls = {}
+        # time.perf_counter() of the first call
+        self.first_call = None
+        self.app = web.Application()
+        self.runner = None
+        self.url = None
+
+    def count(self, name: str):
+        """
+        Count a single API call
+        :param name: api method name (str)
+        :return: None
+        """
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.first_call is None:
+            self.first_call = time.perf_counter()
+
+    async def delay(self):
+        """
+        Simulate network and server latency
+        :return: None
+        """
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def usage(self, bucket: str):
+        """
+        Get rate limit window of a bucket, starting
+        a new one once the previous window passed
+        :param bucket: rate limit bucket, e.g. api method (str)
+        :return: tuple of requests used (int) and reset time (float)
+        """
+        now = time.time()
+        window = self.windows.get(bucket)
+        if window is None or now >= window[0] + self.window:
+            window = self.windows[bucket] = [now, 0]
+        return window[1], window[0] + self.window
+
+    def throttle(self, bucket: str):
+        """
+        Take a request from the bucket window
+        :param bucket: rate limit bucket, e.g. api method (str)
+        :return: 0 if allowed, otherwise seconds until reset (float)
+        """
+        used, reset = self.usage(bucket)
+        if self.limit and used >= self.limit:
+            self.throttled[bucket] = self.throttled.get(bucket, 0) + 1
+            return max(reset - time.time(), 0.0)
+        self.windows[bucket][1] += 1
+        return 0
+
+    async def start(self, ssl_context=None):
+        """
+        Start server on a random local port
+        :param ssl_context: ssl.SSLContext, serves https if set
+        :return: server base url (str)
+        """
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0,
+                           shutdown_timeout=self.shutdown_timeout,
+                           ssl_context=ssl_context)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        scheme = "https" if ssl_context else "http"
+        self.url = f"{scheme}://127.0.0.1:{port}"
+        logging.info(f"{type(self).__name__} listening on {self.url}")
+        return self.url
+
+    async def stop(self):
+        """
+        Stop server
+        :return: None
+        """
+        if self.runner:
+            await self.runner.cleanup()
+
+
+class FakeSlackServer(FakeServer):
+    """ Slack Web API stand-in serving a synthetic channel """
+
+    def __init__(self, messages: int, replies: int, pulls: int,
+                 latency: float = 0.0, jitter: float = 0.0,
+                 rate_limit: int = 0, window: float = 60.0,
+                 threads: int = None, page_size: int = 1000,
+                 padding: int = 0, newest: float = None,
+                 spacing: float = 1.0):
+        """
+        Instantiate class instance
+        :param messages:   number of top level messages (int)
+        :param replies:    number of replies per thread (int)
+        :param pulls:      number of distinct PRs linked (int)
+        :param latency:    response delay in seconds (float)
+        :param jitter:     random extra delay up to seconds (float)
+        :param rate_limit: requests per window and method,
+                           0 for unlimited (int)
+        :param window:     rate limit window in seconds (float)
+        :param threads:    number of messages with replies,
+                           defaults to all messages (int)
+        :param page_size:  max messages served per page (int)
+        :param padding:    filler text added to every message (int)
+        :param newest:     timestamp of the newest message, messages
+                           are decades old if not set (float)
+        :param spacing:    seconds between messages (float)
+        """
+        super().__init__(latency, jitter, rate_limit, window)
+        self.pulls = pulls
+        self.page_size = page_size
+        self.padding = padding
+        self.threads = {}
+        # (channel, ts, name) of added reactions -> time added
+        self.reactions = {}
+        threads = messages if threads is None else threads
+        for index in range(messages):
+            if newest is None:
+                ts = f"{1000000 + index}.000100"
+                reply_ts = [f"{1000000 + index}.{reply + 200:06d}"
+                            for reply in range(replies)]
+            else:
+                posted = newest - (messages - 1 - index) * spacing
+                ts = f"{posted:.6f}"
+                reply_ts = [f"{posted + (reply + 1) / 1000:.6f}"
+                            for reply in range(replies)]
+            reply_count = replies if index < threads else 0
+            thread = [self.message(ts, index, reply_count=reply_count,
+                                   latest_reply=reply_ts[reply_count - 1]
+                                   if reply_count else None)]
+            for reply in range(reply_count):
+                thread.append(self.message(reply_ts[reply],
+                                           index * (replies + 1) + reply + 1,
+                                           thread_ts=ts))
+            self.threads[ts] = thread
+        self.app.router.add_route("*", "/api/{method}", self.handle)
+
+    def message(self, ts: str, index: int, thread_ts: str = None,
+                reply_count: int = 0, latest_reply: str = None):
+        """
+        Build synthetic Slack message linking a single PR
+        :param ts:           message timestamp (str)
+        :param index:        message sequence number (int)
+        :param thread_ts:    parent message timestamp (str)
+        :param reply_count:  number of thread replies (int)
+        :param latest_reply: latest reply timestamp (str)
+        :return: Slack message (dict)
+        """
+        number = index % self.pulls + 1
+        url = f"https://github.com/acme/repo/pull/{number}"
+        message = {
+            "type": "message",
+            "ts": ts,
+            "text": f"please review <{url}>",
+            "blocks": [{
+                "type": "rich_text",
+                "elements": [{
+                    "type": "rich_text_section",
+                    "elements": [
+                        {"type": "text", "text": "please review "},
+                        {"type": "link", "url": url}
+                    ]
+                }]
+            }]
+        }
+        if self.padding:
+            message["blocks"].append({
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": "x" * self.padding}
+            })
+        if thread_ts:
+            message["thread_ts"] = thread_ts
+        elif reply_count:
+            message["thread_ts"] = ts
+            message["reply_count"] = reply_count
+            message["latest_reply"] = latest_reply
+        return message
+
+    def page(self, messages: list, params: dict):
+        """
+        Serve a page of messages with cursor pagination
+        see https://api.slack.com/docs/pagination
+        :param messages: all messages (list of dict)
+        :param params:   request parameters (dict)
+        :return: Slack API response (dict)
+        """
+        offset = int(params.get("cursor") or 0)
+        limit = min(int(params.get("limit") or 100), self.page_size)
+        end = offset + limit
+        has_more = end < len(messages)
+        return {"ok": True, "messages": messages[offset:end],
+                "has_more": has_more,
+                "response_metadata": {"next_cursor":
+                                      str(end) if has_more else ""}}
+
+    async def handle(self, request: web.Request):
+        """
+        Dispatch Slack Web API method
+        :param request: aiohttp request
+        :return: aiohttp json response
+        """
+        method = request.match_info["method"]
+        params = dict(request.query)
+        if request.can_read_body:
+            params.update(await request.post())
+        self.count(method)
+        await self.delay()
+        retry_after = self.throttle(method)
+        if retry_after:
+            return web.json_response(
+                {"ok": False, "error": "ratelimited"}, status=429,
+                headers={"Retry-After": str(int(retry_after) + 1)})
+
+        if method == "conversations.history":
+            # newest first, as served by Slack
+            messages = [thread[0] for thread
+                        in reversed(self.threads.values())]
+            return web.json_response(self.page(messages, params))
+        if method == "conversations.replies":
+            messages = self.threads.get(params.get("ts"), [])
+            return web.json_response(self.page(messages, params))
+        if method == "reactions.add":
+            reaction = (params.get("channel"), params.get("timestamp"),
+                        params.get("name"))
+            if reaction in self.reactions:
+                return web.json_response({"ok": False,
+                                          "error": "already_reacted"})
+            self.reactions[reaction] = time.time()
+            return web.json_response({"ok": True})
+        return web.json_response({"ok": False, "error": "unknown_method"})
+
+
+class FakeGitHubServer(FakeServer):
+    """ GitHub REST API stand-in """
+
+    def __init__(self, latency: float = 0.0, approved: bool = True,
+                 jitter: float = 0.0, rate_limit: int = 5000,
+                 window: float = 3600.0, reviews: int = 1,
+                 merged: bool = False, approve_at: dict = None,
+                 activity: float = 0.0, missing: set = None,
+                 decisions: dict = None):
+        """
+        Instantiate class instance
+        :param latency:    response delay in seconds (float)
+        :param approved:   whether every PR is approved (bool)
+        :param jitter:     random extra delay up to seconds (float)
+        :param rate_limit: requests per window and resource (int)
+        :param window:     rate limit window in seconds (float)
+        :param reviews:    reviews per PR, the first one approves or
+                           comments, the rest are comments (int)
+        :param merged:     whether every PR is merged (bool)
+        :param approve_at: PR number -> time the PR gets approved,
+                           overrides approved (dict)
+        :param activity:   seconds between comments on PRs of
+                           approve_at until approved, 0 for none (float)
+        :param missing:    PR numbers which do not exist (set)
+        :param decisions:  PR number -> GraphQL reviewDecision, e.g.
+                           REVIEW_REQUIRED, none if not set (dict)
+        """
+        super().__init__(latency, jitter, rate_limit, window)
+        self.approved = approved
+        self.review_count = reviews
+        self.merged = merged
+        self.approve_at = approve_at if approve_at else {}
+        self.activity = activity
+        self.missing = missing if missing else set()
+        self.decisions = decisions if decisions else {}
+        self.started = time.time()
+        self.app.router.add_get("/rate_limit", self.rate_limit)
+        self.app.router.add_get("/repos/{owner}/{repo}/pulls/{number}",
+                                self.pull)
+        self.app.router.add_get(
+            "/repos/{owner}/{repo}/pulls/{number}/reviews", self.reviews)
+        self.app.router.add_post("/graphql", self.graphql)
+
+    def approval(self, number: int):
+        """
+        Get approving review state and submission time of a PR
+        :param number: pull request number (int)
+        :return: tuple of review state and submission time (str)
+        """
+        now = time.time()
+        approve_at = self.approve_at.get(number)
+        if approve_at is None:
+            approved = self.approved
+            submitted = None
+        elif now >= approve_at:
+            approved, submitted = True, approve_at
+        else:
+            # discussion goes on until the PR gets approved
+            approved = False
+            submitted = self.started + (now - self.started) // \
+                self.activity * self.activity if self.activity else None
+        submitted_at = time.strftime("%Y-%m-%dT%H:%M:%SZ",
+                                     time.gmtime(submitted)) \
+            if submitted else "2022-01-01T00:00:00Z"
+        return "APPROVED" if approved else "COMMENTED", submitted_at
+
+    def rate_headers(self, resource: str):
+        """
+        Build rate limit headers of the resource
+        :param resource: rate limit resource, e.g. core (str)
+        :return: response headers (dict)
+        """
+        used, reset = self.usage(resource)
+        return {"X-RateLimit-Limit": str(self.limit),
+                "X-RateLimit-Remaining": str(max(self.limit - used, 0)),
+                "X-RateLimit-Used": str(used),
+                "X-RateLimit-Reset": str(int(reset) + 1),
+                "X-RateLimit-Resource": resource}
+
+    def rate_limited(self, resource: str):
+        """
+        Take a request from the resource budget
+        :param resource: rate limit resource, e.g. core (str)
+        :return: aiohttp response once the budget is spent, otherwise None
+        """
+        if not self.throttle(resource):
+            return None
+        return web.json_response(
+            {"message": "API rate limit exceeded"}, status=403,
+            headers=self.rate_headers(resource))
+
+    async def rate_limit(self, request: web.Request):
+        """
+        Serve GET /rate_limit
+        :param request: aiohttp request
+        :return: aiohttp json response
+        """
+        self.count("rate_limit")
+        await self.delay()
+        headers = self.rate_headers("core")
+        core = {key: int(headers[f"X-RateLimit-{key.title()}"])
+                for key in ("limit", "used", "remaining", "reset")}
+        return web.json_response({"resources": {"core": core}})
+
+    async def reviews(self, request: web.Request):
+        """
+        Serve GET /repos/{owner}/{repo}/pulls/{number}/reviews
+        :param request: aiohttp request
+        :return: aiohttp json response
+        """
+        self.count("pulls.list_reviews")
+        await self.delay()
+        if int(request.match_info["number"]) in self.missing:
+            return web.json_response({"message": "Not Found"}, status=404,
+                                     headers=self.rate_headers("core"))
+        state, submitted_at = self.approval(int(request.match_info["number"]))
+        per_page = int(request.query.get("per_page", 30))
+        page = int(request.query.get("page", 1))
+        reviews = [{"id": index + 1,
+                    "user": {"login": "commenter" if index else "reviewer"},
+                    "state": "COMMENTED" if index else state,
+                    "submitted_at": submitted_at}
+                   for index in range((page - 1) * per_page,
+                                      min(page * per_page,
+                                          self.review_count))]
+        etag = f'"{request.match_info["number"]}-{state}-{page}"'
+        if request.headers.get("If-None-Match") == etag:
+            # 304 responses do not count against the rate limit
+            self.count("not_modified")
+            return web.Response(status=304,
+                                headers=self.rate_headers("core"))
+        throttled = self.rate_limited("core")
+        if throttled:
+            return throttled
+        headers = self.rate_headers("core")
+        headers["ETag"] = etag
+        if page * per_page < self.review_count:
+            next_url = request.url.update_query(per_page=per_page,
+                                                page=page + 1)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return web.json_response(reviews, headers=headers)
+
+    async def pull(self, request: web.Request):
+        """
+        Serve GET /repos/{owner}/{repo}/pulls/{number}
+        :param request: aiohttp request
+        :return: aiohttp json response
+        """
+        self.count("pulls.get")
+        await self.delay()
+        throttled = self.rate_limited("core")
+        if throttled:
+            return throttled
+        number = int(request.match_info["number"])
+        if number in self.missing:
+            return web.json_response({"message": "Not Found"}, status=404,
+                                     headers=self.rate_headers("core"))
+        return web.json_response(
+            {"number": number,
+             "state": "closed" if self.merged else "open",
+             "merged": self.merged,
+             "head": {"sha": f"{number:040x}"}},
+            headers=self.rate_headers("core"))
+
+    async def graphql(self, request: web.Request):
+        """
+        Serve POST /graphql for aliased pull request queries,
+        resolving every aliased pull request from query variables
+        :param request: aiohttp request
+        :return: aiohttp json response
+        """
+        self.count("graphql")
+        await self.delay()
+        throttled = self.rate_limited("graphql")
+        if throttled:
+            return throttled
+        body = await request.json()
+        variables = body.get("variables", {})
+        data, errors = {}, []
+        index = 0
+        while f"n{index}" in variables:
+            number = variables[f"n{index}"]
+            if number in self.missing:
+                # partial result, see https://spec.graphql.org/October2021/#sec-Errors
+                data[f"pr{index}"] = {"pullRequest": None}
+                errors.append({
+                    "type": "NOT_FOUND",
+                    "path": [f"pr{index}", "pullRequest"],
+                    "message": f"Could not resolve to a PullRequest "
+                               f"with the number of {number}."})
+                index += 1
+                continue
+            state, submitted_at = self.approval(number)
+            # the reviewer comments after approving
+            reviews = [{"state": state,
+                        "submittedAt": submitted_at,
+                        "author": {"login": "reviewer"}},
+                       {"state": "COMMENTED",
+                        "submittedAt": submitted_at,
+                        "author": {"login": "reviewer"}}]
+            pull = {"state": "MERGED" if self.merged else "OPEN",
+                    "merged": self.merged,
+                    "reviewDecision": self.decisions.get(number),
+                    "headRefOid": f"{number:040x}"}
+            # latest review of every reviewer, and latest
+            # approval or change request of every reviewer
+            if "latestReviews" in body["query"]:
+                pull["latestReviews"] = {"nodes": reviews[-1:]}
+            if "latestOpinionatedReviews" in body["query"]:
+                pull["latestOpinionatedReviews"] = {"nodes": [
+                    review for review in reviews[:1]
+                    if review["state"] != "COMMENTED"]}
+            data[f"pr{index}"] = {"pullRequest": pull}
+            index += 1
+        result = {"data": data}
+        if errors:
+            result["errors"] = errors
+        return web.json_response(result,
+                                 headers=self.rate_headers("graphql"))
+
+
+class LatencyProxy:
+    """ TCP proxy delaying every chunk by half a round trip in both
+    directions, so connection and TLS handshakes pay network latency """
+
+    def __init__(self, target_url: str, rtt: float):
+        """
+        Instantiate class instance
+        :param target_url: url of the proxied local server (str)
+        :param rtt:        simulated round trip time in seconds (float)
+        """
+        parts = urlsplit(target_url)
+        self.scheme = parts.scheme
+        self.target = (parts.hostname, parts.port)
+        self.rtt = rtt
+        self.server = None
+        self.connections = 0
+
+    async def pipe(self, reader: asyncio.StreamReader,
+                   writer: asyncio.StreamWriter):
+        """
+        Forward a stream, each chunk after half a round trip
+        :param reader: source stream
+        :param writer: destination stream
+        :return: None
+        """
+        chunks = asyncio.Queue()
+
+        async def send():
+            while True:
+                due, data = await chunks.get()
+                await asyncio.sleep(max(due - time.monotonic(), 0))
+                if not data:
+                    writer.close()
+                    return
+                writer.write(data)
+                await writer.drain()
+
+        sender = asyncio.create_task(send())
+        try:
+            while True:
+                data = await reader.read(65536)
+                await chunks.put((time.monotonic() + self.rtt / 2, data))
+                if not data:
+                    break
+            await sender
+        except (ConnectionError, asyncio.CancelledError):
+            sender.cancel()
+            writer.close()
+
+    async def handle(self, client_reader: asyncio.StreamReader,
+                     client_writer: asyncio.StreamWriter):
+        """
+        Connect a client to the target server
+        :param client_reader: client stream
+        :param client_writer: client stream
+        :return: None
+        """
+        self.connections += 1
+        server_reader, server_writer = \
+            await asyncio.open_connection(*self.target)
+        try:
+            await asyncio.gather(self.pipe(client_reader, server_writer),
+                                 self.pipe(server_reader, client_writer))
+        except asyncio.CancelledError:
+            # proxy stopped with connections still open
+            client_writer.close()
+            server_writer.close()
+
+    async def start(self):
+        """
+        Start proxy on a random local port
+        :return: proxy base url (str)
+        """
+        self.server = await asyncio.start_server(self.handle,
+                                                 "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"{self.scheme}://127.0.0.1:{port}"
+
+    async def stop(self):
+        """
+        Stop proxy
+        :return: None
+        """
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
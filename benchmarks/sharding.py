@@ -0,0 +1,141 @@
+"""
+Replicas sharing a channel through file leases: every replica runs a
+cycle over the pull requests awaiting approval, then one replica dies
+without releasing its lease, the others rebalance once it expires and
+react to all messages after the pull requests get approved. Reports
+API calls per replica and cycle time against a single replica, plus
+messages reacted and duplicate reaction attempts after the failover:
+
+    python -m benchmarks.sharding --replicas 1 2 4
+    python -m benchmarks.sharding --messages 1000 --latency 0.05
+"""
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+
+from benchmarks.servers import FakeGitHubServer, FakeSlackServer
+from clients import GitHubClient, SlackClient
+from helpers import (Context, FileLeases, Metrics, PullRequestCache,
+                     Scheduler, Sharding, TierLimiter)
+import main
+
+
+def api_requests(context: Context):
+    """
+    Sum API requests sent by a replica
+    :param context: instance of Context cls
+    :return: number of requests (int)
+    """
+    return sum(context.metrics.values.get("api_requests_total", {}).values())
+
+
+async def run_cycle(contexts: list):
+    """
+    Run a cycle on every replica concurrently
+    :param contexts: list of Context
+    :return: cycle time in seconds (float)
+    """
+    started = time.perf_counter()
+    await asyncio.gather(*(main.scan_channels(context)
+                           for context in contexts))
+    return time.perf_counter() - started
+
+
+async def run_replicas(args: argparse.Namespace, replicas: int):
+    """
+    Run replicas against fresh stand-ins, then fail one over
+    :param args:     benchmark arguments
+    :param replicas: number of replicas (int)
+    :return: stats (dict)
+    """
+    slack_server = FakeSlackServer(args.messages, args.replies,
+                                   args.messages, latency=args.latency)
+    github_server = FakeGitHubServer(latency=args.latency, approved=False)
+    slack_url = await slack_server.start()
+    github_url = await github_server.start()
+    lease_dir = tempfile.TemporaryDirectory()
+
+    # stand-in timestamps are decades old, keep them in the window
+    cycle_args = argparse.Namespace(time_window=60 * 24 * 365 * 100,
+                                    reaction_name="white_check_mark",
+                                    sleep_period=0)
+    limiter = TierLimiter(rates={tier: 10 ** 9 for tier in range(1, 5)})
+    contexts = []
+    for replica in range(replicas):
+        metrics = Metrics()
+        slack_client = SlackClient("xoxb-bench", base_url=f"{slack_url}/api/",
+                                   limiter=limiter, metrics=metrics)
+        github_client = GitHubClient("ghp-bench", base_url=github_url,
+                                     metrics=metrics)
+        sharding = Sharding(FileLeases(lease_dir.name),
+                            f"replica-{replica}", args.lease_ttl)
+        contexts.append(Context(cycle_args, {"C0BENCH": slack_client},
+                                github_client,
+                                Scheduler({"slack": 4, "github": 8}),
+                                PullRequestCache(0), metrics=metrics,
+                                sharding=sharding))
+
+    try:
+        # every replica sees the others before the first cycle
+        for _ in range(2):
+            for context in contexts:
+                context.sharding.refresh()
+        duration = await run_cycle(contexts)
+        calls = [api_requests(context) for context in contexts]
+
+        # the first replica dies, its lease expires
+        survivors = contexts[1:] if replicas > 1 else contexts
+        await asyncio.sleep(args.lease_ttl if replicas > 1 else 0)
+        # leases are renewed every third of their duration
+        for _ in range(2):
+            for context in survivors:
+                context.sharding.refresh()
+        github_server.approved = True
+        await run_cycle(survivors)
+    finally:
+        for context in contexts:
+            await context.github_client.close()
+        await slack_server.stop()
+        await github_server.stop()
+        lease_dir.cleanup()
+
+    return {"duration": duration, "calls": calls,
+            "reacted": len(slack_server.reactions),
+            "duplicates": slack_server.calls.get("reactions.add", 0) -
+            len(slack_server.reactions)}
+
+
+async def run(args: argparse.Namespace):
+    """
+    Run benchmark for each number of replicas
+    :param args: benchmark arguments
+    :return: None
+    """
+    messages = args.messages * (args.replies + 1)
+    print(f"{'replicas':>8} {'cycle (s)':>10} {'calls/replica':>14} "
+          f"{'calls total':>12} {'reacted':>12} {'duplicates':>11}")
+    for replicas in args.replicas:
+        stats = await run_replicas(args, replicas)
+        print(f"{replicas:>8} {stats['duration']:>10.3f} "
+              f"{max(stats['calls']):>14} {sum(stats['calls']):>12} "
+              f"{stats['reacted']:>5}/{messages:<6} "
+              f"{stats['duplicates']:>11}")
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replicas", type=int, nargs="+",
+                        default=[1, 2, 4])
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--replies", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.02)
+    # seconds until the lease of the dead replica expires
+    parser.add_argument("--lease_ttl", type=float, default=2)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(get_arguments()))
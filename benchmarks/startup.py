@@ -0,0 +1,107 @@
+"""
+Cold start of one-shot runs: import time of main, and time from
+spawning a fresh interpreter to its first GitHub request reaching a
+local stand-in. Lazily imported clients are compared against importing
+all of them up front, as main did before:
+
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from benchmarks.load import percentile
+from benchmarks.servers import FakeGitHubServer
+
+# modules only needed by servers and event mode
+EAGER = "import clients.events, clients.metrics, clients.webhook"
+
+IMPORT_TIME = """
+import time
+started = time.perf_counter()
+import main
+{eager}
+print(time.perf_counter() - started)
+"""
+
+FIRST_REQUEST = """
+import asyncio
+import main
+{eager}
+
+async def first_request():
+    transport = main.HTTPTransport()
+    client = main.GitHubClient("ghp-bench", base_url="{url}",
+                               transport=transport)
+    try:
+        await client.get_rate_core_data()
+    finally:
+        await transport.close()
+
+asyncio.run(first_request())
+"""
+
+
+async def spawn(code: str):
+    """
+    Run code in a fresh interpreter from the repository root
+    :param code: python source (str)
+    :return: process output (str)
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", code, cwd=root,
+        stdout=asyncio.subprocess.PIPE)
+    output, _ = await process.communicate()
+    if process.returncode:
+        raise RuntimeError(f"benchmark process failed: {process.returncode}")
+    return output.decode()
+
+
+async def first_request(eager: str):
+    """
+    Time a fresh interpreter until its first request arrives
+    :param eager: extra imports (str)
+    :return: seconds (float)
+    """
+    server = FakeGitHubServer()
+    url = await server.start()
+    try:
+        started = time.perf_counter()
+        await spawn(FIRST_REQUEST.format(eager=eager, url=url))
+        return server.first_call - started
+    finally:
+        await server.stop()
+
+
+async def run(args: argparse.Namespace):
+    """
+    Run benchmark for lazy and eager imports
+    :param args: benchmark arguments
+    :return: None
+    """
+    print(f"{'imports':>7} {'import p50 (ms)':>16} "
+          f"{'first request p50 (ms)':>23} {'max (ms)':>9}")
+    for name, eager in (("eager", EAGER), ("lazy", "")):
+        imports, requests = [], []
+        for _ in range(args.runs):
+            imports.append(float(await spawn(
+                IMPORT_TIME.format(eager=eager))))
+            requests.append(await first_request(eager))
+        print(f"{name:>7} {percentile(imports, 0.5) * 1000:>16.0f} "
+              f"{percentile(requests, 0.5) * 1000:>23.0f} "
+              f"{max(requests) * 1000:>9.0f}")
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(get_arguments()))
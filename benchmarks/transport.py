@@ -0,0 +1,133 @@
+"""
+Per-call latency of GitHub calls over TLS against a local stub behind
+a proxy simulating network round trips: a new connection per call,
+paying TCP and TLS handshakes every time, against the pooled keep-alive
+transport. Generates a self-signed certificate, requires openssl:
+
+    python -m benchmarks.transport --calls 200 --rtt 0.02
+    python -m benchmarks.transport --rtt 0.05 --concurrency 1 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import ssl
+import subprocess
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.load import percentile
+from benchmarks.servers import FakeGitHubServer, LatencyProxy
+from clients import GitHubClient, HTTPTransport
+
+
+class PerCallTransport(HTTPTransport):
+    """ Transport closing every connection after its call """
+
+    def connector(self):
+        """
+        Build connection pool without keep-alive
+        :return: aiohttp.TCPConnector object
+        """
+        return aiohttp.TCPConnector(limit=self.pool_size, force_close=True,
+                                    ssl=self.ssl_context)
+
+
+def make_certificate(path: str):
+    """
+    Generate a self-signed certificate of 127.0.0.1
+    :param path: output directory (str)
+    :return: tuple of certificate and key file paths (str)
+    """
+    cert = os.path.join(path, "cert.pem")
+    key = os.path.join(path, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048",
+                    "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+                    "-addext", "subjectAltName=IP:127.0.0.1",
+                    "-keyout", key, "-out", cert],
+                   check=True, capture_output=True)
+    return cert, key
+
+
+async def run_calls(args: argparse.Namespace, url: str,
+                    transport: HTTPTransport, concurrency: int):
+    """
+    Send review calls through a transport, timing each of them
+    :param args:        benchmark arguments
+    :param url:         stub base url (str)
+    :param transport:   instance of HTTPTransport cls
+    :param concurrency: calls in flight (int)
+    :return: call latencies in seconds (list of float)
+    """
+    client = GitHubClient("ghp-bench", base_url=url, transport=transport)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def call(number: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await client.get_pr_reviews_page("acme", "repo", number)
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        await asyncio.gather(*(call(number % 50 + 1)
+                               for number in range(args.calls)))
+    finally:
+        await transport.close()
+    return latencies
+
+
+async def run(args: argparse.Namespace):
+    """
+    Run benchmark for both transports and every concurrency level
+    :param args: benchmark arguments
+    :return: None
+    """
+    cert_dir = tempfile.TemporaryDirectory()
+    cert, key = make_certificate(cert_dir.name)
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert, key)
+    client_context = ssl.create_default_context(cafile=cert)
+
+    server = FakeGitHubServer(latency=args.latency)
+    proxy = LatencyProxy(await server.start(server_context), args.rtt)
+    url = await proxy.start()
+    print(f"{'transport':>9} {'concurrency':>11} {'mean (ms)':>10} "
+          f"{'p50 (ms)':>9} {'p99 (ms)':>9} {'connections':>12}")
+    try:
+        for concurrency in args.concurrency:
+            for name, transport_cls in (("per call", PerCallTransport),
+                                        ("pooled", HTTPTransport)):
+                transport = transport_cls(ssl_context=client_context)
+                latencies = await run_calls(args, url, transport,
+                                            concurrency)
+                connections = sum(stats["created"] for stats
+                                  in transport.stats().values())
+                print(f"{name:>9} {concurrency:>11} "
+                      f"{sum(latencies) / len(latencies) * 1000:>10.1f} "
+                      f"{percentile(latencies, 0.5) * 1000:>9.1f} "
+                      f"{percentile(latencies, 0.99) * 1000:>9.1f} "
+                      f"{connections:>12}")
+    finally:
+        await proxy.stop()
+        await server.stop()
+        cert_dir.cleanup()
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 8])
+    # simulated network round trip time in seconds
+    parser.add_argument("--rtt", type=float, default=0.02)
+    # server processing time in seconds
+    parser.add_argument("--latency", type=float, default=0.0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(get_arguments()))
@@ -1,2 +1,24 @@
+import importlib
+
 from .git import GitHubClient
 from .slack import SlackClient
+from .transport import HTTPTransport, RecordingTransport, ReplayTransport
+
+# servers and the Socket Mode listener are only used in some modes,
+# they are imported on first use to keep the start up fast
+LAZY_CLIENTS = {"LocalEventSource": "events",
+                "SlackEventListener": "events",
+                "MetricsServer": "metrics",
+                "GitHubWebhookReceiver": "webhook"}
+
+
+def __getattr__(name: str):
+    """
+    Import optional clients on first use, see PEP 562
+    :param name: client class name (str)
+    :return: client class
+    """
+    if name not in LAZY_CLIENTS:
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+    module = importlib.import_module(f".{LAZY_CLIENTS[name]}", __name__)
+    return getattr(module, name)
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+
+from slack_sdk.socket_mode.aiohttp import SocketModeClient
+from slack_sdk.socket_mode.response import SocketModeResponse
+
+
+class LocalEventSource:
+    """ In-process Slack event source, e.g. for local runs and tests """
+
+    def __init__(self, queue: asyncio.Queue = None):
+        """
+        Instantiate class instance. Has to be created
+        from within a running event loop
+        :param queue: event queue shared with other sources
+        """
+        self.queue = queue if queue is not None else asyncio.Queue()
+
+    async def start(self):
+        """
+        Start receiving events
+        :return: None
+        """
+        logging.info("using local event source")
+
+    def put(self, event: dict):
+        """
+        Publish a Slack event
+        :param event: Slack event, e.g. message or reaction_added (dict)
+        :return: None
+        """
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        """
+        Wait for the next Slack event
+        :return: Slack event (dict)
+        """
+        return await self.queue.get()
+
+    async def close(self):
+        """
+        Stop receiving events
+        :return: None
+        """
+
+
+class SlackEventListener(LocalEventSource):
+    """ Slack Events API listener over Socket Mode """
+
+    def __init__(self, app_token: str, slack_client,
+                 queue: asyncio.Queue = None):
+        """
+        Instantiate class instance. Has to be created
+        from within a running event loop
+        :param app_token:    app-level token with connections:write (str)
+        :param slack_client: clients.slack.SlackClient (cls)
+        :param queue:        event queue shared with other sources
+        """
+        super().__init__(queue)
+        self.client = SocketModeClient(app_token,
+                                       web_client=slack_client.client)
+        self.client.socket_mode_request_listeners.append(self.on_request)
+
+    async def start(self):
+        """
+        Connect to Slack over Socket Mode
+        see https://api.slack.com/apis/connections/socket
+        :return: None
+        """
+        logging.info("connecting to slack socket mode")
+        await self.client.connect()
+
+    async def on_request(self, client: SocketModeClient, request):
+        """
+        Acknowledge Socket Mode request and queue its event
+        :param client:  socket mode client
+        :param request: socket mode request
+        :return: None
+        """
+        response = SocketModeResponse(envelope_id=request.envelope_id)
+        await client.send_socket_mode_response(response)
+        if request.type == "events_api":
+            event = request.payload.get("event", {})
+            logging.debug(f"received event: {event}")
+            self.put(event)
+
+    async def close(self):
+        """
+        Disconnect from Slack
+        :return: None
+        """
+        await self.client.close()
@@ -1,44 +1,180 @@
 from datetime import datetime
+import asyncio
 import logging
-import sys
 
-from ghapi.all import GhApi, pages
+import aiohttp
+
+import helpers
 import utils
+from .transport import HTTPTransport
 
 
 class GitHubClient:
     """ GitHub client class """
 
-    def __init__(self, api_token: str, debug: bool = False):
+    API_URL = "https://api.github.com"
+    RETRY_STATUSES = {500, 502, 503, 504}
+
+    def __init__(self, api_token: str, debug: bool = False,
+                 base_url: str = API_URL, etag_store=None,
+                 retries: int = 5, metrics: helpers.Metrics = None,
+                 transport: HTTPTransport = None):
         """
         Instantiate class instance
-        :param api_token: api token (str)
-        :param debug:     debug mode (bool)
+        :param api_token:  api token (str)
+        :param debug:      debug mode (bool)
+        :param base_url:   GitHub REST API url (str)
+        :param etag_store: helpers.etag.ETagStore (cls), enables
+                           conditional GET requests if set
+        :param retries:    max retries of transient errors (int)
+        :param metrics:    metrics registry shared by clients
+        :param transport:  HTTPTransport (cls) shared by clients,
+                           a private one is used if not set
         """
         self.token = api_token
-        self.client = self.init_client()
-        if debug:
-            self.client.debug = utils.GitClient.debug_request
+        self.debug = debug
+        self.base_url = base_url.rstrip("/")
+        self.headers = {
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"token {self.token}"
+        }
+        self.rate_tracker = helpers.RateLimitTracker()
+        self.etag_store = etag_store
+        self.retries = retries
+        self.metrics = metrics if metrics else helpers.Metrics()
+        # a shared transport is closed by its owner
+        self.own_transport = transport is None
+        self.transport = transport if transport else \
+            HTTPTransport(metrics=self.metrics)
 
-    def init_client(self):
+    async def close(self):
         """
-        Set up GitHub API client
-        :return: ghapi.core.GhApi object
+        Close underlying client session, unless the transport is shared
+        :return: None
         """
-        logging.info("initialising github client")
-        try:
-            return GhApi(token=self.token)
-        except Exception as err:
-            logging.fatal(err)
-            sys.exit(1)
+        if self.own_transport:
+            await self.transport.close()
+
+    async def request(self, path: str, params: dict = None,
+                      url: str = None, method: str = "GET",
+                      json: dict = None, endpoint: str = None):
+        """
+        Send request to GitHub API, retrying transient server and
+        connection errors with jittered exponential backoff. Waits
+        do not block the event loop
+        :param path:     api path, e.g. /rate_limit (str)
+        :param params:   query parameters (dict)
+        :param url:      absolute url, overrides path (str)
+        :param method:   http method (str)
+        :param json:     json request body (dict)
+        :param endpoint: endpoint name for metrics, defaults to path (str)
+        :return: tuple of response data and next page url
+        """
+        url = url if url else f"{self.base_url}{path}"
+        endpoint = endpoint if endpoint else path
+        attempt = 0
+        while True:
+            self.metrics.inc("api_requests_total", service="github",
+                             method=endpoint)
+            try:
+                return await self.send(url, params, method, json)
+            except aiohttp.ClientResponseError as err:
+                self.metrics.inc("api_errors_total", service="github",
+                                 method=endpoint, error=err.status)
+                retry_after = (err.headers or {}).get("Retry-After")
+                if retry_after and err.status in (403, 429):
+                    # secondary rate limit, see https://docs.github.com/en/rest/overview/resources-in-the-rest-api#secondary-rate-limits
+                    delay = float(retry_after)
+                elif err.status in self.RETRY_STATUSES:
+                    delay = helpers.backoff_delay(attempt)
+                else:
+                    if method != "GET" or \
+                            not utils.GitClient.is_inaccessible(err):
+                        self.metrics.inc("api_failures_total",
+                                         service="github", method=endpoint)
+                    raise
+                error, reason = err, err.status
+            except (aiohttp.ClientConnectionError,
+                    asyncio.TimeoutError) as err:
+                self.metrics.inc("api_errors_total", service="github",
+                                 method=endpoint,
+                                 error=type(err).__name__)
+                delay = helpers.backoff_delay(attempt)
+                error, reason = err, type(err).__name__
+            if attempt >= self.retries:
+                self.metrics.inc("api_failures_total", service="github",
+                                 method=endpoint)
+                # the except block cleared the exception
+                raise error
+            attempt += 1
+            logging.warning(f"{method} {url} failed with {reason}, "
+                            f"retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def send(self, url: str, params: dict = None,
+                   method: str = "GET", json: dict = None,
+                   conditional: bool = True):
+        """
+        Send a single request to GitHub API. GET requests are conditional
+        if an ETag store is set: 304 Not Modified responses do not
+        count against the rate limit and reuse the stored response
+        :param url:         absolute url (str)
+        :param params:      query parameters (dict)
+        :param method:      http method (str)
+        :param json:        json request body (dict)
+        :param conditional: send the stored ETag if any (bool)
+        :return: tuple of response data and next page url
+        """
+        if self.debug:
+            utils.GitClient.debug_request({"method": method,
+                                           "url": url,
+                                           "params": params,
+                                           "json": json})
+
+        headers, key = dict(self.headers), None
+        if self.etag_store is not None and method == "GET":
+            key = self.etag_store.key(url, params)
+            etag = self.etag_store.etag(key) if conditional else None
+            if etag:
+                headers["If-None-Match"] = etag
+
+        session = self.transport.session(url)
+        async with session.request(method, url, params=params, json=json,
+                                   headers=headers) as response:
+            self.rate_tracker.update(response.headers)
+            if response.status == 304:
+                stored = self.etag_store.get(key) if key else None
+                if stored is not None:
+                    logging.debug(f"not modified: {url}")
+                    return stored
+                if not conditional:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, (), status=304,
+                        message="Not Modified without an ETag",
+                        headers=response.headers)
+                # evicted by concurrent requests since its ETag was
+                # sent, or a 304 to a request without If-None-Match
+                logging.debug(f"no stored response of {url}, "
+                              f"requesting it again")
+                return await self.send(url, params, method, json,
+                                       conditional=False)
 
-    def get_rate_core_data(self):
+            response.raise_for_status()
+            data = await response.json()
+            next_page = response.links.get("next", {}).get("url")
+            next_page = str(next_page) if next_page else None
+            if key:
+                self.etag_store.put(key, response.headers.get("ETag"),
+                                    data, next_page)
+            return data, next_page
+
+    async def get_rate_core_data(self):
         """
-        Get API rate limit details
-        see https://docs.github.com/en/rest/rate-limit
+        Get API rate limit details. Does not count against
+        the rate limit, see https://docs.github.com/en/rest/rate-limit
         :return: api core data (dict):
         """
-        rate = self.client.rate_limit.get()
+        rate, _ = await self.request("/rate_limit", endpoint="rate_limit")
         data = rate["resources"]["core"]
 
         keys = ["used", "remaining", "limit", "reset"]
@@ -49,36 +185,79 @@ class GitHubClient:
         core.update({'reset': reset_time})
         return core
 
-    @utils.GitClient.api_rate_control
-    def get_pr_reviews(self, repo_owner: str,
-                       repo_name: str, pull_number: int):
+    @utils.GitClient.api_rate_control("core")
+    async def get_pr(self, repo_owner: str, repo_name: str,
+                     pull_number: int):
+        """
+        Get a single pull request
+        see https://docs.github.com/en/rest/pulls/pulls#get-a-pull-request
+        :param repo_owner:  owner of the repo (str)
+        :param repo_name:   repository name (str)
+        :param pull_number: pull request number (int)
+        :return: pull request (dict), empty on errors
+        """
+        path = f"/repos/{repo_owner}/{repo_name}/pulls/{pull_number}"
+        try:
+            pull, _ = await self.request(path, endpoint="pulls.get")
+            return pull
+        except aiohttp.ClientResponseError as err:
+            if utils.GitClient.is_inaccessible(err):
+                logging.warning(f"pull request {repo_owner}/{repo_name}"
+                                f"#{pull_number} is not accessible: "
+                                f"{err.status}")
+            else:
+                logging.error(f"error fetching pull request: {err}")
+            return {}
+        except Exception as err:
+            logging.error(f"error fetching pull request: {err}")
+            return {}
+
+    @utils.GitClient.api_rate_control("core")
+    async def get_pr_reviews_page(self, repo_owner: str, repo_name: str,
+                                  pull_number: int, url: str = None):
         """
-        Get pull request reviews for a single PR
+        Get a single page of pull request reviews, oldest first
         see https://docs.github.com/en/rest/pulls/reviews#list-reviews-for-a-pull-request
-        :param repo_owner: owner of the repo (str)
-        :param repo_name:  repository name (str)
+        :param repo_owner:  owner of the repo (str)
+        :param repo_name:   repository name (str)
         :param pull_number: pull request number (int)
-        :return: list of PR reviews (list of dicts)
+        :param url:         next page url, first page if not set (str)
+        :return: tuple of PR reviews (list of dicts) and next page url
         """
-        params = {
-            "pull_number": pull_number,
-            "owner": repo_owner,
-            "repo": repo_name,
-            "per_page": 100
-        }
+        path = f"/repos/{repo_owner}/{repo_name}/pulls/{pull_number}/reviews"
+        params = None if url else {"per_page": 100}
+        return await self.request(path, params, url=url,
+                                  endpoint="pulls.list_reviews")
+
+    @utils.GitClient.api_rate_control("graphql")
+    async def get_pr_states(self, keys: list):
+        """
+        Resolve state of many pull requests with a single aliased
+        GraphQL query, see https://docs.github.com/en/graphql
+        :param keys: list of (owner, repo, number) tuples
+        :return: pull request states (dict of key: state)
+        """
+        query, variables = utils.GitClient.pr_states_query(keys)
         try:
-            reviews = self.client.pulls.list_reviews(**params)
+            response, _ = await self.request("/graphql", method="POST",
+                                             json={"query": query,
+                                                   "variables": variables},
+                                             endpoint="graphql")
+        except Exception as err:
+            logging.error(f"error resolving pull requests: {err}")
+            return {}
 
-            # paginate if more results are available
-            if self.client.last_page() > 0:
-                reviews = pages(self.client.pulls.list_reviews,
-                                self.client.last_page(),
-                                **params)
+        for error in response.get("errors") or []:
+            logging.warning(f"graphql error: {error.get('message')}")
 
-            logging.info(f"found {len(reviews)} reviews")
-            logging.debug(f"reviews: {reviews}")
-            return reviews
+        data = response.get("data") or {}
+        states = {}
+        for index, key in enumerate(keys):
+            repository = data.get(f"pr{index}") or {}
+            pull = repository.get("pullRequest")
+            if pull:
+                states[key] = utils.GitClient.pr_state_from_graphql(pull)
 
-        except Exception as err:
-            logging.error(f"error fetching reviews: {err}")
-            return []
+        logging.info(f"resolved {len(states)} of {len(keys)} pull requests")
+        logging.debug(f"pull request states: {states}")
+        return states
@@ -0,0 +1,53 @@
+import logging
+
+from aiohttp import web
+
+
+class MetricsServer:
+    """ Prometheus scrape endpoint """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, metrics, host: str = "0.0.0.0", port: int = 9090,
+                 path: str = "/metrics"):
+        """
+        Instantiate class instance
+        :param metrics: helpers.metrics.Metrics (cls)
+        :param host:    listen address (str)
+        :param port:    listen port (int)
+        :param path:    metrics url path (str)
+        """
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_get(path, self.scrape)
+        self.runner = None
+
+    async def scrape(self, request: web.Request):
+        """
+        Render metrics
+        :param request: aiohttp request
+        :return: aiohttp response
+        """
+        return web.Response(body=self.metrics.render().encode(),
+                            headers={"Content-Type": self.CONTENT_TYPE})
+
+    async def start(self):
+        """
+        Start HTTP server
+        :return: None
+        """
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        logging.info(f"serving metrics on {self.host}:{self.port}")
+
+    async def close(self):
+        """
+        Stop HTTP server
+        :return: None
+        """
+        if self.runner:
+            await self.runner.cleanup()
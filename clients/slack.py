@@ -1,107 +1,184 @@
-from slack_sdk import WebClient
+from slack_sdk.web.async_client import AsyncWebClient
 from slack_sdk.errors import SlackApiError
 
 import logging
+
+from helpers import Metrics, TierLimiter
 import utils
+from .transport import HTTPTransport
 
 
 class SlackClient:
     """ Slack client class """
 
-    def __init__(self, api_token: str):
+    def __init__(self, api_token: str,
+                 base_url: str = AsyncWebClient.BASE_URL,
+                 workspace: str = "0", limiter: TierLimiter = None,
+                 metrics: Metrics = None, transport: HTTPTransport = None):
         """
         Instantiate class instance
         :param api_token: api token (str)
+        :param base_url:  Slack Web API url (str)
+        :param workspace: workspace name, rate limits are
+                          applied per workspace (str)
+        :param limiter:   rate limiter shared by Slack clients
+        :param metrics:   metrics registry shared by clients
+        :param transport: HTTPTransport (cls) shared by clients, has
+                          to be set from within a running event loop.
+                          Otherwise every call opens a new connection
+        """
+        logging.info(f'initialising slack client {workspace}')
+        session = transport.session(base_url) if transport else None
+        self.client = AsyncWebClient(api_token, base_url=base_url,
+                                     session=session)
+        self.workspace = workspace
+        self.limiter = limiter if limiter else TierLimiter()
+        self.metrics = metrics if metrics else Metrics()
+
+    def service(self, method: str):
+        """
+        Get scheduler service of Slack API method. Methods
+        share rate limits per workspace and tier
+        :param method: Slack API method, e.g. reactions.add (str)
+        :return: service name (str)
         """
-        logging.info('initialising slack client')
-        self.client = WebClient(api_token)
+        tier = utils.SlackClient.METHOD_TIERS.get(method, 3)
+        return f"slack:{self.workspace}:tier{tier}"
 
-    @utils.SlackClient.api_rate_control
-    def get_channel_history(self, channel: str, minutes: int,
-                            latest_ts: str = None):
+    def count_error(self, method: str, err: SlackApiError):
         """
-        Get channel messages. See
+        Count failed Slack API request
+        :param method: Slack API method, e.g. reactions.add (str)
+        :param err:    SlackApiError
+        :return: None
+        """
+        self.metrics.inc("api_errors_total", service="slack", method=method,
+                         error=err.response.get("error") or
+                         err.response.status_code)
+
+    @utils.SlackClient.api_rate_control("conversations.history",
+                                        default=lambda: {"messages": []})
+    async def get_channel_history(self, channel: str, minutes: int,
+                                  latest_ts: str = None,
+                                  cursor: str = None):
+        """
+        Get a page of channel messages. See
         https://api.slack.com/methods/conversations.history
         :param channel: slack channel id (str)
         :param minutes: look back window in mins (int)
         :param latest_ts: latest msg timestamp (str)
-        :return: list of Slack messages
+        :param cursor: next_cursor of the previous page (str)
+        :return: Slack API response
         """
         params = utils.SlackClient.set_conv_params(channel,
                                                    minutes,
-                                                   latest_ts)
+                                                   latest_ts,
+                                                   cursor)
         try:
-            history = self.client.conversations_history(**params)
+            history = await self.client.conversations_history(**params)
             return history
         except SlackApiError as err:
+            if utils.SlackClient.is_retryable(err):
+                raise
+            self.count_error("conversations.history", err)
             logging.info(f"error loading conv. history: {err}")
-            return []
+            return {"messages": []}
 
-    def get_channel_messages(self, channel: str, minutes: int):
+    async def iter_channel_messages(self, channel: str, minutes: int,
+                                    run=None):
         """
-        Wrapper around SlackClient.get_channel_history
-        to provide easier pagination by time
+        Stream channel messages page by page, following
+        response_metadata.next_cursor, see
+        https://api.slack.com/docs/pagination
         :param channel: slack channel id (str)
         :param minutes: look back window in mins (int)
-        :return: list of messages/events
+        :param run:     coroutine runner, e.g. a scheduler
+                        service, awaited directly if not set
+        :return: async generator of message pages (list of dict)
         """
-        history = self.get_channel_history(channel, minutes)
-        messages = history["messages"]
-
-        while history.get("has_more"):
-            last_ts = history["messages]"][-1]["ts"]
-            history = self.get_channel_history(channel, minutes,
-                                               last_ts)
-            messages.extend(history["messages"])
+        latest_ts = utils.SlackClient.set_latest_ts()
+        total, cursor = 0, None
+        while True:
+            call = self.get_channel_history(channel, minutes,
+                                            latest_ts, cursor)
+            history = await (run(call) if run else call)
+            total += len(history["messages"])
+            yield history["messages"]
 
-        logging.info(f"fetched {len(messages)} messages")
-        return messages
+            cursor = utils.SlackClient.next_cursor(history)
+            if not cursor:
+                break
+        logging.info(f"fetched {total} messages")
 
-    @utils.SlackClient.api_rate_control
-    def get_message_history(self, channel: str, minutes: int, ts: str,
-                            latest_ts: str = None):
+    @utils.SlackClient.api_rate_control("conversations.replies",
+                                        default=lambda: {"messages": []})
+    async def get_message_history(self, channel: str, minutes: int, ts: str,
+                                  latest_ts: str = None,
+                                  cursor: str = None):
         """
-        Get message threads / replies. See
+        Get a page of message threads / replies. See
         https://api.slack.com/methods/conversations.replies
         :param channel: slack channel id (str)
         :param minutes: look back window in mins (int)
         :param ts: timestamp of slack message
         :param latest_ts: latest msg timestamp (str)
-        :return: list of message replies
+        :param cursor: next_cursor of the previous page (str)
+        :return: Slack API response
         """
-        params = utils.SlackClient.set_conv_params(channel, minutes, latest_ts)
+        params = utils.SlackClient.set_conv_params(channel, minutes,
+                                                   latest_ts, cursor)
         params["ts"] = ts
         try:
-            threads = self.client.conversations_replies(**params)
+            threads = await self.client.conversations_replies(**params)
             return threads
         except SlackApiError as err:
+            if utils.SlackClient.is_retryable(err):
+                raise
+            self.count_error("conversations.replies", err)
             logging.info(f"error loading message replies: {err}")
-            return []
+            return {"messages": []}
 
-    def get_message_replies(self, channel: str, minutes: int, ts: str):
+    async def iter_message_replies(self, channel: str, minutes: int,
+                                   ts: str):
         """
-        Wrapper around SlackClient.get_message_history
-        to provide easier pagination by time
+        Stream message thread page by page, following
+        response_metadata.next_cursor. The first page
+        starts with the parent message
         :param channel: slack channel id (str)
         :param minutes: look back window in mins (int)
         :param ts: slack message ts
-        :return: list of message threads/replies
+        :return: async generator of reply pages (list of dict)
         """
-        history = self.get_message_history(channel, minutes, ts)
-        replies = history["messages"]
+        latest_ts = utils.SlackClient.set_latest_ts()
+        cursor = None
+        while True:
+            history = await self.get_message_history(channel, minutes, ts,
+                                                     latest_ts, cursor)
+            yield history["messages"]
+
+            cursor = utils.SlackClient.next_cursor(history)
+            if not cursor:
+                break
 
-        while history.get("has_more"):
-            last_ts = history["messages]"][-1]["ts"]
-            history = self.get_message_history(channel, minutes,
-                                               ts, last_ts)
-            replies.extend(history["messages"])
+    async def get_message_replies(self, channel: str, minutes: int, ts: str):
+        """
+        Collect all pages of a message thread, a thread
+        is evaluated as a whole
+        :param channel: slack channel id (str)
+        :param minutes: look back window in mins (int)
+        :param ts: slack message ts
+        :return: list of message threads/replies
+        """
+        replies = []
+        async for page in self.iter_message_replies(channel, minutes, ts):
+            replies.extend(page)
 
         logging.info(f"fetched {len(replies)} replies for message {ts}")
         return replies
 
-    @utils.SlackClient.api_rate_control
-    def add_message_reaction(self, channel: str, reaction: str,
-                             timestamp: str):
+    @utils.SlackClient.api_rate_control("reactions.add", default=bool)
+    async def add_message_reaction(self, channel: str, reaction: str,
+                                   timestamp: str):
         """
         Add reaction to array of reactions
         see https://api.slack.com/events/message#stars__pins__and_reactions
@@ -112,10 +189,17 @@ class SlackClient:
         """
         try:
             logging.info(f"adding reaction '{reaction}' to message")
-            self.client.reactions_add(channel=channel,
-                                      name=reaction,
-                                      timestamp=timestamp)
+            await self.client.reactions_add(channel=channel,
+                                            name=reaction,
+                                            timestamp=timestamp)
             return True
         except SlackApiError as err:
+            if utils.SlackClient.is_retryable(err):
+                raise
+            if err.response.get("error") == "already_reacted":
+                logging.info(f"message {timestamp} already has "
+                             f"reaction '{reaction}'")
+                return True
+            self.count_error("reactions.add", err)
             logging.info(f"error reacting to message: {err}")
             return False
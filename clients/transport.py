@@ -0,0 +1,367 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from helpers import Metrics
+
+
+class HTTPTransport:
+    """ Pooled keep-alive HTTP sessions, one per host, shared by
+    API clients. Connections are reused across calls instead of
+    a TCP and TLS handshake per call """
+
+    def __init__(self, pool_size: int = 100, connect_timeout: float = 10,
+                 timeout: float = 30, keepalive: float = 60,
+                 ssl_context=None, metrics: Metrics = None):
+        """
+        Instantiate class instance
+        :param pool_size:       max open connections per host (int)
+        :param connect_timeout: seconds to open a connection (float)
+        :param timeout:         seconds per request in total (float)
+        :param keepalive:       seconds idle connections are kept (float)
+        :param ssl_context:     ssl.SSLContext, e.g. trusting a custom
+                                CA, default verification if not set
+        :param metrics:         metrics registry shared by clients
+        """
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout,
+                                             connect=connect_timeout)
+        self.keepalive = keepalive
+        self.ssl_context = ssl_context
+        self.metrics = metrics if metrics else Metrics()
+        # "scheme://host:port" -> aiohttp.ClientSession
+        self.sessions = {}
+        # "host:port" -> {"requests": int, "created": int, "reused": int}
+        self.counters = {}
+
+    @staticmethod
+    def origin(url: str):
+        """
+        Get origin of an url, sessions are pooled per origin
+        :param url: absolute url (str)
+        :return: "scheme://host:port" (str)
+        """
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        return f"{parts.scheme}://{parts.hostname}:{port}"
+
+    def session(self, url: str):
+        """
+        Get (or create) the pooled session of an url host. Has to be
+        called from within a running event loop
+        :param url: absolute url, e.g. an API base url (str)
+        :return: aiohttp.ClientSession object
+        """
+        origin = self.origin(url)
+        session = self.sessions.get(origin)
+        if session is None or session.closed:
+            logging.info(f"initialising http session for {origin}")
+            session = aiohttp.ClientSession(
+                connector=self.connector(), timeout=self.timeout,
+                trace_configs=[self.trace_config(urlsplit(url).netloc)])
+            self.sessions[origin] = session
+        return session
+
+    def connector(self):
+        """
+        Build connection pool of a session
+        :return: aiohttp.TCPConnector object
+        """
+        return aiohttp.TCPConnector(limit=self.pool_size,
+                                    keepalive_timeout=self.keepalive,
+                                    ssl=self.ssl_context)
+
+    def trace_config(self, host: str):
+        """
+        Build request tracing counting new and reused connections
+        :param host: "host:port" of the session (str)
+        :return: aiohttp.TraceConfig object
+        """
+        counters = self.counters.setdefault(
+            host, {"requests": 0, "created": 0, "reused": 0})
+
+        def counter(name: str):
+            async def on_event(session, context, params):
+                counters[name] += 1
+                if name != "requests":
+                    self.metrics.inc("http_connections_total", host=host,
+                                     result=name)
+            return on_event
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(counter("requests"))
+        trace_config.on_connection_create_end.append(counter("created"))
+        trace_config.on_connection_reuseconn.append(counter("reused"))
+        return trace_config
+
+    def stats(self):
+        """
+        Get connection reuse stats per host
+        :return: host -> counters and reuse ratio (dict)
+        """
+        stats = {}
+        for host, counters in self.counters.items():
+            connections = counters["created"] + counters["reused"]
+            stats[host] = dict(counters, reuse_ratio=counters["reused"] /
+                               connections if connections else 0.0)
+        return stats
+
+    def log_stats(self):
+        """
+        Log connection reuse stats per host
+        :return: None
+        """
+        for host, stats in self.stats().items():
+            logging.info(f"http {host}: {stats['requests']} requests, "
+                         f"{stats['created']} connections opened, "
+                         f"{stats['reused']} reused "
+                         f"({stats['reuse_ratio']:.0%})")
+
+    async def close(self):
+        """
+        Close all pooled sessions
+        :return: None
+        """
+        for session in self.sessions.values():
+            if not session.closed:
+                await session.close()
+        self.sessions.clear()
+
+
+class RecordingRequest:
+    """ Request context manager recording the response into a cassette """
+
+    def __init__(self, session: aiohttp.ClientSession, cassette,
+                 method: str, url: str, kwargs: dict):
+        """
+        Instantiate class instance
+        :param session:  aiohttp.ClientSession object
+        :param cassette: helpers.cassette.Cassette (cls)
+        :param method:   http method (str)
+        :param url:      absolute url (str)
+        :param kwargs:   aiohttp request arguments (dict)
+        """
+        self.session = session
+        self.cassette = cassette
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+        self.request = None
+
+    async def __aenter__(self):
+        started = time.monotonic()
+        self.request = self.session.request(self.method, self.url,
+                                            **self.kwargs)
+        try:
+            response = await self.request.__aenter__()
+            # the body is cached, callers read it again
+            body = await response.read()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as err:
+            self.cassette.add(self.method, self.url, self.kwargs, started,
+                              time.monotonic() - started,
+                              error=type(err).__name__)
+            raise
+        self.cassette.add(self.method, self.url, self.kwargs, started,
+                          time.monotonic() - started, response.status,
+                          dict(response.headers),
+                          body.decode(errors="replace"))
+        return response
+
+    async def __aexit__(self, *exc_info):
+        return await self.request.__aexit__(*exc_info)
+
+
+class RecordingSession:
+    """ Session recording every request of a pooled session """
+
+    def __init__(self, session: aiohttp.ClientSession, cassette):
+        """
+        Instantiate class instance
+        :param session:  aiohttp.ClientSession object
+        :param cassette: helpers.cassette.Cassette (cls)
+        """
+        self.session = session
+        self.cassette = cassette
+
+    @property
+    def closed(self):
+        return self.session.closed
+
+    def request(self, method: str, url: str, **kwargs):
+        """
+        Send a recorded request
+        :param method: http method (str)
+        :param url:    absolute url (str)
+        :param kwargs: aiohttp request arguments
+        :return: RecordingRequest async context manager
+        """
+        return RecordingRequest(self.session, self.cassette, method,
+                                str(url), kwargs)
+
+
+class RecordingTransport(HTTPTransport):
+    """ Pooled transport recording request / response pairs """
+
+    def __init__(self, cassette, *args, **kwargs):
+        """
+        Instantiate class instance
+        :param cassette: helpers.cassette.Cassette (cls)
+        :param args:     HTTPTransport arguments
+        :param kwargs:   HTTPTransport keyword arguments
+        """
+        super().__init__(*args, **kwargs)
+        self.cassette = cassette
+
+    def session(self, url: str):
+        """
+        Get recording session of an url host
+        :param url: absolute url, e.g. an API base url (str)
+        :return: RecordingSession object
+        """
+        return RecordingSession(super().session(url), self.cassette)
+
+
+class ReplayResponse:
+    """ Recorded response, provides the parts of aiohttp.ClientResponse
+    read by the API clients """
+
+    def __init__(self, entry: dict, method: str, url: str):
+        """
+        Instantiate class instance
+        :param entry:  recorded cassette entry (dict)
+        :param method: http method (str)
+        :param url:    absolute url (str)
+        """
+        self.status = entry["status"]
+        self.headers = CIMultiDictProxy(CIMultiDict(entry["headers"] or {}))
+        self.body = (entry["body"] or "").encode()
+        self.request_info = aiohttp.RequestInfo(
+            url=URL(url), method=method, headers=CIMultiDictProxy(
+                CIMultiDict()), real_url=URL(url))
+
+    @property
+    def content_type(self):
+        return self.headers.get("Content-Type", "application/json") \
+            .split(";")[0].strip()
+
+    @property
+    def links(self):
+        """
+        Parse Link header, see https://www.rfc-editor.org/rfc/rfc8288
+        :return: rel -> {"url": URL, "rel": str} (dict)
+        """
+        links = {}
+        for link in self.headers.get("Link", "").split(","):
+            match = re.match(r'\s*<([^>]*)>.*rel="?([^";]+)"?', link)
+            if match:
+                url, rel = match.groups()
+                links[rel] = {"url": URL(url), "rel": rel}
+        return links
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(
+                self.request_info, (), status=self.status,
+                message=f"recorded status {self.status}",
+                headers=self.headers)
+
+    async def read(self):
+        return self.body
+
+    async def text(self):
+        return self.body.decode()
+
+    async def json(self):
+        return json.loads(self.body)
+
+
+class ReplayRequest:
+    """ Request context manager serving a recorded response """
+
+    def __init__(self, transport, method: str, url: str, kwargs: dict):
+        """
+        Instantiate class instance
+        :param transport: ReplayTransport (cls)
+        :param method:    http method (str)
+        :param url:       absolute url (str)
+        :param kwargs:    aiohttp request arguments (dict)
+        """
+        self.transport = transport
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+    async def __aenter__(self):
+        entry = self.transport.cassette.match(self.method, self.url,
+                                              self.kwargs)
+        if entry is None:
+            raise aiohttp.ClientConnectionError(
+                f"no recorded response of {self.method} {self.url}")
+        if self.transport.pace:
+            await asyncio.sleep(entry["elapsed"])
+        if entry["error"]:
+            raise aiohttp.ClientConnectionError(entry["error"])
+        return ReplayResponse(entry, self.method, self.url)
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class ReplaySession:
+    """ Session answering requests from a cassette, without network """
+
+    closed = False
+
+    def __init__(self, transport):
+        """
+        Instantiate class instance
+        :param transport: ReplayTransport (cls)
+        """
+        self.transport = transport
+
+    def request(self, method: str, url: str, **kwargs):
+        """
+        Replay a request
+        :param method: http method (str)
+        :param url:    absolute url (str)
+        :param kwargs: aiohttp request arguments
+        :return: ReplayRequest async context manager
+        """
+        return ReplayRequest(self.transport, method, str(url), kwargs)
+
+
+class ReplayTransport(HTTPTransport):
+    """ Transport replaying a cassette, at the recorded pace
+    of every call or as fast as possible """
+
+    def __init__(self, cassette, pace: bool = True):
+        """
+        Instantiate class instance
+        :param cassette: loaded helpers.cassette.Cassette (cls)
+        :param pace:     wait the recorded duration of every call,
+                         otherwise respond right away (bool)
+        """
+        super().__init__()
+        self.cassette = cassette
+        self.pace = pace
+
+    def session(self, url: str):
+        """
+        Get replay session, shared by all hosts
+        :param url: absolute url, e.g. an API base url (str)
+        :return: ReplaySession object
+        """
+        return ReplaySession(self)
+
+    async def close(self):
+        """
+        Nothing to close without connections
+        :return: None
+        """
@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+
+from aiohttp import web
+
+
+class GitHubWebhookReceiver:
+    """ GitHub webhook HTTP endpoint """
+
+    EVENTS = ("pull_request", "pull_request_review")
+
+    def __init__(self, secret: str, handler, host: str = "0.0.0.0",
+                 port: int = 8080, path: str = "/webhook"):
+        """
+        Instantiate class instance
+        :param secret:  webhook secret (str)
+        :param handler: coroutine function called with
+                        event name (str) and payload (dict)
+        :param host:    listen address (str)
+        :param port:    listen port (int)
+        :param path:    webhook url path (str)
+        """
+        self.secret = secret.encode()
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_post(path, self.receive)
+        self.runner = None
+        self.tasks = set()
+
+    def verify(self, body: bytes, signature: str):
+        """
+        Verify payload HMAC signature, see
+        https://docs.github.com/en/webhooks/using-webhooks/validating-webhook-deliveries
+        :param body:      raw request body (bytes)
+        :param signature: X-Hub-Signature-256 header (str)
+        :return: True if signature is valid (bool)
+        """
+        digest = hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(f"sha256={digest}", signature or "")
+
+    async def receive(self, request: web.Request):
+        """
+        Handle webhook delivery
+        :param request: aiohttp request
+        :return: aiohttp response
+        """
+        body = await request.read()
+        if not self.verify(body, request.headers.get("X-Hub-Signature-256")):
+            logging.warning("received webhook with invalid signature")
+            return web.Response(status=401)
+
+        event = request.headers.get("X-GitHub-Event")
+        if event not in self.EVENTS:
+            return web.Response(status=204)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+
+        logging.info(f"received {event} webhook "
+                     f"({payload.get('action')})")
+        # respond right away, deliveries time out after 10 seconds
+        task = asyncio.ensure_future(self.handler(event, payload))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.Response(status=202)
+
+    async def start(self):
+        """
+        Start HTTP server
+        :return: None
+        """
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        logging.info(f"listening for github webhooks on "
+                     f"{self.host}:{self.port}")
+
+    async def close(self):
+        """
+        Stop HTTP server
+        :return: None
+        """
+        if self.runner:
+            await self.runner.cleanup()
@@ -1,5 +1,19 @@
-from .git import PullRequest
+from .cache import PullRequestCache
+from .cassette import Cassette
+from .context import Context
+from .etag import ETagStore
+from .git import PullRequest, PullRequestResolver, ReviewEvaluator
+from .index import PullRequestIndex
+from .metrics import Metrics
+from .planner import ThreadPlanner
+from .poller import PollQueue
+from .ratelimit import RateLimitTracker, TierLimiter, TokenBucket
+from .reactions import ReactionWriter
 from .slack import SlackMessage
+from .scheduler import Scheduler
+from .shards import (FileLeases, HashRing, LeaseBackend, Sharding,
+                     SQLiteLeases)
+from .state import ChannelState, SQLiteState
+from .watch import WatchSet
 
-from .helpers import sleep_until
-
+from .helpers import ErrorCounter, backoff_delay, sleep_until
@@ -0,0 +1,153 @@
+from collections import OrderedDict
+import asyncio
+import logging
+import time
+
+
+class PullRequestCache:
+    """ LRU / TTL cache of pull request states shared across cycles """
+
+    def __init__(self, ttl: int = 300, max_size: int = 1024,
+                 backend=None):
+        """
+        Instantiate class instance
+        :param ttl:      seconds before a non-final state expires (int)
+        :param max_size: max number of cached pull requests (int)
+        :param backend:  helpers.state.ChannelState (cls), final
+                         states are persisted to and warmed from it
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.backend = backend
+        # key -> (expiry timestamp or None for final states, state)
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        if self.backend is not None:
+            self.warm()
+
+    @staticmethod
+    def is_final(state: dict):
+        """
+        Check if pull request state can not change anymore. Approvals
+        are not final: a push or a change request withdraws them
+        :param state: pull request state (dict)
+        :return: True if final, otherwise False (bool)
+        """
+        return bool(state.get("merged") or state.get("closed"))
+
+    def warm(self):
+        """
+        Load final states persisted by previous runs
+        :return: None
+        """
+        for key, state in self.backend.pull_states().items():
+            # approvals persisted by earlier versions are loaded again
+            if self.is_final(state):
+                self.entries[key] = (None, state)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        logging.info(f"warmed cache with {len(self.entries)} "
+                     f"final pull request states")
+
+    def lookup(self, key: tuple):
+        """
+        Get cached state without loading it
+        :param key: (owner, repo, number) tuple
+        :return: state (dict) or None if missing or expired
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, state = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return state
+
+    def put(self, key: tuple, state: dict):
+        """
+        Store pull request state, evicting least recently used entries
+        :param key:   (owner, repo, number) tuple
+        :param state: pull request state (dict)
+        :return: None
+        """
+        final = self.is_final(state)
+        expires = None if final else time.monotonic() + self.ttl
+        if final and self.backend is not None:
+            self.backend.store_pull(key, state)
+        self.entries[key] = (expires, state)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            evicted, _ = self.entries.popitem(last=False)
+            logging.debug(f"evicted pull request {evicted} from cache")
+
+    def expire(self, key: tuple):
+        """
+        Drop cached state unless it is final, so the next
+        lookup loads it again
+        :param key: (owner, repo, number) tuple
+        :return: None
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is not None:
+            del self.entries[key]
+
+    def invalidate(self, key: tuple):
+        """
+        Drop cached state, e.g. after a new push to the pull request
+        :param key: (owner, repo, number) tuple
+        :return: None
+        """
+        self.entries.pop(key, None)
+        if self.backend is not None:
+            self.backend.drop_pull(key)
+
+    async def get(self, key: tuple, loader):
+        """
+        Get pull request state, loading it on cache miss.
+        Concurrent lookups of the same key share a single load
+        :param key:    (owner, repo, number) tuple
+        :param loader: coroutine function returning state (dict)
+        :return: state (dict)
+        """
+        state = self.lookup(key)
+        if state is not None:
+            self.hits += 1
+            logging.debug(f"pull request {key} cache hit")
+            return state
+
+        if key not in self.pending:
+            self.misses += 1
+            task = asyncio.ensure_future(loader())
+            self.pending[key] = task
+            task.add_done_callback(
+                lambda done: self.store(key, done))
+        else:
+            self.hits += 1
+            logging.debug(f"pull request {key} lookup in flight")
+        return await asyncio.shield(self.pending[key])
+
+    def store(self, key: tuple, task: asyncio.Task):
+        """
+        Store result of a finished load task
+        :param key:  (owner, repo, number) tuple
+        :param task: finished loader task
+        :return: None
+        """
+        self.pending.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def log_stats(self):
+        """
+        Log cache size and hit ratio
+        :return: None
+        """
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0.0
+        logging.info(f"pull request cache: {len(self.entries)} entries, "
+                     f"{self.hits} hits, {self.misses} misses "
+                     f"(hit ratio {ratio:.2f})")
@@ -0,0 +1,183 @@
+from collections import deque
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+
+class Cassette:
+    """ Recorded HTTP request / response pairs with timing, stored as
+    gzipped JSON lines. Credentials are redacted before they are kept """
+
+    REDACTED = "REDACTED"
+    # request and response headers which carry credentials
+    SECRET_HEADERS = {"authorization", "cookie", "set-cookie"}
+    # Slack and GitHub token formats
+    SECRET_PATTERNS = re.compile(r"xox[a-z]-[A-Za-z0-9-]+|"
+                                 r"gh[opsur]_[A-Za-z0-9]+|"
+                                 r"github_pat_[A-Za-z0-9_]+")
+    # Slack query parameters derived from the current time
+    VOLATILE_PARAMS = {"latest", "oldest"}
+
+    def __init__(self, path: str, secrets: list = ()):
+        """
+        Instantiate class instance
+        :param path:    cassette file path (str)
+        :param secrets: extra values to redact, e.g. api tokens (list)
+        """
+        self.path = path
+        self.secrets = [secret for secret in secrets if secret]
+        self.entries = []
+        # entries written by save
+        self.saved = 0
+        self.started = time.monotonic()
+        # request key -> deque of entries left to replay
+        self.tapes = {}
+        self.replayed = 0
+        self.misses = 0
+
+    def redact(self, value):
+        """
+        Redact credentials from a recorded value
+        :param value: str, dict or list
+        :return: redacted copy
+        """
+        if isinstance(value, str):
+            for secret in self.secrets:
+                value = value.replace(secret, self.REDACTED)
+            return self.SECRET_PATTERNS.sub(self.REDACTED, value)
+        if isinstance(value, dict):
+            return {key: self.REDACTED
+                    if str(key).lower() in self.SECRET_HEADERS
+                    else self.redact(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.redact(item) for item in value]
+        return value
+
+    def key(self, method: str, url: str, params: dict = None,
+            data: dict = None, json_body: dict = None):
+        """
+        Build replay key of a request. Credentials and time
+        derived parameters are left out
+        :param method:    http method (str)
+        :param url:       absolute url (str)
+        :param params:    query parameters (dict)
+        :param data:      form body (dict)
+        :param json_body: json body (dict)
+        :return: key (str)
+        """
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query))
+        query.update({name: str(value)
+                      for name, value in (params or {}).items()})
+        form = {name: str(value) for name, value in (data or {}).items()}
+        for values in (query, form):
+            for name in self.VOLATILE_PARAMS | {"token"}:
+                values.pop(name, None)
+        return json.dumps(self.redact([method.upper(), parts.netloc,
+                                       parts.path, query, form,
+                                       json_body]), sort_keys=True)
+
+    def add(self, method: str, url: str, kwargs: dict, started: float,
+            elapsed: float, status: int = None, headers: dict = None,
+            body: str = None, error: str = None):
+        """
+        Record a request and its response or connection error
+        :param method:  http method (str)
+        :param url:     absolute url (str)
+        :param kwargs:  aiohttp request arguments (dict)
+        :param started: time.monotonic() of the request (float)
+        :param elapsed: seconds until the response body was read (float)
+        :param status:  response status (int)
+        :param headers: response headers (dict)
+        :param body:    response body (str)
+        :param error:   connection error, instead of a response (str)
+        :return: None
+        """
+        self.entries.append(self.redact({
+            "key": self.key(method, url, kwargs.get("params"),
+                            kwargs.get("data"), kwargs.get("json")),
+            "offset": round(started - self.started, 6),
+            "elapsed": round(elapsed, 6),
+            "method": method.upper(),
+            "url": url,
+            "request_headers": dict(kwargs.get("headers") or {}),
+            "status": status,
+            "headers": headers,
+            "body": body,
+            "error": error
+        }))
+
+    def save(self):
+        """
+        Append entries recorded since the last save, the
+        first save of a recording replaces an existing file
+        :return: None
+        """
+        if len(self.entries) == self.saved:
+            return
+        mode = "at" if self.saved else "wt"
+        try:
+            with gzip.open(self.path, mode) as cassette_file:
+                for entry in self.entries[self.saved:]:
+                    cassette_file.write(json.dumps(entry,
+                                                   separators=(",", ":")))
+                    cassette_file.write("\n")
+        except OSError as err:
+            logging.error(f"error saving cassette file: {err}")
+            return
+        self.saved = len(self.entries)
+
+    def load(self):
+        """
+        Load recorded entries for replay
+        :return: number of entries (int)
+        """
+        with gzip.open(self.path, "rt") as cassette_file:
+            self.entries = [json.loads(line) for line in cassette_file
+                            if line.strip()]
+        self.saved = len(self.entries)
+        self.tapes = {}
+        for entry in self.entries:
+            self.tapes.setdefault(entry["key"], deque()).append(entry)
+        logging.info(f"loaded {len(self.entries)} recorded requests "
+                     f"from {self.path}")
+        return len(self.entries)
+
+    def match(self, method: str, url: str, kwargs: dict):
+        """
+        Get the next recorded entry of a request, in recorded order.
+        The last entry of a request is repeated once all were replayed
+        :param method: http method (str)
+        :param url:    absolute url (str)
+        :param kwargs: aiohttp request arguments (dict)
+        :return: entry (dict) or None if never recorded
+        """
+        tape = self.tapes.get(self.key(method, url, kwargs.get("params"),
+                                      kwargs.get("data"),
+                                      kwargs.get("json")))
+        if not tape:
+            self.misses += 1
+            logging.warning(f"no recorded response of {method} {url}")
+            return None
+        self.replayed += 1
+        return tape.popleft() if len(tape) > 1 else tape[0]
+
+    def size(self):
+        """
+        Get cassette file size
+        :return: bytes (int)
+        """
+        return os.path.getsize(self.path) if os.path.exists(self.path) \
+            else 0
+
+    def log_stats(self):
+        """
+        Log recorded and replayed requests
+        :return: None
+        """
+        logging.info(f"cassette: {len(self.entries)} recorded, "
+                     f"{self.replayed} replayed, {self.misses} not recorded")
@@ -0,0 +1,69 @@
+from .index import PullRequestIndex
+from .metrics import Metrics
+from .planner import ThreadPlanner
+from .reactions import ReactionWriter
+
+
+class Context:
+    """ Shared state of a processing cycle """
+
+    def __init__(self, args, slack_clients, github_client,
+                 scheduler, cache, state=None, planner=None,
+                 resolver=None, index=None, writer=None, metrics=None,
+                 poller=None, sharding=None, cassette=None):
+        """
+        Instantiate class instance
+        :param args:          instance of configargparse
+        :param slack_clients: clients.slack.SlackClient (cls)
+                              per watched channel id (dict)
+        :param github_client: clients.git.GitHubClient (cls)
+        :param scheduler:     helpers.scheduler.Scheduler (cls)
+        :param cache:         helpers.cache.PullRequestCache (cls)
+        :param state:         helpers.state.ChannelState (cls),
+                              enables incremental scanning if set
+        :param planner:       helpers.planner.ThreadPlanner (cls)
+        :param resolver:      helpers.git.PullRequestResolver (cls),
+                              enables batch PR resolution if set
+        :param index:         helpers.index.PullRequestIndex (cls)
+        :param writer:        helpers.reactions.ReactionWriter (cls)
+        :param metrics:       helpers.metrics.Metrics (cls)
+        :param poller:        helpers.poller.PollQueue (cls),
+                              enables adaptive polling if set
+        :param sharding:      helpers.shards.Sharding (cls), splits
+                              threads across replicas if set
+        :param cassette:      helpers.cassette.Cassette (cls),
+                              saved after every cycle when recording
+        """
+        self.args = args
+        self.slack_clients = slack_clients
+        self.github_client = github_client
+        self.scheduler = scheduler
+        self.cache = cache
+        self.state = state
+        self.planner = planner if planner else ThreadPlanner()
+        self.resolver = resolver
+        self.index = index if index else PullRequestIndex()
+        self.writer = writer if writer else \
+            ReactionWriter(args.reaction_name)
+        self.metrics = metrics if metrics else Metrics()
+        self.poller = poller
+        self.sharding = sharding
+        self.cassette = cassette
+        # time.monotonic() of the last persisted and logged cycle
+        self.logged_at = None
+
+    @property
+    def channels(self):
+        """
+        Get watched channels
+        :return: list of slack channel ids (str)
+        """
+        return list(self.slack_clients)
+
+    def slack(self, channel: str):
+        """
+        Get Slack client of the channel workspace
+        :param channel: slack channel id (str)
+        :return: clients.slack.SlackClient (cls)
+        """
+        return self.slack_clients[channel]
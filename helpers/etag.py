@@ -0,0 +1,116 @@
+from collections import OrderedDict
+import json
+import logging
+import os
+
+
+class ETagStore:
+    """ Bounded store of conditional request validators and responses """
+
+    def __init__(self, max_size: int = 2048, path: str = None):
+        """
+        Instantiate class instance
+        :param max_size: max number of stored responses (int)
+        :param path:     optional JSON file to persist the store (str)
+        """
+        self.max_size = max_size
+        self.path = path
+        # request url -> [etag, response data, next page url]
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if self.path:
+            self.load()
+
+    @staticmethod
+    def key(url: str, params: dict = None):
+        """
+        Build store key of a request
+        :param url:    request url (str)
+        :param params: query parameters (dict)
+        :return: key (str)
+        """
+        if not params:
+            return url
+        query = "&".join(f"{name}={value}" for name, value
+                         in sorted(params.items()))
+        return f"{url}?{query}"
+
+    def etag(self, key: str):
+        """
+        Get stored ETag of a request
+        :param key: store key (str)
+        :return: ETag (str) or None
+        """
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+    def get(self, key: str):
+        """
+        Get stored response after a 304 Not Modified. The entry may
+        have been evicted by concurrent requests since its ETag was sent
+        :param key: store key (str)
+        :return: tuple of response data and next page url,
+                 None if not stored
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        _, data, next_page = entry
+        return data, next_page
+
+    def put(self, key: str, etag: str, data, next_page: str = None):
+        """
+        Store response, evicting least recently used entries
+        :param key:       store key (str)
+        :param etag:      response ETag (str)
+        :param data:      response data
+        :param next_page: next page url (str)
+        :return: None
+        """
+        self.misses += 1
+        if not etag:
+            return
+        self.entries[key] = [etag, data, next_page]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def load(self):
+        """
+        Load store from disk
+        :return: None
+        """
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as store_file:
+                self.entries = OrderedDict(json.load(store_file))
+            logging.info(f"loaded {len(self.entries)} etags")
+        except (OSError, ValueError) as err:
+            logging.error(f"error loading etag file: {err}")
+
+    def save(self):
+        """
+        Atomically write store to disk
+        :return: None
+        """
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as store_file:
+                json.dump(list(self.entries.items()), store_file)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            logging.error(f"error saving etag file: {err}")
+
+    def log_stats(self):
+        """
+        Log store size and number of 304 responses
+        :return: None
+        """
+        logging.info(f"etag store: {len(self.entries)} entries, "
+                     f"{self.hits} not modified, {self.misses} modified")
@@ -1,29 +1,155 @@
 from urllib import parse
 import logging
 
+import aiohttp
+
+import utils
+
+
+class ReviewEvaluator:
+    """ Folds pull request reviews into a review decision: every
+    reviewer counts with their latest approval or change request,
+    comments do not change it and dismissals withdraw it """
+
+    VERDICTS = ("APPROVED", "CHANGES_REQUESTED", "DISMISSED")
+
+    def __init__(self):
+        """
+        Instantiate class instance
+        """
+        # reviewer login -> latest verdict (str)
+        self.reviewers = {}
+        self.reviews = 0
+        # submission time of the latest review (str)
+        self.reviewed_at = None
+
+    def add(self, reviews: list):
+        """
+        Fold a page of reviews, oldest first
+        :param reviews: GitHub reviews (list of dict)
+        :return: None
+        """
+        for review in reviews:
+            self.reviews += 1
+            submitted_at = review.get("submitted_at")
+            if submitted_at and submitted_at > (self.reviewed_at or ""):
+                self.reviewed_at = submitted_at
+            state = review.get("state")
+            if state in self.VERDICTS:
+                reviewer = (review.get("user") or {}).get("login")
+                self.reviewers[reviewer] = state
+
+    @property
+    def approved(self):
+        """
+        Check if someone approved and nobody requests changes
+        :return: True or False (bool)
+        """
+        verdicts = set(self.reviewers.values())
+        return "APPROVED" in verdicts and \
+            "CHANGES_REQUESTED" not in verdicts
+
 
 class PullRequest:
     """ GitHub Pull Request helper class """
-    def __init__(self, client, url: str):
+    def __init__(self, client, url: str, cache=None, state: dict = None):
         """
         Instantiate class instance
         :param client: clients.git.GitHubClient (cls)
         :param url:    GitHub pull request web url (str)
+        :param cache:  helpers.cache.PullRequestCache (cls)
+        :param state:  pre-resolved pull request state (dict)
         """
         self.client = client
+        self.cache = cache
+        self.state = state
 
         self.pr_url = url
         self.pull_url = parse.urlparse(self.pr_url)
         self.url_path = self.pull_url.path
 
         self.params = self.params_from_path()
-        self.reviews = self.load_pr_reviews()
-        self.is_approved = self.is_approved()
+        self.key = self.key_from_params()
+        self.is_approved = False
+
+    async def load(self):
+        """
+        Load pull request state, through the cache if one is set
+        :return: True if approved, otherwise False (bool)
+        """
+        if self.state is None:
+            if self.cache is not None and self.key:
+                self.state = await self.cache.get(self.key,
+                                                  self.load_state)
+            else:
+                self.state = await self.load_state()
+        self.is_approved = self.state["approved"]
+        return self.is_approved
+
+    async def load_state(self):
+        """
+        Load pull request state and evaluate approval from its reviews.
+        Merged or closed pull requests are settled without reading
+        their reviews, like the GraphQL resolver does
+        :return: pull request state (dict)
+        """
+        if not self.params:
+            return {"approved": False}
+        logging.info(f"processing pull request {self.pr_url}")
+        evaluator = ReviewEvaluator()
+        try:
+            pull = await self.client.get_pr(**self.params)
+            if not pull:
+                return {"approved": False}
+            state = utils.GitClient.pr_state_from_rest(pull)
+            if state["merged"] or state["closed"]:
+                logging.info(f"pull request is {pull.get('state')}, "
+                             f"skipping reviews")
+                return state
+            reviews, next_page = await self.client.get_pr_reviews_page(
+                **self.params)
+            evaluator.add(reviews)
+            while next_page:
+                reviews, next_page = await self.client.get_pr_reviews_page(
+                    **self.params, url=next_page)
+                evaluator.add(reviews)
+        except aiohttp.ClientResponseError as err:
+            # e.g. deleted since the pull request was fetched
+            if utils.GitClient.is_inaccessible(err):
+                logging.warning(f"reviews of {self.pr_url} are not "
+                                f"accessible: {err.status}")
+            else:
+                logging.error(f"error fetching reviews: {err}")
+            return {"approved": False}
+        except Exception as err:
+            logging.error(f"error fetching reviews: {err}")
+            return {"approved": False}
+
+        logging.info(f"found {evaluator.reviews} reviews by "
+                     f"{len(evaluator.reviewers)} reviewers")
+        logging.debug(f"review verdicts: {evaluator.reviewers}")
+        state["approved"] = evaluator.approved
+        state["reviewed_at"] = evaluator.reviewed_at
+        logging.info(f"pull request is "
+                     f"{'' if state['approved'] else 'not '}approved")
+        return state
+
+    def key_from_params(self):
+        """
+        Build pull request cache key
+        :return: (owner, repo, number) tuple or None
+        """
+        try:
+            return utils.GitClient.pr_key(self.params["repo_owner"],
+                                          self.params["repo_name"],
+                                          self.params["pull_number"])
+        except (KeyError, ValueError):
+            return None
 
     def params_from_path(self):
         """
         Split url path and generate params for
-        self.client.get_pr_reviews method call
+        self.client.get_pr_reviews_page method call
         :return: params (dict)
         """
         url_path = self.url_path.split("/")
@@ -39,29 +165,43 @@ class PullRequest:
             logging.warning(f"received invalid url path")
             return {}
 
-    def load_pr_reviews(self):
+
+class PullRequestResolver:
+    """ Batch resolver of pull request states """
+
+    def __init__(self, client, cache, batch_size: int = 50):
         """
-        Get pull request reviews
-        :return: reviews (list of dict)
+        Instantiate class instance
+        :param client:     clients.git.GitHubClient (cls)
+        :param cache:      helpers.cache.PullRequestCache (cls)
+        :param batch_size: pull requests per GraphQL query (int)
         """
-        if self.params:
-            logging.info(f"processing pull request {self.pr_url}")
-            reviews = self.client.get_pr_reviews(**self.params)
-            return reviews
-        else:
-            return []
+        self.client = client
+        self.cache = cache
+        self.batch_size = batch_size
 
-    def is_approved(self):
+    def batches(self, urls: list):
         """
-        Check if last review action was PR approval
-        :return: True if approved, otherwise False (bool)
+        Split uncached pull requests into query batches
+        :param urls: GitHub pull request web urls (list of str)
+        :return: list of batches (list of keys)
+        """
+        keys = []
+        for url in urls:
+            key = PullRequest(self.client, url).key
+            if key and key not in keys and \
+                    self.cache.lookup(key) is None:
+                keys.append(key)
+        return [keys[index:index + self.batch_size]
+                for index in range(0, len(keys), self.batch_size)]
+
+    async def resolve_batch(self, keys: list):
+        """
+        Resolve a batch of pull requests and cache their states
+        :param keys: list of (owner, repo, number) tuples
+        :return: pull request states (dict of key: state)
         """
-        if self.reviews:
-            pr_states = [review.get("state") for review
-                         in self.reviews]
-            if pr_states:
-                if pr_states[-1] == "APPROVED":
-                    logging.info("pull request is approved")
-                    return True
-        logging.info("pull request is not approved")
-        return False
+        states = await self.client.get_pr_states(keys)
+        for key, state in states.items():
+            self.cache.put(key, state)
+        return states
@@ -1,19 +1,51 @@
-from time import sleep
-from datetime import datetime, timedelta
-
+import asyncio
 import logging
+import random
+import time
 
 
-def sleep_until(timestamp: float):
+async def sleep_until(timestamp: float):
     """
-    Sleep until provided timestamp
+    Sleep until provided timestamp without blocking
+    other tasks of the event loop
     :param timestamp: timestamp (float)
-    :return: None
+    :return: True if slept (bool)
     """
     logging.warning("api rate limit reached!")
-    time_now = datetime.now()
-    ts = datetime.fromtimestamp(timestamp)
-    delta = ts - time_now
-    if delta > timedelta(0):
-        sleep(delta.total_seconds())
+    delay = timestamp - time.time()
+    if delay > 0:
+        await asyncio.sleep(delay)
         return True
+    return False
+
+
+class ErrorCounter(logging.Handler):
+    """ Counts error log records, failures are logged and
+    handled where they happen """
+
+    def __init__(self):
+        """
+        Instantiate class instance
+        """
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord):
+        """
+        Count a record
+        :param record: log record
+        :return: None
+        """
+        self.count += 1
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0):
+    """
+    Exponential backoff delay with full jitter, see
+    https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    :param attempt: zero based retry attempt (int)
+    :param base:    delay of the first retry in seconds (float)
+    :param cap:     max delay in seconds (float)
+    :return: delay in seconds (float)
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
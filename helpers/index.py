@@ -0,0 +1,141 @@
+import logging
+import time
+
+
+class PullRequestIndex:
+    """ Reverse index of pull requests to Slack messages awaiting approval """
+
+    def __init__(self):
+        """
+        Instantiate class instance
+        """
+        # (channel, ts) -> SlackMessage
+        self.messages = {}
+        # (channel, ts) -> set of not yet approved pull request keys
+        self.pending = {}
+        # (channel, ts) -> set of all pull request keys of the message
+        self.keys = {}
+        # (owner, repo, number) -> set of (channel, ts)
+        self.pulls = {}
+
+    def __len__(self):
+        return len(self.messages)
+
+    def add(self, channel: str, message):
+        """
+        Index message with all of its pull requests pending
+        :param channel: slack channel id (str)
+        :param message: helpers.slack.SlackMessage (cls)
+        :return: True if message was indexed (bool)
+        """
+        ref = (channel, message.timestamp)
+        self.discard(channel, message.timestamp)
+
+        keys = set(message.pull_keys)
+        if not keys:
+            logging.warning(f"message {message.timestamp} has no "
+                            f"pull requests, skipping")
+            return False
+
+        self.messages[ref] = message
+        self.keys[ref] = keys
+        self.pending[ref] = set(keys)
+        for key in keys:
+            self.pulls.setdefault(key, set()).add(ref)
+        return True
+
+    def discard(self, channel: str, ts: str):
+        """
+        Drop message from index
+        :param channel: slack channel id (str)
+        :param ts:      message timestamp (str)
+        :return: None
+        """
+        ref = (channel, ts)
+        if self.messages.pop(ref, None) is None:
+            return
+        self.pending.pop(ref, None)
+        for key in self.keys.pop(ref, set()):
+            refs = self.pulls.get(key, set())
+            refs.discard(ref)
+            if not refs:
+                self.pulls.pop(key, None)
+
+    def retain(self, channel: str, timestamps: set):
+        """
+        Drop channel messages which are not in the latest scan
+        :param channel:    slack channel id (str)
+        :param timestamps: message timestamps to keep (set of str)
+        :return: None
+        """
+        for ref_channel, ts in list(self.messages):
+            if ref_channel == channel and ts not in timestamps:
+                self.discard(channel, ts)
+
+    def replies(self, channel: str):
+        """
+        Get indexed thread replies of a channel, e.g. to reuse
+        replies of threads which were not fetched again
+        :param channel: slack channel id (str)
+        :return: dict of thread ts: list of SlackMessage
+        """
+        replies = {}
+        for (ref_channel, ts), message in self.messages.items():
+            if ref_channel == channel and message.thread_ts and \
+                    message.thread_ts != ts:
+                replies.setdefault(message.thread_ts, []).append(message)
+        return replies
+
+    def age(self, key: tuple):
+        """
+        Get age of the newest message linking a pull request
+        :param key: (owner, repo, number) tuple
+        :return: seconds (float)
+        """
+        refs = self.pulls.get(key)
+        if not refs:
+            return 0.0
+        return max(time.time() - max(float(ts) for _, ts in refs), 0.0)
+
+    def pending_keys(self, refs: list = None):
+        """
+        Get pull requests still pending for some messages
+        :param refs: list of (channel, ts), all messages if not set
+        :return: list of (owner, repo, number) tuples
+        """
+        refs = self.pending.keys() if refs is None else refs
+        keys = set()
+        for ref in refs:
+            keys.update(self.pending.get(ref, set()))
+        return sorted(keys)
+
+    def update(self, key: tuple, approved: bool):
+        """
+        Apply pull request state to the messages referencing it
+        :param key:      (owner, repo, number) tuple
+        :param approved: pull request approval (bool)
+        :return: list of (channel, SlackMessage) which have
+                 no pending pull requests left
+        """
+        ready = []
+        for ref in self.pulls.get(key, set()):
+            pending = self.pending[ref]
+            if not approved:
+                pending.add(key)
+            elif key in pending:
+                pending.discard(key)
+                if not pending:
+                    ready.append(ref)
+        logging.debug(f"pull request {key} approved: {approved}, "
+                      f"{len(ready)} messages ready")
+        return [(channel, self.messages[(channel, ts)])
+                for channel, ts in ready]
+
+    def lookup(self, key: tuple):
+        """
+        Get messages referencing a pull request
+        :param key: (owner, repo, number) tuple
+        :return: list of (channel, SlackMessage) tuples
+        """
+        return [(channel, self.messages[(channel, ts)])
+                for channel, ts in self.pulls.get(key, set())]
@@ -0,0 +1,188 @@
+from contextlib import contextmanager
+import time
+
+
+class Metrics:
+    """ Prometheus metrics registry rendered in the text exposition format
+    see https://prometheus.io/docs/instrumenting/exposition_formats/ """
+
+    # seconds, from single API calls up to whole cycles
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+               5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+    # name -> (type, help)
+    DESCRIPTIONS = {
+        "stage_duration_seconds": (
+            "histogram", "Duration of processing stage calls"),
+        "cycle_duration_seconds": (
+            "histogram", "Duration of processing cycles"),
+        "last_cycle_duration_seconds": (
+            "gauge", "Duration of the last processing cycle"),
+        "sleep_period_seconds": (
+            "gauge", "Configured sleep period between cycles"),
+        "cycle_overruns_total": (
+            "counter", "Cycles which took longer than the sleep period"),
+        "api_requests_total": (
+            "counter", "API requests sent, including retries"),
+        "api_errors_total": (
+            "counter", "API requests which failed, including retried ones"),
+        "api_failures_total": (
+            "counter", "API calls given up on after retries"),
+        "http_connections_total": (
+            "counter", "HTTP connections opened or reused per host"),
+        "github_rate_limit_remaining": (
+            "gauge", "GitHub rate limit requests remaining"),
+        "github_rate_limit_limit": (
+            "gauge", "GitHub rate limit requests per window"),
+        "github_rate_limit_reset_timestamp_seconds": (
+            "gauge", "GitHub rate limit window reset time"),
+        "pull_request_cache_hits_total": (
+            "counter", "Pull request cache hits"),
+        "pull_request_cache_misses_total": (
+            "counter", "Pull request cache misses"),
+        "pull_request_cache_hit_ratio": (
+            "gauge", "Pull request cache hit ratio"),
+        "pull_request_cache_entries": (
+            "gauge", "Pull request cache entries"),
+        "reaction_writes_total": (
+            "counter", "Reaction writes by result"),
+        "watched_messages": (
+            "gauge", "Messages with pull requests awaiting approval"),
+        "poll_queue_items": (
+            "gauge", "Channels, threads and pull requests polled"),
+        "next_poll_seconds": (
+            "gauge", "Seconds until the next due check"),
+        "shard_replicas": (
+            "gauge", "Live replicas sharing the watched threads"),
+        "shard_threads": (
+            "gauge", "Threads of the last scan by owner")
+    }
+
+    def __init__(self, namespace: str = "pr_vigilante"):
+        """
+        Instantiate class instance
+        :param namespace: metric name prefix (str)
+        """
+        self.namespace = namespace
+        # name -> {sorted label items (tuple): value}, histogram
+        # values are [bucket counts (list), sum (float), count (int)]
+        self.values = {}
+
+    def series(self, name: str, labels: dict):
+        """
+        Get (or create) label values of a metric
+        :param name:   metric name (str)
+        :param labels: metric labels (dict)
+        :return: tuple of series (dict) and label key (tuple)
+        """
+        return self.values.setdefault(name, {}), \
+            tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Increase a counter
+        :param name:   metric name (str)
+        :param value:  increment (float)
+        :param labels: metric labels
+        :return: None
+        """
+        series, key = self.series(name, labels)
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """
+        Set a gauge, or a counter mirrored from another component
+        :param name:   metric name (str)
+        :param value:  value (float)
+        :param labels: metric labels
+        :return: None
+        """
+        series, key = self.series(name, labels)
+        series[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Record a histogram observation
+        :param name:   metric name (str)
+        :param value:  observed value (float)
+        :param labels: metric labels
+        :return: None
+        """
+        series, key = self.series(name, labels)
+        if key not in series:
+            series[key] = [[0] * len(self.BUCKETS), 0.0, 0]
+        histogram = series[key]
+        for index, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        """
+        Observe duration of a block in seconds
+        :param name:   histogram name (str)
+        :param labels: metric labels
+        :return: context manager
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def escape(value):
+        """
+        Escape label value
+        :param value: label value
+        :return: escaped value (str)
+        """
+        return str(value).replace("\\", "\\\\").replace(
+            "\n", "\\n").replace('"', '\\"')
+
+    @staticmethod
+    def format_labels(labels, extra: tuple = ()):
+        """
+        Render label set
+        :param labels: sorted label items (tuple)
+        :param extra:  additional label items (tuple)
+        :return: labels (str), empty without labels
+        """
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        rendered = ",".join(f'{name}="{Metrics.escape(value)}"'
+                            for name, value in items)
+        return f"{{{rendered}}}"
+
+    def render(self):
+        """
+        Render all metrics
+        :return: text exposition format (str)
+        """
+        lines = []
+        for name, series in self.values.items():
+            kind, help_text = self.DESCRIPTIONS.get(name, ("untyped", name))
+            full_name = f"{self.namespace}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in series.items():
+                if kind != "histogram":
+                    lines.append(f"{full_name}"
+                                 f"{self.format_labels(labels)} {value}")
+                    continue
+                buckets, total, count = value
+                # buckets are cumulative, +Inf holds every observation
+                for bound, bucket in zip(self.BUCKETS + ("+Inf",),
+                                         buckets + [count]):
+                    bucket_labels = self.format_labels(labels,
+                                                       (("le", bound),))
+                    lines.append(f"{full_name}_bucket{bucket_labels} "
+                                 f"{bucket}")
+                lines.append(f"{full_name}_sum"
+                             f"{self.format_labels(labels)} {total}")
+                lines.append(f"{full_name}_count"
+                             f"{self.format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
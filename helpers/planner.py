@@ -0,0 +1,96 @@
+import logging
+
+
+class ThreadPlanner:
+    """ Decides which message threads have to be fetched """
+
+    def __init__(self):
+        """
+        Instantiate class instance
+        """
+        # channel -> counters (dict)
+        self.counters = {}
+
+    def reset(self, channel: str):
+        """
+        Reset per-cycle counters of a channel
+        :param channel: slack channel id (str)
+        :return: counters (dict)
+        """
+        self.counters[channel] = {
+            "messages": 0,
+            "replies_calls": 0,
+            "saved_no_thread": 0,
+            "saved_unchanged": 0,
+            "saved_not_due": 0
+        }
+        return self.counters[channel]
+
+    @staticmethod
+    def has_thread(message: dict):
+        """
+        Check if top level message has replies. Messages
+        without a thread are fully described by the history payload
+        :param message: top level Slack message (dict)
+        :return: True or False (bool)
+        """
+        return message.get("reply_count", 0) > 0
+
+    @staticmethod
+    def thread_mark(message: dict):
+        """
+        Get thread activity marker listed in channel history
+        :param message: top level Slack message (dict)
+        :return: (latest_reply, reply_count) tuple
+        """
+        return message.get("latest_reply"), message.get("reply_count", 0)
+
+    def plan(self, channel: str, messages: list, state=None, poller=None):
+        """
+        Select threads to fetch, most recently active first.
+        Counters add up over the pages of a channel until reset
+        :param channel:  slack channel id (str)
+        :param messages: list of top level Slack messages (dict)
+        :param state:    helpers.state.ChannelState (cls)
+        :param poller:   helpers.poller.PollQueue (cls), unchanged
+                         threads are only fetched once due
+        :return: list of top level Slack messages (dict)
+        """
+        counters = self.counters.get(channel) or self.reset(channel)
+        counters["messages"] += len(messages)
+
+        fetch = []
+        for message in messages:
+            if not self.has_thread(message):
+                counters["saved_no_thread"] += 1
+            elif state and not state.thread_changed(channel, message):
+                counters["saved_unchanged"] += 1
+            elif not state and poller is not None and not poller.due(
+                    ("thread", channel, message["ts"]),
+                    self.thread_mark(message)):
+                counters["saved_not_due"] += 1
+            else:
+                fetch.append(message)
+
+        fetch.sort(key=lambda message: float(
+            message.get("latest_reply", message["ts"])), reverse=True)
+        counters["replies_calls"] += len(fetch)
+        return fetch
+
+    def log_counters(self, channel: str):
+        """
+        Log per-cycle counters of a channel and reset them
+        :param channel: slack channel id (str)
+        :return: None
+        """
+        counters = self.counters.pop(channel, None)
+        if counters is None:
+            return
+        saved = counters["saved_no_thread"] + counters["saved_unchanged"] + \
+            counters["saved_not_due"]
+        logging.info(f"conversations.replies calls: "
+                     f"{counters['replies_calls']} sent, "
+                     f"{saved} saved ({counters['saved_no_thread']} "
+                     f"without thread, {counters['saved_unchanged']} "
+                     f"unchanged, {counters['saved_not_due']} not due) "
+                     f"for {counters['messages']} messages in {channel}")
@@ -0,0 +1,152 @@
+import heapq
+import logging
+import time
+
+
+class PollQueue:
+    """ Next check times of watched channels, threads and pull requests.
+    Items with recent activity are checked again soon, quiet ones back
+    off exponentially up to max_interval """
+
+    def __init__(self, min_interval: float = 30, max_interval: float = 600,
+                 backoff: float = 2.0, age_ratio: float = 0.1,
+                 clock=time.monotonic):
+        """
+        Instantiate class instance
+        :param min_interval: seconds between checks of hot items (float)
+        :param max_interval: max seconds between checks (float)
+        :param backoff:      interval multiplier of quiet items (float)
+        :param age_ratio:    min interval as a share of item age (float)
+        :param clock:        monotonic clock function, returns seconds
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.age_ratio = age_ratio
+        self.clock = clock
+        # item -> [due time (float), interval (float), fingerprint]
+        self.entries = {}
+        # (due time, sequence, item), outdated entries are skipped
+        self.heap = []
+        self.sequence = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clamp(self, interval: float, max_interval: float = None):
+        """
+        Bound interval by min and max interval
+        :param interval:     seconds (float)
+        :param max_interval: max interval override (float)
+        :return: seconds (float)
+        """
+        max_interval = max_interval if max_interval else self.max_interval
+        return min(max(interval, self.min_interval), max_interval)
+
+    def due(self, item: tuple, fingerprint=None):
+        """
+        Check if an item has to be checked now
+        :param item:        e.g. ("pull", key) (tuple)
+        :param fingerprint: activity visible without a check, e.g.
+                            thread latest_reply, compared if set
+        :return: True if unknown, changed or due (bool)
+        """
+        entry = self.entries.get(item)
+        if entry is None:
+            return True
+        if fingerprint is not None and fingerprint != entry[2]:
+            return True
+        return entry[0] <= self.clock()
+
+    def touch(self, item: tuple):
+        """
+        Make a known item due now, e.g. once a new message links it
+        :param item: e.g. ("pull", key) (tuple)
+        :return: None
+        """
+        entry = self.entries.get(item)
+        if entry is not None:
+            self.push(item, self.clock(), self.min_interval, entry[2])
+
+    def update(self, item: tuple, fingerprint, age: float = 0.0,
+               max_interval: float = None):
+        """
+        Schedule next check of an item after checking it. Changed items
+        are hot, unchanged ones back off, new ones start from their age
+        :param item:         e.g. ("pull", key) (tuple)
+        :param fingerprint:  activity marker, e.g. latest review time
+        :param age:          seconds since the item was created (float)
+        :param max_interval: max interval override of the item (float)
+        :return: seconds until the next check (float)
+        """
+        entry = self.entries.get(item)
+        floor = age * self.age_ratio
+        if entry is None:
+            interval = self.clamp(floor, max_interval)
+        elif fingerprint != entry[2]:
+            interval = self.min_interval
+        else:
+            interval = self.clamp(max(entry[1] * self.backoff, floor),
+                                  max_interval)
+        self.push(item, self.clock() + interval, interval, fingerprint)
+        return interval
+
+    def push(self, item: tuple, due: float, interval: float, fingerprint):
+        """
+        Store item schedule
+        :param item:        e.g. ("pull", key) (tuple)
+        :param due:         next check time (float)
+        :param interval:    seconds between checks (float)
+        :param fingerprint: activity marker
+        :return: None
+        """
+        self.entries[item] = [due, interval, fingerprint]
+        self.sequence += 1
+        heapq.heappush(self.heap, (due, self.sequence, item))
+
+    def discard(self, item: tuple):
+        """
+        Stop watching an item
+        :param item: e.g. ("pull", key) (tuple)
+        :return: None
+        """
+        self.entries.pop(item, None)
+
+    def retain(self, prefix: tuple, items: set):
+        """
+        Stop watching items with a prefix which are not in items,
+        e.g. threads of a channel which left the time window
+        :param prefix: item prefix, e.g. ("thread", channel) (tuple)
+        :param items:  items to keep (set of tuple)
+        :return: None
+        """
+        for item in [item for item in self.entries
+                     if item[:len(prefix)] == prefix and item not in items]:
+            del self.entries[item]
+
+    def next_due(self):
+        """
+        Get time of the next due check, dropping outdated heap entries
+        :return: due time (float) or None if nothing is watched
+        """
+        while self.heap:
+            due, _, item = self.heap[0]
+            entry = self.entries.get(item)
+            if entry is not None and entry[0] == due:
+                return due
+            heapq.heappop(self.heap)
+        return None
+
+    def log_stats(self):
+        """
+        Log watched items and the next check
+        :return: None
+        """
+        kinds = {}
+        for item in self.entries:
+            kinds[item[0]] = kinds.get(item[0], 0) + 1
+        next_due = self.next_due()
+        wait = max(next_due - self.clock(), 0) \
+            if next_due is not None else None
+        logging.info(f"poll queue: {kinds or 'empty'}, next check in "
+                     f"{'-' if wait is None else f'{wait:.0f}s'}")
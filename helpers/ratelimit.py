@@ -0,0 +1,206 @@
+from datetime import datetime
+import asyncio
+import logging
+import time
+
+
+class RateLimitTracker:
+    """ Local GitHub rate limit budget estimate based on response headers """
+
+    HEADERS = {
+        "limit": "X-RateLimit-Limit",
+        "remaining": "X-RateLimit-Remaining",
+        "used": "X-RateLimit-Used",
+        "reset": "X-RateLimit-Reset"
+    }
+
+    def __init__(self):
+        """
+        Instantiate class instance
+        """
+        # resource (core, graphql, ...) -> budget (dict)
+        self.budgets = {}
+
+    def update(self, headers):
+        """
+        Update budget from api response headers
+        see https://docs.github.com/en/rest/overview/resources-in-the-rest-api#rate-limiting
+        :param headers: response headers (mapping)
+        :return: None
+        """
+        if self.HEADERS["remaining"] not in headers:
+            return
+        resource = headers.get("X-RateLimit-Resource", "core")
+        budget = {key: int(headers.get(header, 0))
+                  for key, header in self.HEADERS.items()}
+        self.budgets[resource] = budget
+        logging.debug(f"api quota {resource}: {budget}")
+
+    def reserve(self, resource: str = "core"):
+        """
+        Take a single request from the local budget estimate
+        :param resource: rate limit resource (str)
+        :return: 0 if budget is available, otherwise
+                 reset timestamp to wait for (float)
+        """
+        budget = self.budgets.get(resource)
+        if budget is None:
+            return 0
+        if budget["remaining"] <= 0:
+            if budget["reset"] > time.time():
+                return float(budget["reset"])
+            # reset time passed, next response refreshes the estimate
+            del self.budgets[resource]
+            return 0
+        budget["remaining"] -= 1
+        budget["used"] += 1
+        return 0
+
+    def budget(self, resource: str = "core"):
+        """
+        Get current budget estimate
+        :param resource: rate limit resource (str)
+        :return: budget (dict) or None if unknown yet
+        """
+        return self.budgets.get(resource)
+
+    def log_budget(self):
+        """
+        Log current budget estimates
+        :return: None
+        """
+        for resource, budget in self.budgets.items():
+            reset_time = datetime.fromtimestamp(budget["reset"])
+            logging.info(f"api quota {resource}: {budget['remaining']} "
+                         f"of {budget['limit']} remaining, "
+                         f"{budget['used']} used, reset at {reset_time}")
+
+
+class TokenBucket:
+    """ Async token bucket, waiters are served in arrival order """
+
+    def __init__(self, rate: float, capacity: float,
+                 clock=time.monotonic, sleep=asyncio.sleep):
+        """
+        Instantiate class instance
+        :param rate:     tokens added per second (float)
+        :param capacity: max burst size (float)
+        :param clock:    monotonic clock function, returns seconds
+        :param sleep:    coroutine function sleeping for seconds
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        # tokens accrue from this time on, in the future while paused
+        self.updated = clock()
+        # total seconds pauses delayed the bucket, waiters sleeping
+        # through a pause are delayed by the same amount
+        self.shift = 0.0
+
+    def refill(self):
+        """
+        Add tokens accumulated since the last update
+        :return: current time (float)
+        """
+        now = self.clock()
+        if now > self.updated:
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        return now
+
+    async def acquire(self):
+        """
+        Take a token, waiting until it is available. Tokens are
+        reserved up front so concurrent waiters do not race
+        :return: seconds waited (float)
+        """
+        now = self.refill()
+        self.tokens -= 1
+        wait = max(self.updated - now, 0) + max(-self.tokens / self.rate, 0)
+        shift = self.shift
+        if wait > 0:
+            await self.sleep(wait)
+        # paused while waiting, the reserved slot moved with the pause
+        while self.shift > shift:
+            extra, shift = self.shift - shift, self.shift
+            wait += extra
+            await self.sleep(extra)
+        return wait
+
+    def pause(self, seconds: float):
+        """
+        Stop handing out tokens, e.g. after a Retry-After response.
+        No tokens accrue while paused and reserved slots move
+        past the pause
+        :param seconds: pause duration in seconds (float)
+        :return: None
+        """
+        now = self.refill()
+        paused_until = max(self.updated, now + seconds)
+        self.shift += paused_until - self.updated
+        self.updated = paused_until
+        self.tokens = min(self.tokens, 0)
+
+
+class TierLimiter:
+    """ Client-side Slack rate limiter with a bucket per workspace method """
+
+    # requests per minute, see https://api.slack.com/docs/rate-limits#tiers
+    TIER_RATES = {1: 1, 2: 20, 3: 50, 4: 100}
+
+    def __init__(self, burst: float = 2.0, rates: dict = None,
+                 clock=time.monotonic, sleep=asyncio.sleep):
+        """
+        Instantiate class instance
+        :param burst: seconds worth of requests allowed in a burst (float)
+        :param rates: requests per minute per tier (dict),
+                      defaults to TierLimiter.TIER_RATES
+        :param clock: monotonic clock function, returns seconds
+        :param sleep: coroutine function sleeping for seconds
+        """
+        self.burst = burst
+        self.rates = rates if rates else self.TIER_RATES
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {}
+
+    def bucket(self, service: str, tier: int):
+        """
+        Get (or create) bucket of a workspace method
+        :param service: workspace method, e.g. slack:0:reactions.add (str)
+        :param tier:    Slack rate limit tier (int)
+        :return: TokenBucket
+        """
+        if service not in self.buckets:
+            # burst and refill together stay within the per minute limit
+            limit = self.rates[tier]
+            capacity = max(1.0, limit * self.burst / 60)
+            rate = max(limit - capacity, 1.0) / 60
+            self.buckets[service] = TokenBucket(rate, capacity,
+                                                self.clock, self.sleep)
+        return self.buckets[service]
+
+    async def acquire(self, service: str, tier: int):
+        """
+        Wait for a request slot of a workspace method
+        :param service: workspace method, e.g. slack:0:reactions.add (str)
+        :param tier:    Slack rate limit tier (int)
+        :return: None
+        """
+        wait = await self.bucket(service, tier).acquire()
+        if wait:
+            logging.debug(f"{service} throttled for {wait:.2f}s")
+
+    def pause(self, service: str, tier: int, seconds: float):
+        """
+        Pause a workspace method after Slack rate limited a request
+        :param service: workspace method, e.g. slack:0:reactions.add (str)
+        :param tier:    Slack rate limit tier (int)
+        :param seconds: Retry-After seconds (float)
+        :return: None
+        """
+        logging.warning(f"{service} rate limited, pausing for {seconds}s")
+        self.bucket(service, tier).pause(seconds)
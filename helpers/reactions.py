@@ -0,0 +1,93 @@
+from collections import OrderedDict
+import logging
+
+
+class ReactionWriter:
+    """ Collects reaction writes of a cycle and sends each one once """
+
+    def __init__(self, reaction: str, max_sent: int = 4096):
+        """
+        Instantiate class instance
+        :param reaction: Slack reaction marking approved messages (str)
+        :param max_sent: max number of remembered sent writes (int)
+        """
+        self.reaction = reaction
+        self.max_sent = max_sent
+        # (channel, ts, reaction) -> SlackMessage, in decision order
+        self.queue = OrderedDict()
+        # (channel, ts, reaction) of recently sent writes
+        self.sent = OrderedDict()
+        self.counters = {}
+        self.reset()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def reset(self):
+        """
+        Reset per-cycle counters
+        :return: None
+        """
+        self.counters = {
+            "queued": 0,
+            "sent": 0,
+            "failed": 0,
+            "avoided_duplicate": 0,
+            "avoided_reacted": 0
+        }
+
+    def add(self, channel: str, message):
+        """
+        Queue reaction to a message unless it already has it
+        or the same write is queued or was sent before
+        :param channel: slack channel id (str)
+        :param message: helpers.slack.SlackMessage (cls)
+        :return: True if write was queued (bool)
+        """
+        key = (channel, message.timestamp, self.reaction)
+        if message.is_approved:
+            self.counters["avoided_reacted"] += 1
+            return False
+        if key in self.queue or key in self.sent:
+            self.counters["avoided_duplicate"] += 1
+            return False
+        self.queue[key] = message
+        self.counters["queued"] += 1
+        return True
+
+    def drain(self):
+        """
+        Take all queued writes
+        :return: list of ((channel, ts, reaction), SlackMessage) tuples
+        """
+        writes = list(self.queue.items())
+        self.queue.clear()
+        return writes
+
+    def done(self, key: tuple, result: bool):
+        """
+        Record result of a write
+        :param key:    (channel, ts, reaction) tuple
+        :param result: True if reaction is on the message (bool)
+        :return: None
+        """
+        if not result:
+            self.counters["failed"] += 1
+            return
+        self.counters["sent"] += 1
+        self.sent[key] = True
+        self.sent.move_to_end(key)
+        while len(self.sent) > self.max_sent:
+            self.sent.popitem(last=False)
+
+    def log_counters(self):
+        """
+        Log writes sent and avoided since the last reset
+        :return: None
+        """
+        counters = self.counters
+        avoided = counters["avoided_duplicate"] + counters["avoided_reacted"]
+        logging.info(f"reaction writes: {counters['sent']} sent, "
+                     f"{counters['failed']} failed, {avoided} avoided "
+                     f"({counters['avoided_reacted']} already reacted, "
+                     f"{counters['avoided_duplicate']} duplicates)")
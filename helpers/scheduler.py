@@ -0,0 +1,51 @@
+import asyncio
+import logging
+
+
+class Scheduler:
+    """ Bounded concurrency scheduler for API calls """
+
+    def __init__(self, limits: dict):
+        """
+        Instantiate class instance. Has to be created
+        from within a running event loop
+        :param limits: max concurrent calls per service (dict),
+                       e.g. {"slack": 4, "github": 8}. Services
+                       like "slack:0:tier3" get their own limit
+                       of the "slack" prefix
+        """
+        self.limits = limits
+        self.semaphores = {service: asyncio.Semaphore(limit)
+                           for service, limit in limits.items()}
+        logging.info(f"scheduler concurrency limits: {limits}")
+
+    def semaphore(self, service: str):
+        """
+        Get (or create) service semaphore
+        :param service: service name, e.g. "slack:0:tier3" (str)
+        :return: asyncio.Semaphore
+        """
+        if service not in self.semaphores:
+            limit = self.limits[service.split(":")[0]]
+            self.semaphores[service] = asyncio.Semaphore(limit)
+        return self.semaphores[service]
+
+    async def run(self, service: str, coro):
+        """
+        Run a single coroutine within service concurrency limit
+        :param service: service name, e.g. "slack" (str)
+        :param coro:    coroutine to await
+        :return: coroutine result
+        """
+        async with self.semaphore(service):
+            return await coro
+
+    async def gather(self, service: str, coros):
+        """
+        Fan out coroutines within service concurrency limit
+        :param service: service name, e.g. "slack" (str)
+        :param coros:   iterable of coroutines
+        :return: list of coroutine results (in order)
+        """
+        return await asyncio.gather(*(self.run(service, coro)
+                                      for coro in coros))
@@ -0,0 +1,270 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+
+class LeaseBackend:
+    """ Replica leases shared by all replicas, replicas which stop
+    renewing their lease drop out once it expires """
+
+    def renew(self, replica: str, ttl: float):
+        """
+        Create or extend a replica lease
+        :param replica: replica id (str)
+        :param ttl:     lease duration in seconds (float)
+        :return: None
+        """
+        raise NotImplementedError
+
+    def release(self, replica: str):
+        """
+        Drop a replica lease, e.g. on shutdown
+        :param replica: replica id (str)
+        :return: None
+        """
+        raise NotImplementedError
+
+    def members(self):
+        """
+        Get replicas holding a valid lease
+        :return: replica ids (set of str)
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release backend resources
+        :return: None
+        """
+
+
+class FileLeases(LeaseBackend):
+    """ Leases as files in a directory shared by all replicas,
+    one file per replica holding the lease expiry time """
+
+    def __init__(self, path: str):
+        """
+        Instantiate class instance
+        :param path: shared lease directory path (str)
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def lease_path(self, replica: str):
+        """
+        Build lease file path
+        :param replica: replica id (str)
+        :return: path (str)
+        """
+        return os.path.join(self.path, f"{replica}.lease")
+
+    def renew(self, replica: str, ttl: float):
+        """
+        Atomically write lease expiry time
+        :param replica: replica id (str)
+        :param ttl:     lease duration in seconds (float)
+        :return: None
+        """
+        path = self.lease_path(replica)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as lease_file:
+            json.dump({"replica": replica,
+                       "expires": time.time() + ttl}, lease_file)
+        os.replace(tmp_path, path)
+
+    def release(self, replica: str):
+        """
+        Remove lease file
+        :param replica: replica id (str)
+        :return: None
+        """
+        try:
+            os.remove(self.lease_path(replica))
+        except FileNotFoundError:
+            pass
+
+    def members(self):
+        """
+        Read lease files which did not expire
+        :return: replica ids (set of str)
+        """
+        now = time.time()
+        members = set()
+        for name in os.listdir(self.path):
+            if not name.endswith(".lease"):
+                continue
+            try:
+                with open(os.path.join(self.path, name)) as lease_file:
+                    lease = json.load(lease_file)
+            except (OSError, ValueError) as err:
+                # removed or replaced in the meantime
+                logging.debug(f"skipping lease file {name}: {err}")
+                continue
+            if lease["expires"] > now:
+                members.add(lease["replica"])
+        return members
+
+
+class SQLiteLeases(LeaseBackend):
+    """ Leases in a SQLite database shared by all replicas """
+
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS leases "
+              "(replica TEXT PRIMARY KEY, expires REAL)")
+
+    def __init__(self, path: str):
+        """
+        Instantiate class instance
+        :param path: shared SQLite database path (str)
+        """
+        # waits for concurrent writes of other replicas
+        self.db = sqlite3.connect(path, timeout=10)
+        with self.db:
+            self.db.execute(self.SCHEMA)
+
+    def renew(self, replica: str, ttl: float):
+        """
+        Write lease expiry time, dropping expired leases
+        :param replica: replica id (str)
+        :param ttl:     lease duration in seconds (float)
+        :return: None
+        """
+        now = time.time()
+        with self.db:
+            self.db.execute("DELETE FROM leases WHERE expires <= ?", (now,))
+            self.db.execute("INSERT OR REPLACE INTO leases VALUES (?, ?)",
+                            (replica, now + ttl))
+
+    def release(self, replica: str):
+        """
+        Delete lease
+        :param replica: replica id (str)
+        :return: None
+        """
+        with self.db:
+            self.db.execute("DELETE FROM leases WHERE replica = ?",
+                            (replica,))
+
+    def members(self):
+        """
+        Select leases which did not expire
+        :return: replica ids (set of str)
+        """
+        return {replica for replica, in self.db.execute(
+            "SELECT replica FROM leases WHERE expires > ?", (time.time(),))}
+
+    def close(self):
+        """
+        Close database connection
+        :return: None
+        """
+        self.db.close()
+
+
+class HashRing:
+    """ Consistent hash ring, a replica joining or leaving moves
+    only the keys of its own ring points """
+
+    def __init__(self, replicas: set = (), points: int = 64):
+        """
+        Instantiate class instance
+        :param replicas: replica ids (set of str)
+        :param points:   ring points per replica (int)
+        """
+        self.replicas = set(replicas)
+        self.ring = sorted((self.hash(f"{replica}#{point}"), replica)
+                           for replica in self.replicas
+                           for point in range(points))
+        self.hashes = [point for point, _ in self.ring]
+
+    @staticmethod
+    def hash(key: str):
+        """
+        Hash a key onto the ring, stable across processes
+        :param key: key (str)
+        :return: ring position (int)
+        """
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def owner(self, key: str):
+        """
+        Get replica owning a key, the next ring point clockwise
+        :param key: key (str)
+        :return: replica id (str) or None if the ring is empty
+        """
+        if not self.ring:
+            return None
+        index = bisect.bisect(self.hashes, self.hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+
+class Sharding:
+    """ Splits message threads across replicas by consistent hashing
+    of live replica leases, rebalancing when replicas join or die """
+
+    def __init__(self, backend: LeaseBackend, replica: str,
+                 ttl: float = 60):
+        """
+        Instantiate class instance
+        :param backend: instance of LeaseBackend cls
+        :param replica: id of this replica (str)
+        :param ttl:     lease duration in seconds, leases are
+                        renewed every third of it (float)
+        """
+        self.backend = backend
+        self.replica = replica
+        self.ttl = ttl
+        # a replica owns everything until it sees the others
+        self.ring = HashRing({replica})
+
+    @property
+    def replicas(self):
+        """
+        Get live replicas
+        :return: replica ids (set of str)
+        """
+        return self.ring.replicas
+
+    def refresh(self):
+        """
+        Renew own lease and rebuild the ring if replicas changed.
+        Keeps the current ring if the backend is not available
+        :return: True if shards were rebalanced (bool)
+        """
+        try:
+            self.backend.renew(self.replica, self.ttl)
+            replicas = self.backend.members() | {self.replica}
+        except (OSError, sqlite3.Error) as err:
+            logging.error(f"error renewing replica lease: {err}")
+            return False
+        if replicas == self.ring.replicas:
+            return False
+        joined = replicas - self.ring.replicas
+        left = self.ring.replicas - replicas
+        self.ring = HashRing(replicas)
+        logging.info(f"rebalanced shards of {len(replicas)} replicas, "
+                     f"joined: {sorted(joined)}, left: {sorted(left)}")
+        return True
+
+    def owns(self, channel: str, ts: str):
+        """
+        Check if this replica handles a thread
+        :param channel: slack channel id (str)
+        :param ts:      top level message timestamp (str)
+        :return: True or False (bool)
+        """
+        return self.ring.owner(f"{channel}/{ts}") == self.replica
+
+    def release(self):
+        """
+        Drop own lease, the others take over its shards right away
+        :return: None
+        """
+        try:
+            self.backend.release(self.replica)
+        except (OSError, sqlite3.Error) as err:
+            logging.error(f"error releasing replica lease: {err}")
+        self.backend.close()
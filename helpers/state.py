@@ -0,0 +1,373 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+
+
+class ChannelState:
+    """ Persisted scan cursors, thread markers, reacted messages
+    and final pull request states, JSON file backend """
+
+    # raw message keys required to rebuild a SlackMessage
+    MESSAGE_KEYS = ("ts", "thread_ts", "text", "blocks", "reactions")
+
+    def __init__(self, path: str):
+        """
+        Instantiate class instance
+        :param path: local state file path (str)
+        """
+        self.path = path
+        # "owner/repo/number" -> {"state": dict, "updated": float}
+        self.pulls = {}
+        # channels and pull requests changed since the last save
+        self.dirty = set()
+        self.dirty_pulls = set()
+        self.channels = self.load()
+
+    def load(self):
+        """
+        Load state from disk
+        :return: channels state (dict)
+        """
+        if not os.path.exists(self.path):
+            logging.info(f"no state file found at {self.path}")
+            return {}
+        try:
+            with open(self.path) as state_file:
+                data = json.load(state_file)
+        except (OSError, ValueError) as err:
+            logging.error(f"error loading state file: {err}")
+            return {}
+        if "channels" not in data:
+            # state files written before pull request states were kept
+            data = {"channels": data}
+        self.pulls = data.get("pulls", {})
+        channels = data["channels"]
+        for channel in channels.values():
+            channel.setdefault("reacted", {})
+        logging.info(f"loaded state of {len(channels)} channels "
+                     f"and {len(self.pulls)} pull requests")
+        return channels
+
+    def save(self):
+        """
+        Atomically write state to disk
+        :return: None
+        """
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as state_file:
+                json.dump({"channels": self.channels,
+                           "pulls": self.pulls}, state_file)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            logging.error(f"error saving state file: {err}")
+            return
+        self.dirty.clear()
+        self.dirty_pulls.clear()
+
+    def close(self):
+        """
+        Release backend resources
+        :return: None
+        """
+
+    def channel(self, channel: str):
+        """
+        Get (or create) channel state
+        :param channel: slack channel id (str)
+        :return: channel state (dict)
+        """
+        return self.channels.setdefault(channel, {"latest_ts": None,
+                                                  "threads": {},
+                                                  "reacted": {}})
+
+    def advance(self, channel: str, messages: list):
+        """
+        Move channel high-water mark to the newest message
+        :param channel:  slack channel id (str)
+        :param messages: list of top level Slack messages (dict)
+        :return: number of messages newer than the previous mark (int)
+        """
+        state = self.channel(channel)
+        latest_ts = state["latest_ts"]
+        new = [message["ts"] for message in messages
+               if latest_ts is None or
+               float(message["ts"]) > float(latest_ts)]
+        if new:
+            state["latest_ts"] = max(new, key=float)
+            self.dirty.add(channel)
+        return len(new)
+
+    def thread_changed(self, channel: str, message: dict):
+        """
+        Check if message thread is new or got new replies
+        :param channel: slack channel id (str)
+        :param message: top level Slack message (dict)
+        :return: True if thread has to be re-fetched (bool)
+        """
+        thread = self.channel(channel)["threads"].get(message["ts"])
+        if thread is None:
+            return True
+        return (thread["latest_reply"] != message.get("latest_reply") or
+                thread["reply_count"] != message.get("reply_count", 0))
+
+    def update_thread(self, channel: str, message: dict, replies: list):
+        """
+        Record thread markers and replies still awaiting approval
+        :param channel: slack channel id (str)
+        :param message: top level Slack message (dict)
+        :param replies: list of raw Slack replies (dict)
+        :return: None
+        """
+        self.channel(channel)["threads"][message["ts"]] = {
+            "latest_reply": message.get("latest_reply"),
+            "reply_count": message.get("reply_count", 0),
+            "replies": {reply["ts"]: {key: reply[key]
+                                      for key in self.MESSAGE_KEYS
+                                      if key in reply}
+                        for reply in replies}
+        }
+        self.dirty.add(channel)
+
+    def thread_replies(self, channel: str, ts: str):
+        """
+        Get stored replies of an unchanged thread
+        :param channel: slack channel id (str)
+        :param ts:      top level message timestamp (str)
+        :return: list of raw Slack replies (dict)
+        """
+        thread = self.channel(channel)["threads"].get(ts, {})
+        return list(thread.get("replies", {}).values())
+
+    def mark_reacted(self, channel: str, ts: str):
+        """
+        Record a message got the reaction, it is not parsed again
+        :param channel: slack channel id (str)
+        :param ts:      message timestamp (str)
+        :return: None
+        """
+        state = self.channel(channel)
+        state["reacted"][ts] = True
+        for thread in state["threads"].values():
+            thread["replies"].pop(ts, None)
+        self.dirty.add(channel)
+
+    def is_reacted(self, channel: str, ts: str):
+        """
+        Check if a message got the reaction before
+        :param channel: slack channel id (str)
+        :param ts:      message timestamp (str)
+        :return: True or False (bool)
+        """
+        return ts in self.channel(channel)["reacted"]
+
+    @staticmethod
+    def pull_id(key: tuple):
+        """
+        Build pull request state id
+        :param key: (owner, repo, number) tuple
+        :return: id (str)
+        """
+        return "/".join(str(part) for part in key)
+
+    def pull_states(self):
+        """
+        Get stored final pull request states, e.g. to warm a cache
+        :return: dict of (owner, repo, number) key: state (dict)
+        """
+        states = {}
+        for pull_id, entry in self.pulls.items():
+            owner, repo, number = pull_id.rsplit("/", 2)
+            states[(owner, repo, int(number))] = entry["state"]
+        return states
+
+    def store_pull(self, key: tuple, state: dict):
+        """
+        Record final pull request state
+        :param key:   (owner, repo, number) tuple
+        :param state: pull request state (dict)
+        :return: None
+        """
+        pull_id = self.pull_id(key)
+        self.pulls[pull_id] = {"state": state, "updated": time.time()}
+        self.dirty_pulls.add(pull_id)
+
+    def drop_pull(self, key: tuple):
+        """
+        Forget pull request state, e.g. after a new push
+        :param key: (owner, repo, number) tuple
+        :return: None
+        """
+        pull_id = self.pull_id(key)
+        if self.pulls.pop(pull_id, None) is not None:
+            self.dirty_pulls.add(pull_id)
+
+    def compact(self, oldest_ts: str):
+        """
+        Drop threads, reacted messages and pull request
+        states which left the look back window
+        :param oldest_ts: oldest timestamp of the window (str)
+        :return: None
+        """
+        oldest = float(oldest_ts)
+        for channel, state in self.channels.items():
+            for entries in (state["threads"], state["reacted"]):
+                expired = [ts for ts in entries if float(ts) < oldest]
+                for ts in expired:
+                    del entries[ts]
+                if expired:
+                    self.dirty.add(channel)
+        for pull_id in [pull_id for pull_id, entry in self.pulls.items()
+                        if entry["updated"] < oldest]:
+            del self.pulls[pull_id]
+            self.dirty_pulls.add(pull_id)
+
+
+class SQLiteState(ChannelState):
+    """ Channel state persisted to a local SQLite database,
+    saves only write channels and pull requests which changed """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS channels "
+        "(channel TEXT PRIMARY KEY, latest_ts TEXT)",
+        "CREATE TABLE IF NOT EXISTS threads "
+        "(channel TEXT, ts TEXT, latest_reply TEXT, reply_count INTEGER, "
+        "replies TEXT, PRIMARY KEY (channel, ts))",
+        "CREATE TABLE IF NOT EXISTS reacted "
+        "(channel TEXT, ts TEXT, PRIMARY KEY (channel, ts))",
+        "CREATE TABLE IF NOT EXISTS pulls "
+        "(pull_id TEXT PRIMARY KEY, state TEXT, head_sha TEXT, "
+        "updated REAL)"
+    )
+
+    @staticmethod
+    def is_json(path: str):
+        """
+        Check if a state file was written by the JSON backend
+        :param path: state file path (str)
+        :return: True or False (bool)
+        """
+        try:
+            with open(path, "rb") as state_file:
+                return state_file.read(64).lstrip()[:1] == b"{"
+        except OSError:
+            return False
+
+    def __init__(self, path: str):
+        """
+        Instantiate class instance
+        :param path: local SQLite database path (str)
+        """
+        self.db = sqlite3.connect(path)
+        with self.db:
+            for statement in self.SCHEMA:
+                self.db.execute(statement)
+        super().__init__(path)
+
+    def load(self):
+        """
+        Load state from the database
+        :return: channels state (dict)
+        """
+        channels = {}
+        try:
+            for channel, latest_ts in self.db.execute(
+                    "SELECT channel, latest_ts FROM channels"):
+                self.channel_entry(channels, channel)["latest_ts"] = \
+                    latest_ts
+            for channel, ts, latest_reply, reply_count, replies in \
+                    self.db.execute("SELECT channel, ts, latest_reply, "
+                                    "reply_count, replies FROM threads"):
+                self.channel_entry(channels, channel)["threads"][ts] = {
+                    "latest_reply": latest_reply,
+                    "reply_count": reply_count,
+                    "replies": json.loads(replies)
+                }
+            for channel, ts in self.db.execute(
+                    "SELECT channel, ts FROM reacted"):
+                self.channel_entry(channels, channel)["reacted"][ts] = True
+            for pull_id, state, updated in self.db.execute(
+                    "SELECT pull_id, state, updated FROM pulls"):
+                self.pulls[pull_id] = {"state": json.loads(state),
+                                       "updated": updated}
+        except (sqlite3.Error, ValueError) as err:
+            logging.error(f"error loading state database: {err}")
+            self.pulls = {}
+            return {}
+        logging.info(f"loaded state of {len(channels)} channels "
+                     f"and {len(self.pulls)} pull requests")
+        return channels
+
+    @staticmethod
+    def channel_entry(channels: dict, channel: str):
+        """
+        Get (or create) channel entry while loading
+        :param channels: channels state (dict)
+        :param channel:  slack channel id (str)
+        :return: channel state (dict)
+        """
+        return channels.setdefault(channel, {"latest_ts": None,
+                                             "threads": {},
+                                             "reacted": {}})
+
+    def save(self):
+        """
+        Write changed channels and pull requests in a single transaction
+        :return: None
+        """
+        try:
+            with self.db:
+                for channel in self.dirty:
+                    self.save_channel(channel)
+                for pull_id in self.dirty_pulls:
+                    self.save_pull(pull_id)
+        except sqlite3.Error as err:
+            logging.error(f"error saving state database: {err}")
+            return
+        logging.debug(f"saved state of {len(self.dirty)} channels and "
+                      f"{len(self.dirty_pulls)} pull requests")
+        self.dirty.clear()
+        self.dirty_pulls.clear()
+
+    def save_channel(self, channel: str):
+        """
+        Replace stored state of a channel
+        :param channel: slack channel id (str)
+        :return: None
+        """
+        state = self.channel(channel)
+        self.db.execute("INSERT OR REPLACE INTO channels VALUES (?, ?)",
+                        (channel, state["latest_ts"]))
+        self.db.execute("DELETE FROM threads WHERE channel = ?", (channel,))
+        self.db.executemany(
+            "INSERT INTO threads VALUES (?, ?, ?, ?, ?)",
+            [(channel, ts, thread["latest_reply"], thread["reply_count"],
+              json.dumps(thread["replies"]))
+             for ts, thread in state["threads"].items()])
+        self.db.execute("DELETE FROM reacted WHERE channel = ?", (channel,))
+        self.db.executemany("INSERT INTO reacted VALUES (?, ?)",
+                            [(channel, ts) for ts in state["reacted"]])
+
+    def save_pull(self, pull_id: str):
+        """
+        Replace (or delete) stored state of a pull request
+        :param pull_id: pull request state id (str)
+        :return: None
+        """
+        entry = self.pulls.get(pull_id)
+        if entry is None:
+            self.db.execute("DELETE FROM pulls WHERE pull_id = ?",
+                            (pull_id,))
+            return
+        self.db.execute("INSERT OR REPLACE INTO pulls VALUES (?, ?, ?, ?)",
+                        (pull_id, json.dumps(entry["state"]),
+                         entry["state"].get("head_sha"), entry["updated"]))
+
+    def close(self):
+        """
+        Close database connection
+        :return: None
+        """
+        self.db.close()
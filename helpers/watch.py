@@ -0,0 +1,90 @@
+import logging
+
+from .slack import SlackMessage
+
+
+class WatchSet:
+    """ Slack messages with pull requests awaiting approval """
+
+    def __init__(self, channel: str, reaction: str, index, sharding=None):
+        """
+        Instantiate class instance
+        :param channel:  slack channel id (str)
+        :param reaction: Slack reaction marking approved messages (str)
+        :param index:    helpers.index.PullRequestIndex (cls)
+                         holding the watched messages
+        :param sharding: helpers.shards.Sharding (cls), messages in
+                         threads of other replicas are ignored if set
+        """
+        self.channel = channel
+        self.reaction = reaction
+        self.index = index
+        self.sharding = sharding
+
+    def __len__(self):
+        return len(self.messages())
+
+    def messages(self):
+        """
+        Get watched messages
+        :return: list of SlackMessage
+        """
+        return [message for (channel, _), message
+                in self.index.messages.items()
+                if channel == self.channel]
+
+    def add(self, message: SlackMessage):
+        """
+        Watch message if it has pull requests awaiting approval
+        :param message: instance of SlackMessage cls
+        :return: True if message is watched (bool)
+        """
+        if not message.pending:
+            self.remove(message.timestamp)
+            return False
+        logging.info(f"watching message {message.timestamp}")
+        return self.index.add(self.channel, message)
+
+    def remove(self, ts: str):
+        """
+        Stop watching message
+        :param ts: message timestamp (str)
+        :return: None
+        """
+        self.index.discard(self.channel, ts)
+
+    def handle(self, event: dict):
+        """
+        Update watch set from a Slack event, see
+        https://api.slack.com/events/message and
+        https://api.slack.com/events/reaction_added
+        :param event: Slack event (dict)
+        :return: SlackMessage to check right away or None
+        """
+        event_type = event.get("type")
+        if event_type == "reaction_added":
+            item = event.get("item", {})
+            if item.get("channel") == self.channel and \
+                    event.get("reaction") == self.reaction:
+                self.remove(item.get("ts"))
+            return None
+
+        if event_type != "message" or event.get("channel") != self.channel:
+            return None
+
+        subtype = event.get("subtype")
+        if subtype == "message_deleted":
+            self.remove(event.get("deleted_ts"))
+            return None
+        if subtype == "message_changed":
+            event = event.get("message", {})
+        elif subtype not in (None, "thread_broadcast"):
+            return None
+
+        if "ts" not in event:
+            return None
+        message = SlackMessage(event, self.reaction)
+        if self.sharding is not None and not self.sharding.owns(
+                self.channel, message.thread_ts or message.timestamp):
+            return None
+        return message if self.add(message) else None
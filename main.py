@@ -1,12 +1,25 @@
+import functools
 import logging
 import asyncio
+import socket
+import sys
+import time
 
 import configargparse
 
-from clients import GitHubClient, SlackClient
-from helpers import PullRequest, SlackMessage
+import clients
+from clients import (GitHubClient, HTTPTransport, RecordingTransport,
+                     ReplayTransport, SlackClient)
+from helpers import (Cassette, ChannelState, Context, ErrorCounter,
+                     ETagStore, FileLeases, Metrics, PollQueue, PullRequest,
+                     PullRequestCache, PullRequestResolver, Scheduler,
+                     Sharding, SlackMessage, SQLiteLeases, SQLiteState,
+                     TierLimiter, WatchSet)
 import utils
 
+STATE_BACKENDS = {"json": ChannelState, "sqlite": SQLiteState}
+LEASE_BACKENDS = {"file": FileLeases, "sqlite": SQLiteLeases}
+
 
 def get_arguments():
     parser = configargparse.ArgParser()
@@ -45,84 +58,1025 @@ def get_arguments():
     parser.add_argument("-sp",
                         "--sleep_period",
                         action="store",
-                        type=bool,
+                        type=int,
                         required=True,
                         env_var="SLEEP_PERIOD")
+    parser.add_argument("-mi",
+                        "--min_poll_interval",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=30,
+                        env_var="MIN_POLL_INTERVAL")
+    parser.add_argument("-mx",
+                        "--max_poll_interval",
+                        action="store",
+                        type=int,
+                        required=False,
+                        env_var="MAX_POLL_INTERVAL")
+    parser.add_argument("-fp",
+                        "--fixed_polling",
+                        action="store_true",
+                        required=False,
+                        env_var="FIXED_POLLING")
+    parser.add_argument("-o",
+                        "--once",
+                        action="store_true",
+                        required=False,
+                        env_var="ONCE")
+    parser.add_argument("-sc",
+                        "--slack_concurrency",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=4,
+                        env_var="SLACK_CONCURRENCY")
+    parser.add_argument("-gc",
+                        "--github_concurrency",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=8,
+                        env_var="GITHUB_CONCURRENCY")
+    parser.add_argument("-ct",
+                        "--cache_ttl",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=300,
+                        env_var="CACHE_TTL")
+    parser.add_argument("-cs",
+                        "--cache_size",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=1024,
+                        env_var="CACHE_SIZE")
+    parser.add_argument("-sf",
+                        "--state_file",
+                        action="store",
+                        type=str,
+                        required=False,
+                        env_var="STATE_FILE")
+    parser.add_argument("-sb",
+                        "--state_backend",
+                        action="store",
+                        type=str,
+                        required=False,
+                        default="sqlite",
+                        choices=sorted(STATE_BACKENDS),
+                        env_var="STATE_BACKEND")
+    parser.add_argument("-gq",
+                        "--github_graphql",
+                        action="store_true",
+                        required=False,
+                        env_var="GITHUB_GRAPHQL")
+    parser.add_argument("-es",
+                        "--etag_size",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=2048,
+                        env_var="ETAG_SIZE")
+    parser.add_argument("-ef",
+                        "--etag_file",
+                        action="store",
+                        type=str,
+                        required=False,
+                        env_var="ETAG_FILE")
+    parser.add_argument("-em",
+                        "--event_mode",
+                        action="store_true",
+                        required=False,
+                        env_var="EVENT_MODE")
+    parser.add_argument("-at",
+                        "--slack_app_token",
+                        action="store",
+                        type=str,
+                        required=False,
+                        env_var="SLACK_APP_TOKEN")
+    parser.add_argument("-wp",
+                        "--webhook_port",
+                        action="store",
+                        type=int,
+                        required=False,
+                        env_var="WEBHOOK_PORT")
+    parser.add_argument("-ws",
+                        "--webhook_secret",
+                        action="store",
+                        type=str,
+                        required=False,
+                        env_var="WEBHOOK_SECRET")
+    parser.add_argument("-mp",
+                        "--metrics_port",
+                        action="store",
+                        type=int,
+                        required=False,
+                        env_var="METRICS_PORT")
+    parser.add_argument("-hp",
+                        "--http_pool_size",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=100,
+                        env_var="HTTP_POOL_SIZE")
+    parser.add_argument("-hc",
+                        "--http_connect_timeout",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=10,
+                        env_var="HTTP_CONNECT_TIMEOUT")
+    parser.add_argument("-ht",
+                        "--http_timeout",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=30,
+                        env_var="HTTP_TIMEOUT")
+    parser.add_argument("-hk",
+                        "--http_keepalive",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=60,
+                        env_var="HTTP_KEEPALIVE")
+    parser.add_argument("-rc",
+                        "--record",
+                        action="store",
+                        type=str,
+                        required=False,
+                        env_var="RECORD")
+    parser.add_argument("-rp",
+                        "--replay",
+                        action="store",
+                        type=str,
+                        required=False,
+                        env_var="REPLAY")
+    parser.add_argument("-rf",
+                        "--replay_fast",
+                        action="store_true",
+                        required=False,
+                        env_var="REPLAY_FAST")
+    parser.add_argument("-lp",
+                        "--lease_path",
+                        action="store",
+                        type=str,
+                        required=False,
+                        env_var="LEASE_PATH")
+    parser.add_argument("-lb",
+                        "--lease_backend",
+                        action="store",
+                        type=str,
+                        required=False,
+                        default="file",
+                        choices=sorted(LEASE_BACKENDS),
+                        env_var="LEASE_BACKEND")
+    parser.add_argument("-lt",
+                        "--lease_ttl",
+                        action="store",
+                        type=int,
+                        required=False,
+                        default=60,
+                        env_var="LEASE_TTL")
+    parser.add_argument("-ri",
+                        "--replica_id",
+                        action="store",
+                        type=str,
+                        required=False,
+                        default=socket.gethostname(),
+                        env_var="REPLICA_ID")
     parser.add_argument("-d",
                         "--debug",
                         action="store_true",
                         required=False,
                         env_var="DEBUG")
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.record and args.replay:
+        parser.error("--record can not be combined with --replay")
+    if args.once and args.event_mode:
+        parser.error("--once can not be combined with --event_mode")
+    if args.event_mode and not args.slack_app_token:
+        parser.error("--slack_app_token is required in event mode")
+    slack_tokens = args.slack_api_token.split(",")
+    try:
+        workspaces = {workspace for _, workspace
+                      in utils.SlackClient.parse_channels(args.channel_id)}
+    except ValueError:
+        parser.error("--channel_id workspace suffixes must be token "
+                     "indexes, e.g. C01,C02@1")
+    if any(not 0 <= workspace < len(slack_tokens)
+           for workspace in workspaces):
+        parser.error(f"--channel_id workspace suffixes must be below the "
+                     f"number of --slack_api_token tokens "
+                     f"({len(slack_tokens)})")
+    if args.slack_app_token and \
+            len(args.slack_app_token.split(",")) > len(slack_tokens):
+        parser.error("--slack_app_token has more tokens than "
+                     "--slack_api_token")
+    if args.webhook_port and not args.webhook_secret:
+        parser.error("--webhook_secret is required to receive webhooks")
+    if args.max_poll_interval is None:
+        # never check less often than the fixed polling loop
+        args.max_poll_interval = args.sleep_period * 60
+    return args
 
 
-async def process_message(args: configargparse,
-                          slack_client: SlackClient,
-                          github_client: GitHubClient,
+async def timed(context: Context, stage: str, coro):
+    """
+    Await a processing stage call, observing its duration
+    :param context: instance of Context cls
+    :param stage:   stage name, e.g. "history" (str)
+    :param coro:    coroutine to await
+    :return: coroutine result
+    """
+    with context.metrics.time("stage_duration_seconds", stage=stage):
+        return await coro
+
+
+async def process_message(context: Context, channel: str,
                           message: SlackMessage):
     """
-    Process a single Slack message:
-    - check if message is approved
-    - check if message has PRs
-    - check if all PRs were approved
-    - react to the message accordingly
-    :param args:          instance of configargparse
-    :param slack_client:  instance of SlackClient class
-    :param github_client: instance of GitHubClient cls
-    :param message:       instance of SlackMessage cls
-    :return:
+    Process a single Slack message and send its reaction right away
+    :param context: instance of Context cls
+    :param channel: slack channel id (str)
+    :param message: instance of SlackMessage cls
+    :return: True if message got the reaction (bool)
     """
-    if not message.is_approved and message.pull_reqs:
-        states = []
-        for pr_url in message.pull_reqs:
-            pull_request = PullRequest(github_client, pr_url)
-            states.append(pull_request.is_approved)
+    await check_messages(context, channel, [message])
+    reacted = await write_reactions(context)
+    return (channel, message.timestamp) in reacted
 
-            if all(state for state in states):
-                slack_client.add_message_reaction(
-                    args.channel_id,
-                    args.reaction_name,
-                    message.timestamp)
+
+async def resolve_pull_request(context: Context, key: tuple):
+    """
+    Load pull request approval through the cache
+    :param context: instance of Context cls
+    :param key:     (owner, repo, number) tuple
+    :return: True if approved, otherwise False (bool)
+    """
+    # a concurrent page may have stopped watching the pull request
+    pull_request = PullRequest(context.github_client,
+                               utils.GitClient.pr_url(key),
+                               context.cache)
+    return await timed(context, "resolve", pull_request.load())
 
 
-async def process_messages(args: configargparse, slack_client: SlackClient,
-                           github_client: GitHubClient):
+async def add_reaction(context: Context, channel: str,
+                       message: SlackMessage):
     """
-    Fetch all messages and process them
-    :param args:          instance of configargparse
-    :param slack_client:  instance of SlackClient class
-    :param github_client: instance of GitHubClient cls
-    :return:
+    React to a message within its workspace rate limits
+    :param context: instance of Context cls
+    :param channel: slack channel id (str)
+    :param message: instance of SlackMessage cls
+    :return: True if reaction was added (bool)
     """
-    sleep_period = args.sleep_period * 60
+    slack_client = context.slack(channel)
+    return await context.scheduler.run(
+        slack_client.service("reactions.add"),
+        timed(context, "react",
+              slack_client.add_message_reaction(channel,
+                                                context.writer.reaction,
+                                                message.timestamp)))
+
+
+def react_messages(context: Context, ready: list):
+    """
+    Queue reactions to messages without pending pull requests.
+    Writes are sent once per cycle by write_reactions, messages
+    stay indexed until their reaction was written
+    :param context: instance of Context cls
+    :param ready:   list of (channel, SlackMessage) tuples
+    :return: None
+    """
+    for channel, message in ready:
+        context.writer.add(channel, message)
+
+
+async def write_reactions(context: Context):
+    """
+    Send queued reaction writes through the per-workspace
+    reactions.add rate limits. Messages of failed writes stay
+    indexed, so they are checked and written again
+    :param context: instance of Context cls
+    :return: set of reacted (channel, ts) tuples
+    """
+    writes = context.writer.drain()
+    results = await asyncio.gather(*(add_reaction(context, channel, message)
+                                     for (channel, _, _), message in writes))
+
+    reacted = set()
+    for (key, message), result in zip(writes, results):
+        context.writer.done(key, result)
+        if result:
+            channel = key[0]
+            context.index.discard(channel, message.timestamp)
+            reacted.add((channel, message.timestamp))
+            if context.state:
+                context.state.mark_reacted(channel, message.timestamp)
+    return reacted
+
+
+async def update_pull_requests(context: Context, keys: list):
+    """
+    Resolve pull requests and re-evaluate only the messages
+    referencing them
+    :param context: instance of Context cls
+    :param keys:    list of (owner, repo, number) tuples
+    :return: None
+    """
+    states = await context.scheduler.gather(
+        "github", [resolve_pull_request(context, key) for key in keys])
+
+    ready = []
+    for key, approved in zip(keys, states):
+        ready.extend(context.index.update(key, approved))
+    ready = await confirm_ready(context, ready)
+    if context.poller is not None:
+        schedule_pull_requests(context, keys)
+    react_messages(context, ready)
+
+
+async def confirm_ready(context: Context, ready: list):
+    """
+    Re-check the other pull requests of messages about to get the
+    reaction, once their cached approval expired: it may have been
+    withdrawn by a push or a change request since
+    :param context: instance of Context cls
+    :param ready:   list of (channel, SlackMessage) tuples
+    :return: list of (channel, SlackMessage) tuples still ready
+    """
+    keys = {key for channel, message in ready
+            for key in context.index.keys.get((channel, message.timestamp),
+                                              ())}
+    stale = [key for key in sorted(keys)
+             if context.cache.lookup(key) is None]
+    if not stale:
+        return ready
+
+    states = await context.scheduler.gather(
+        "github", [resolve_pull_request(context, key) for key in stale])
+    for key, approved in zip(stale, states):
+        if not approved:
+            logging.info(f"pull request {key} is no longer approved")
+            context.index.update(key, False)
+    return [(channel, message) for channel, message in ready
+            if not context.index.pending.get((channel, message.timestamp))]
 
-    messages = slack_client.get_channel_messages(args.channel_id,
-                                                 args.time_window)
 
+async def resolve_pull_requests(context: Context, keys: list):
+    """
+    Resolve pull requests, in GraphQL batches if a resolver is set
+    :param context: instance of Context cls
+    :param keys:    list of (owner, repo, number) tuples
+    :return: None
+    """
+    if context.resolver:
+        pr_urls = [utils.GitClient.pr_url(key) for key in keys]
+        await context.scheduler.gather(
+            "github", [timed(context, "resolve_batch",
+                             context.resolver.resolve_batch(batch))
+                       for batch in context.resolver.batches(pr_urls)])
+
+    await update_pull_requests(context, keys)
+
+
+def due_pull_requests(context: Context, keys: list):
+    """
+    Select pull requests due for a check and expire their
+    cached states, so they are loaded again
+    :param context: instance of Context cls
+    :param keys:    list of (owner, repo, number) tuples
+    :return: list of (owner, repo, number) tuples
+    """
+    due = [key for key in keys if context.poller.due(("pull", key))]
+    for key in due:
+        context.cache.expire(key)
+    return due
+
+
+def schedule_pull_requests(context: Context, keys: list):
+    """
+    Schedule next checks of resolved pull requests: new reviews,
+    pushes or approval make them hot, quiet ones back off.
+    Final states are not polled again
+    :param context: instance of Context cls
+    :param keys:    list of (owner, repo, number) tuples
+    :return: None
+    """
+    for key in keys:
+        state = context.cache.lookup(key) or {}
+        if context.cache.is_final(state):
+            context.poller.discard(("pull", key))
+            continue
+        context.poller.update(("pull", key),
+                              (state.get("approved"), state.get("head_sha"),
+                               state.get("reviewed_at")),
+                              context.index.age(key))
+
+
+async def fetch_threads(context: Context, channel: str, messages: list):
+    """
+    Fetch message threads. Replies are only fetched for messages
+    with a thread; in incremental mode only for new threads and
+    threads with new replies, the rest is restored from the state
+    :param context:  instance of Context cls
+    :param channel:  slack channel id (str)
+    :param messages: list of top level Slack messages (dict)
+    :return: list of threads (list of SlackMessage)
+    """
+    args = context.args
+    state = context.state
+    slack_client = context.slack(channel)
+
+    # ts is a timestamp of an existing message with 0 or more replies.
+    # conversations.replies returns the parent message followed by
+    # replies, so messages without replies are used as they are.
+
+    fetch = context.planner.plan(channel, messages, state, context.poller)
+    replies = await context.scheduler.gather(
+        slack_client.service("conversations.replies"),
+        [timed(context, "replies",
+               slack_client.get_message_replies(channel, args.time_window,
+                                                 message["ts"]))
+         for message in fetch])
+
+    fetched = {}
+    for message, thread in zip(fetch, replies):
+        thread = parse_thread(context, channel, thread)
+        fetched[message["ts"]] = thread
+        if state:
+            pending = [reply.to_dict() for reply in thread
+                       if reply.timestamp != message["ts"] and
+                       reply.pending]
+            state.update_thread(channel, message, pending)
+        if context.poller is not None:
+            mark = context.planner.thread_mark(message)
+            context.poller.update(
+                ("thread", channel, message["ts"]), mark,
+                time.time() - float(mark[0] or message["ts"]))
+
+    # without a state, replies of threads which are not due yet
+    # are still indexed from the last fetch
+    indexed = context.index.replies(channel) \
+        if context.poller is not None and not state else {}
+    threads = []
     for message in messages:
+        if message["ts"] in fetched:
+            threads.append(fetched[message["ts"]])
+        else:
+            stored = state.thread_replies(channel,
+                                          message["ts"]) if state else []
+            threads.append(parse_thread(context, channel,
+                                        [message] + stored) +
+                           indexed.get(message["ts"], []))
+    return threads
+
+
+def parse_thread(context: Context, channel: str, thread: list):
+    """
+    Parse raw thread messages. Messages which got the
+    reaction in an earlier cycle are not parsed again
+    :param context: instance of Context cls
+    :param channel: slack channel id (str)
+    :param thread:  list of raw Slack messages (dict)
+    :return: list of SlackMessage
+    """
+    thread_messages = []
+    for thread_message in thread:
+        if context.state and \
+                context.state.is_reacted(channel, thread_message["ts"]):
+            continue
+        utils.SlackMessage.log_message(
+            thread_message)
+        thread_messages.append(
+            SlackMessage(thread_message, context.args.reaction_name))
+    return thread_messages
 
-        # ts is a timestamp of an existing message with 0 or more replies.
-        # if there are no replies then just the single message referenced
-        # by ts will return - it is just an ordinary message.
 
-        threads = slack_client.get_message_replies(
-            args.channel_id,
-            args.time_window,
-            message["ts"])
+async def check_messages(context: Context, channel: str, messages: list):
+    """
+    Process Slack messages:
+    - skip approved messages and messages without PRs
+    - index pending PRs of remaining messages
+    - resolve every distinct PR once, only when due if polled adaptively
+    - queue reactions to messages once all of their PRs are approved
+    :param context:  instance of Context cls
+    :param channel:  slack channel id (str)
+    :param messages: list of SlackMessage
+    :return: None
+    """
+    refs = []
+    for message in messages:
+        known = (channel, message.timestamp) in context.index.messages
+        if message.pending and context.index.add(channel, message):
+            refs.append((channel, message.timestamp))
+            if context.poller is not None and not known:
+                # a new message linking a quiet pull request
+                for key in message.pull_keys:
+                    context.poller.touch(("pull", key))
+            continue
+        context.index.discard(channel, message.timestamp)
+        if message.is_approved and message.pull_keys:
+            # counted as a write avoided
+            context.writer.add(channel, message)
 
-        for thread_message in threads:
-            utils.SlackMessage.log_message(
-                thread_message)
+    keys = context.index.pending_keys(refs)
+    if context.poller is not None:
+        keys = due_pull_requests(context, keys)
+    await resolve_pull_requests(context, keys)
 
-            thread_message = SlackMessage(thread_message, args.reaction_name)
-            await process_message(args, slack_client,
-                                  github_client,
-                                  thread_message)
 
+async def scan_page(context: Context, channel: str, messages: list):
+    """
+    Fetch threads of a page of channel messages and process them
+    :param context:  instance of Context cls
+    :param channel:  slack channel id (str)
+    :param messages: list of top level Slack messages (dict)
+    :return: timestamps of the page messages and replies (set of str)
+    """
+    threads = await fetch_threads(context, channel, messages)
+    thread_messages = [thread_message for thread in threads
+                       for thread_message in thread]
+    await check_messages(context, channel, thread_messages)
+    return {message.timestamp for message in thread_messages}
+
+
+def owned_messages(context: Context, channel: str, messages: list):
+    """
+    Select top level messages whose threads this replica handles
+    :param context:  instance of Context cls
+    :param channel:  slack channel id (str)
+    :param messages: list of top level Slack messages (dict)
+    :return: list of top level Slack messages (dict)
+    """
+    if context.sharding is None:
+        return messages
+    return [message for message in messages
+            if context.sharding.owns(channel, message["ts"])]
+
+
+async def scan_channel(context: Context, channel: str):
+    """
+    Stream channel messages within time window and process each
+    page as soon as it arrives, while the next page is fetched
+    :param context: instance of Context cls
+    :param channel: slack channel id (str)
+    :return: None
+    """
+    args = context.args
+    slack_client = context.slack(channel)
+    service = slack_client.service("conversations.history")
+
+    def run(coro):
+        return context.scheduler.run(service, timed(context, "history", coro))
+
+    pages, new, newest, threads = [], 0, 0.0, {"local": 0, "remote": 0}
+    async for messages in slack_client.iter_channel_messages(
+            channel, args.time_window, run):
+        if context.state:
+            new += context.state.advance(channel, messages)
+        owned = owned_messages(context, channel, messages)
+        threads["local"] += len(owned)
+        threads["remote"] += len(messages) - len(owned)
+        messages = owned
+        newest = max([newest] + [
+            float(message.get("latest_reply", message["ts"]))
+            for message in messages])
+        pages.append(asyncio.create_task(
+            scan_page(context, channel, messages)))
+    timestamps = set().union(*await asyncio.gather(*pages))
+
+    if context.state:
+        logging.info(f"{new} new messages in {channel} since last cycle")
+    context.planner.log_counters(channel)
+    if context.sharding is not None:
+        logging.info(f"handling {threads['local']} of "
+                     f"{sum(threads.values())} threads in {channel}")
+        for owner, count in threads.items():
+            context.metrics.set("shard_threads", count,
+                                channel=channel, owner=owner)
+    # threads moved to other replicas are no longer watched
+    context.index.retain(channel, timestamps)
+    if context.poller is not None:
+        # new messages and replies make a channel hot, quiet
+        # channels are still scanned every sleep period
+        context.poller.update(("channel", channel), newest,
+                              time.time() - newest if newest else 0.0,
+                              args.sleep_period * 60)
+        context.poller.retain(("thread", channel),
+                              {("thread", channel, ts) for ts in timestamps})
+
+
+async def scan_channels(context: Context):
+    """
+    Scan all channels concurrently. Slack calls are spread across
+    channels by the per-workspace, per-tier scheduler limits and
+    all channels share the GitHub client, cache and rate budget
+    :param context: instance of Context cls
+    :return: None
+    """
+    await asyncio.gather(*(scan_channel(context, channel)
+                           for channel in context.channels))
+    await write_reactions(context)
+
+
+async def record_metrics(context: Context):
+    """
+    Mirror cycle stats of the cache, reaction writer, message
+    index and GitHub rate limit budget to metrics
+    :param context: instance of Context cls
+    :return: None
+    """
+    metrics = context.metrics
+    cache = context.cache
+    total = cache.hits + cache.misses
+    metrics.set("pull_request_cache_hits_total", cache.hits)
+    metrics.set("pull_request_cache_misses_total", cache.misses)
+    metrics.set("pull_request_cache_hit_ratio",
+                cache.hits / total if total else 0.0)
+    metrics.set("pull_request_cache_entries", len(cache.entries))
+    for result, count in context.writer.counters.items():
+        metrics.inc("reaction_writes_total", count, result=result)
+    metrics.set("watched_messages", len(context.index))
+    if context.sharding is not None:
+        metrics.set("shard_replicas", len(context.sharding.replicas))
+    if context.poller is not None:
+        kinds = {"channel": 0, "thread": 0, "pull": 0}
+        for item in context.poller.entries:
+            kinds[item[0]] += 1
+        for kind, count in kinds.items():
+            metrics.set("poll_queue_items", count, kind=kind)
+
+    rate_tracker = context.github_client.rate_tracker
+    if rate_tracker.budget("core") is None:
+        # /rate_limit does not count against the budget
+        try:
+            await context.github_client.get_rate_core_data()
+        except Exception as err:
+            logging.error(f"error fetching rate limit: {err}")
+    for resource, budget in rate_tracker.budgets.items():
+        metrics.set("github_rate_limit_remaining", budget["remaining"],
+                    resource=resource)
+        metrics.set("github_rate_limit_limit", budget["limit"],
+                    resource=resource)
+        metrics.set("github_rate_limit_reset_timestamp_seconds",
+                    budget["reset"], resource=resource)
+
+
+def record_cycle(context: Context, started: float):
+    """
+    Record cycle duration, counting cycles which overran the sleep
+    period, i.e. the next cycle starts later than configured
+    :param context: instance of Context cls
+    :param started: cycle start time, time.monotonic() (float)
+    :return: None
+    """
+    metrics = context.metrics
+    duration = time.monotonic() - started
+    sleep_period = context.args.sleep_period * 60
+    metrics.observe("cycle_duration_seconds", duration)
+    metrics.set("last_cycle_duration_seconds", duration)
+    metrics.set("sleep_period_seconds", sleep_period)
+    if sleep_period and duration > sleep_period:
+        metrics.inc("cycle_overruns_total")
+        logging.warning(f"cycle took {duration:.1f}s, longer than "
+                        f"the sleep period of {sleep_period}s")
+
+
+async def log_cycle(context: Context):
+    """
+    Log cycle stats, record metrics and persist stores
+    :param context: instance of Context cls
+    :return: None
+    """
+    await record_metrics(context)
+    context.cache.log_stats()
+    context.writer.log_counters()
+    context.writer.reset()
+    context.github_client.rate_tracker.log_budget()
+    context.github_client.transport.log_stats()
+    if context.poller is not None:
+        context.poller.log_stats()
+    if context.state:
+        context.state.compact(utils.SlackClient.set_oldest_ts(
+            context.args.time_window))
+        context.state.save()
+    if context.github_client.etag_store is not None:
+        context.github_client.etag_store.log_stats()
+        context.github_client.etag_store.save()
+    if context.cassette is not None:
+        context.cassette.log_stats()
+        context.cassette.save()
+    context.logged_at = time.monotonic()
     logging.info("finished processing messages")
+
+
+async def process_messages(context: Context):
+    """
+    Fetch all messages and process them
+    :param context: instance of Context cls
+    :return:
+    """
+    sleep_period = context.args.sleep_period * 60
+
+    started = time.monotonic()
+    await scan_channels(context)
+    await log_cycle(context)
+    record_cycle(context, started)
     await asyncio.sleep(sleep_period)
 
 
+async def poll_messages(context: Context):
+    """
+    Adaptive polling: scan channels, fetch threads and resolve pull
+    requests which are due, then sleep until the next check is due.
+    Active items are checked every --min_poll_interval, quiet threads
+    and pull requests back off up to --max_poll_interval, channels
+    up to --sleep_period. Stats are logged and stores persisted
+    after full channel scans, otherwise at most every
+    --min_poll_interval
+    :param context: instance of Context cls
+    :return:
+    """
+    poller = context.poller
+
+    started = time.monotonic()
+    channels = [channel for channel in context.channels
+                if poller.due(("channel", channel))]
+    await asyncio.gather(*(scan_channel(context, channel)
+                           for channel in channels))
+    # pull requests linked in channels which were not scanned
+    await resolve_pull_requests(
+        context, due_pull_requests(context, context.index.pending_keys()))
+    await write_reactions(context)
+    poller.retain(("pull",), {("pull", key) for key in context.index.pulls})
+    if len(channels) == len(context.channels) or \
+            context.logged_at is None or \
+            time.monotonic() - context.logged_at >= \
+            poller.min_interval:
+        await log_cycle(context)
+    record_cycle(context, started)
+
+    next_due = poller.next_due()
+    delay = next_due - time.monotonic() if next_due is not None \
+        else poller.max_interval
+    delay = min(max(delay, 1.0), context.args.sleep_period * 60)
+    context.metrics.set("next_poll_seconds", delay)
+    await asyncio.sleep(delay)
+
+
+async def reconcile_once(context: Context):
+    """
+    One-shot mode, e.g. as a CronJob: a single pass over all channels,
+    persisting state and ETags like any other cycle
+    :param context: instance of Context cls
+    :return: exit status, 0 if the pass logged no errors and no
+             API call was given up on, otherwise 1 (int)
+    """
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    try:
+        started = time.monotonic()
+        await scan_channels(context)
+        failed_writes = context.writer.counters["failed"]
+        await log_cycle(context)
+        record_cycle(context, started)
+    finally:
+        logging.getLogger().removeHandler(errors)
+
+    # calls which still failed after retries, rate limited
+    # or transient errors which succeeded on retry do not count
+    failed_calls = sum(
+        context.metrics.values.get("api_failures_total", {}).values())
+    if errors.count or failed_writes or failed_calls:
+        logging.warning(f"pass finished with {errors.count} errors, "
+                        f"{failed_calls} failed API calls and "
+                        f"{failed_writes} failed reactions")
+        return 1
+    return 0
+
+
+async def watch_events(context: Context, events):
+    """
+    Event-driven mode: seed watch sets with a single scan of all
+    channels, then only check messages announced by Slack events.
+    Watched messages are re-checked every sleep period
+    :param context: instance of Context cls
+    :param events:  started instance of LocalEventSource cls
+    :return:
+    """
+    args = context.args
+    sleep_period = args.sleep_period * 60
+    watches = [WatchSet(channel, args.reaction_name, context.index,
+                        context.sharding)
+               for channel in context.channels]
+
+    # the initial scan indexes all messages awaiting approval
+    started = time.monotonic()
+    await scan_channels(context)
+    await log_cycle(context)
+    record_cycle(context, started)
+
+    next_check = time.monotonic() + sleep_period
+    while True:
+        timeout = max(next_check - time.monotonic(), 0)
+        try:
+            event = await asyncio.wait_for(events.get(), timeout)
+        except asyncio.TimeoutError:
+            started = time.monotonic()
+            for watch in watches:
+                messages = watch.messages()
+                logging.info(f"re-checking {len(messages)} watched "
+                             f"messages in {watch.channel}")
+                await check_messages(context, watch.channel, messages)
+            await write_reactions(context)
+            await log_cycle(context)
+            record_cycle(context, started)
+            next_check = time.monotonic() + sleep_period
+            continue
+
+        for watch in watches:
+            message = watch.handle(event)
+            if message:
+                await process_message(context, watch.channel, message)
+
+
+async def renew_lease(context: Context):
+    """
+    Renew the replica lease every third of its duration and
+    rebalance threads when replicas join or leave
+    :param context: instance of Context cls
+    :return:
+    """
+    sharding = context.sharding
+    while True:
+        await asyncio.sleep(sharding.ttl / 3)
+        sharding.refresh()
+
+
+async def on_github_event(context: Context, event: str, payload: dict):
+    """
+    Re-check messages referencing a pull request after
+    a pull_request or pull_request_review webhook
+    :param context: instance of Context cls
+    :param event:   GitHub event name (str)
+    :param payload: GitHub event payload (dict)
+    :return:
+    """
+    repository = payload.get("repository", {})
+    try:
+        key = utils.GitClient.pr_key(
+            repository["owner"]["login"], repository["name"],
+            payload["pull_request"]["number"])
+    except (KeyError, TypeError, ValueError):
+        logging.warning(f"{event} without a pull request, skipping")
+        return
+
+    # the pull request changed, drop its cached state
+    context.cache.invalidate(key)
+    messages = context.index.lookup(key)
+    if messages:
+        logging.info(f"{event} changed pull request {key}, "
+                     f"re-checking {len(messages)} messages")
+        await update_pull_requests(context, [key])
+        await write_reactions(context)
+
+
+def open_state(args: configargparse):
+    """
+    Open the state backend. JSON state files of earlier versions
+    are kept in JSON instead of failing to open as a database
+    :param args: instance of configargparse
+    :return: instance of ChannelState cls or None
+    """
+    if not args.state_file:
+        return None
+    backend = STATE_BACKENDS[args.state_backend]
+    if backend is SQLiteState and SQLiteState.is_json(args.state_file):
+        logging.warning(f"{args.state_file} is a JSON state file, "
+                        f"using the json state backend")
+        backend = ChannelState
+    return backend(args.state_file)
+
+
+async def run(args: configargparse):
+    """
+    Set up clients and process messages until interrupted,
+    or a single pass in one-shot mode
+    :param args: instance of configargparse
+    :return: exit status of one-shot mode (int)
+    """
+    slack_tokens = args.slack_api_token.split(",")
+    limiter = TierLimiter()
+    metrics = Metrics()
+    # Slack and GitHub calls share pooled keep-alive connections,
+    # recorded into or replayed from a cassette if set
+    cassette = None
+    pool = (args.http_pool_size, args.http_connect_timeout,
+            args.http_timeout, args.http_keepalive)
+    if args.replay:
+        cassette = Cassette(args.replay)
+        cassette.load()
+        transport = ReplayTransport(cassette, pace=not args.replay_fast)
+    elif args.record:
+        secrets = [token.strip() for token in slack_tokens] + \
+            [args.github_api_token, args.slack_app_token]
+        cassette = Cassette(args.record, secrets)
+        transport = RecordingTransport(cassette, *pool, metrics=metrics)
+    else:
+        transport = HTTPTransport(*pool, metrics=metrics)
+    workspaces = [SlackClient(token.strip(), workspace=str(index),
+                              limiter=limiter, metrics=metrics,
+                              transport=transport)
+                  for index, token in enumerate(slack_tokens)]
+    slack_clients = {channel: workspaces[workspace]
+                     for channel, workspace
+                     in utils.SlackClient.parse_channels(args.channel_id)}
+
+    etag_store = ETagStore(args.etag_size, args.etag_file)
+    github_client = GitHubClient(args.github_api_token,
+                                 args.debug,
+                                 etag_store=etag_store,
+                                 metrics=metrics,
+                                 transport=transport)
+    scheduler = Scheduler({"slack": args.slack_concurrency,
+                           "github": args.github_concurrency})
+    state = open_state(args)
+    cache = PullRequestCache(args.cache_ttl, args.cache_size, state)
+    resolver = PullRequestResolver(github_client, cache) \
+        if args.github_graphql else None
+    adaptive = not (args.once or args.fixed_polling or args.event_mode)
+    poller = PollQueue(args.min_poll_interval,
+                       args.max_poll_interval) if adaptive else None
+    sharding = Sharding(LEASE_BACKENDS[args.lease_backend](args.lease_path),
+                        args.replica_id, args.lease_ttl) \
+        if args.lease_path else None
+
+    context = Context(args, slack_clients, github_client,
+                      scheduler, cache, state, resolver=resolver,
+                      metrics=metrics, poller=poller, sharding=sharding,
+                      cassette=cassette)
+    logging.info(f"watching channels: {', '.join(context.channels)}")
+
+    lease_task = None
+    if sharding:
+        sharding.refresh()
+        if not args.once:
+            lease_task = asyncio.create_task(renew_lease(context))
+
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = clients.MetricsServer(metrics,
+                                               port=args.metrics_port)
+        await metrics_server.start()
+
+    receiver = None
+    if args.webhook_port:
+        receiver = clients.GitHubWebhookReceiver(
+            args.webhook_secret,
+            functools.partial(on_github_event, context),
+            port=args.webhook_port)
+        await receiver.start()
+    try:
+        if args.once:
+            return await reconcile_once(context)
+        if args.event_mode:
+            events = clients.LocalEventSource()
+            app_tokens = args.slack_app_token.split(",")
+            listeners = [clients.SlackEventListener(token.strip(),
+                                                    workspaces[index],
+                                                    events.queue)
+                         for index, token in enumerate(app_tokens)]
+            try:
+                for listener in listeners:
+                    await listener.start()
+                await watch_events(context, events)
+            finally:
+                for listener in listeners:
+                    await listener.close()
+        else:
+            cycle = poll_messages if poller is not None else process_messages
+            while True:
+                await cycle(context)
+    finally:
+        if lease_task:
+            lease_task.cancel()
+        if sharding:
+            sharding.release()
+        if receiver:
+            await receiver.close()
+        if metrics_server:
+            await metrics_server.close()
+        if state:
+            state.close()
+        if cassette:
+            # calls of an interrupted cycle
+            cassette.save()
+        await github_client.close()
+        await transport.close()
+
+
 def main():
     args = get_arguments()
 
@@ -132,17 +1086,7 @@ def main():
                                "%(levelname)5s - "
                                "%(message)4s")
 
-    slack_client = SlackClient(args.slack_api_token)
-    github_client = GitHubClient(args.github_api_token,
-                                 args.debug)
-
-    while True:
-        loop = asyncio.get_event_loop()
-        task = [loop.create_task(
-            process_messages(args, slack_client,
-                             github_client))]
-        loop.run_until_complete(
-            asyncio.wait(task))
+    sys.exit(asyncio.run(run(args)))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,206 @@
+"""
+Slack tier limiter under a simulated clock: concurrent callers
+hammer a workspace method and the peak number of requests in any
+60 second window has to stay within the tier limit, also around
+Retry-After pauses:
+
+    python -m unittest tests.test_limiter
+"""
+import asyncio
+import bisect
+import heapq
+import socket
+import unittest
+from unittest import mock
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_slack_response import AsyncSlackResponse
+
+from clients import SlackClient
+from helpers import TierLimiter
+
+METHOD = "slack:0:conversations.replies"
+
+
+class SimulatedClock:
+    """ Virtual clock, sleeping advances time instead of waiting """
+
+    def __init__(self):
+        """
+        Instantiate class instance
+        """
+        self.now = 0.0
+        self.timers = []
+        self.sequence = 0
+
+    def time(self):
+        """
+        Get current virtual time
+        :return: seconds (float)
+        """
+        return self.now
+
+    async def sleep(self, seconds: float):
+        """
+        Sleep until virtual time advanced by seconds
+        :param seconds: seconds (float)
+        :return: None
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.sequence += 1
+        heapq.heappush(self.timers, (self.now + seconds,
+                                     self.sequence, future))
+        await future
+
+    async def run(self, until: float):
+        """
+        Advance virtual time, waking sleepers in order
+        :param until: stop time in seconds (float)
+        :return: None
+        """
+        while self.now < until:
+            # let runnable tasks reach their next sleep
+            for _ in range(10):
+                await asyncio.sleep(0)
+            if not self.timers or self.timers[0][0] > until:
+                break
+            wake_at, _, future = heapq.heappop(self.timers)
+            self.now = max(self.now, wake_at)
+            future.set_result(None)
+        self.now = max(self.now, until)
+
+
+async def caller(limiter: TierLimiter, tier: int, requests: list):
+    """
+    Send requests as fast as the limiter allows
+    :param limiter:  instance of TierLimiter cls
+    :param tier:     Slack rate limit tier (int)
+    :param requests: list collecting request times
+    :return: None
+    """
+    while True:
+        await limiter.acquire(METHOD, tier)
+        requests.append(limiter.clock())
+
+
+def peak_per_minute(requests: list):
+    """
+    Get max number of requests in any 60 second window
+    :param requests: sorted request times (list of float)
+    :return: int
+    """
+    return max((bisect.bisect_left(requests, start + 60) - index
+                for index, start in enumerate(requests)), default=0)
+
+
+def rate_limited(retry_after: int):
+    """
+    Build a Slack rate limited error
+    :param retry_after: Retry-After seconds (int)
+    :return: SlackApiError
+    """
+    response = AsyncSlackResponse(
+        client=None, http_verb="POST", api_url="conversations.replies",
+        req_args={}, data={"ok": False, "error": "ratelimited"},
+        headers={"Retry-After": str(retry_after)}, status_code=429)
+    return SlackApiError("ratelimited", response)
+
+
+class LimiterTest(unittest.IsolatedAsyncioTestCase):
+    """ TierLimiter under concurrent callers """
+
+    callers = 20
+    minutes = 10
+
+    async def simulate(self, tier: int, pauses: list = ()):
+        """
+        Run callers of a tier against a simulated clock
+        :param tier:   Slack rate limit tier (int)
+        :param pauses: (time, seconds) Retry-After pauses (list)
+        :return: sorted request times (list of float)
+        """
+        clock = SimulatedClock()
+        limiter = TierLimiter(clock=clock.time, sleep=clock.sleep)
+        requests = []
+        tasks = [asyncio.ensure_future(caller(limiter, tier, requests))
+                 for _ in range(self.callers)]
+        for at, seconds in pauses:
+            await clock.run(at)
+            limiter.pause(METHOD, tier, seconds)
+        await clock.run(self.minutes * 60)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return sorted(ts for ts in requests if ts < self.minutes * 60)
+
+    async def test_peak_within_tier_limit(self):
+        for tier, limit in TierLimiter.TIER_RATES.items():
+            with self.subTest(tier=tier):
+                requests = await self.simulate(tier)
+                self.assertLessEqual(peak_per_minute(requests), limit)
+                # throttled, not starved
+                self.assertGreaterEqual(len(requests),
+                                        limit * self.minutes * 0.8)
+
+    async def test_pause(self):
+        for tier, limit in TierLimiter.TIER_RATES.items():
+            with self.subTest(tier=tier), self.assertLogs(level="WARNING"):
+                # the second pause extends the first one
+                requests = await self.simulate(
+                    tier, pauses=[(120, 30), (130, 45), (400, 5)])
+                self.assertLessEqual(peak_per_minute(requests), limit)
+                self.assertEqual([ts for ts in requests
+                                  if 120 < ts < 175 or 400 < ts < 405], [])
+                self.assertTrue([ts for ts in requests if ts >= 175])
+
+    async def test_retry_after(self):
+        clock = SimulatedClock()
+        limiter = TierLimiter(clock=clock.time, sleep=clock.sleep)
+        client = SlackClient("xoxb-test", limiter=limiter)
+        calls = []
+
+        async def conversations_replies(**params):
+            calls.append(clock.time())
+            if len(calls) < 3:
+                raise rate_limited(30)
+            return {"messages": [{"ts": params["ts"]}]}
+
+        client.client.conversations_replies = conversations_replies
+        task = asyncio.ensure_future(
+            client.get_message_history("C01", 60, "1.0"))
+        with self.assertLogs(level="WARNING"):
+            await clock.run(600)
+        self.assertEqual(task.result(), {"messages": [{"ts": "1.0"}]})
+        # every retry waits for Retry-After
+        self.assertEqual(len(calls), 3)
+        self.assertGreaterEqual(calls[1] - calls[0], 30)
+        self.assertGreaterEqual(calls[2] - calls[1], 30)
+        errors = client.metrics.values["api_errors_total"]
+        self.assertEqual(sum(errors.values()), 2)
+        self.assertNotIn("api_failures_total", client.metrics.values)
+
+    async def test_connection_errors(self):
+        # a port nobody listens on
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        limiter = TierLimiter(rates={tier: 10 ** 9 for tier in range(1, 5)})
+        client = SlackClient("xoxb-test", limiter=limiter,
+                             base_url=f"http://127.0.0.1:{port}/api/")
+        # only api_rate_control retries
+        client.client.retry_handlers = []
+        with mock.patch("helpers.backoff_delay", return_value=0), \
+                self.assertLogs(level="WARNING") as logs:
+            history = await client.get_channel_history("C01", 60)
+        # retried, then given up with the default result
+        self.assertEqual(history, {"messages": []})
+        requests = client.metrics.values["api_requests_total"]
+        self.assertEqual(sum(requests.values()), 6)
+        failures = client.metrics.values["api_failures_total"]
+        self.assertEqual(sum(failures.values()), 1)
+        self.assertTrue(any(line.startswith("ERROR")
+                            for line in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
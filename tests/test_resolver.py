@@ -0,0 +1,123 @@
+"""
+Batch pull request resolution through aliased GraphQL queries,
+against the local GitHub stand-in:
+
+    python -m unittest tests.test_resolver
+"""
+import unittest
+
+from benchmarks.servers import FakeGitHubServer
+from clients import GitHubClient, HTTPTransport
+from helpers import PullRequest, PullRequestCache, PullRequestResolver
+import utils
+
+KEYS = [("acme", "api", 1), ("acme", "web", 2), ("other", "api", 3)]
+
+
+class ResolverTest(unittest.IsolatedAsyncioTestCase):
+    """ PullRequestResolver and GitHubClient.get_pr_states """
+
+    async def start(self, **kwargs):
+        """
+        Start GitHub stand-in and a client using it
+        :param kwargs: FakeGitHubServer arguments
+        :return: None
+        """
+        self.server = FakeGitHubServer(**kwargs)
+        url = await self.server.start()
+        self.addAsyncCleanup(self.server.stop)
+        transport = HTTPTransport()
+        self.addAsyncCleanup(transport.close)
+        self.client = GitHubClient("ghp_test", base_url=url,
+                                   transport=transport)
+        self.cache = PullRequestCache()
+        self.resolver = PullRequestResolver(self.client, self.cache)
+
+    def test_query_aliases(self):
+        query, variables = utils.GitClient.pr_states_query(KEYS)
+        for index, (owner, repo, number) in enumerate(KEYS):
+            self.assertIn(f"pr{index}: repository(owner: $o{index}", query)
+            self.assertEqual(variables[f"o{index}"], owner)
+            self.assertEqual(variables[f"r{index}"], repo)
+            self.assertEqual(variables[f"n{index}"], number)
+
+    async def test_batches(self):
+        await self.start()
+        self.resolver.batch_size = 2
+        self.cache.put(KEYS[1], {"approved": False})
+        urls = [utils.GitClient.pr_url(key) for key in KEYS + KEYS[:1]]
+        urls.append("https://github.com/acme")
+        # cached, duplicate and invalid urls are left out
+        self.assertEqual(self.resolver.batches(urls),
+                         [[KEYS[0], KEYS[2]]])
+
+    async def test_resolve_batch(self):
+        await self.start()
+        states = await self.resolver.resolve_batch(KEYS)
+        self.assertEqual(self.server.calls, {"graphql": 1})
+        self.assertEqual(set(states), set(KEYS))
+        for owner, repo, number in KEYS:
+            state = states[(owner, repo, number)]
+            # every alias maps back to its own pull request
+            self.assertEqual(state["head_sha"], f"{number:040x}")
+            self.assertTrue(state["approved"])
+            self.assertFalse(state["merged"])
+            self.assertIs(self.cache.lookup((owner, repo, number)), state)
+
+    async def test_partial_errors(self):
+        await self.start(missing={2})
+        with self.assertLogs(level="WARNING") as logs:
+            states = await self.resolver.resolve_batch(KEYS)
+        self.assertEqual(set(states), {KEYS[0], KEYS[2]})
+        self.assertIsNone(self.cache.lookup(KEYS[1]))
+        self.assertTrue(any("Could not resolve" in line
+                            for line in logs.output))
+
+    async def test_missing_pull_requests(self):
+        await self.start(missing={1, 2, 3})
+        self.assertEqual(await self.client.get_pr_states(KEYS), {})
+
+    async def test_inaccessible(self):
+        # a deleted pull request is no reason to fail a --once pass
+        await self.start(missing={1})
+        pull = PullRequest(self.client, utils.GitClient.pr_url(KEYS[0]))
+        with self.assertLogs(level="WARNING") as logs:
+            state = await pull.load_state()
+        self.assertEqual(state, {"approved": False})
+        self.assertFalse(any(line.startswith("ERROR")
+                             for line in logs.output))
+        self.assertNotIn("api_failures_total", self.client.metrics.values)
+
+    async def test_merged(self):
+        await self.start(approved=False, merged=True)
+        states = await self.client.get_pr_states(KEYS)
+        for state in states.values():
+            self.assertTrue(state["approved"])
+            self.assertTrue(state["merged"])
+            self.assertFalse(state["closed"])
+            self.assertTrue(PullRequestCache.is_final(state))
+
+    async def test_review_decision(self):
+        # the decision of branch protection overrides reviews
+        await self.start(approved=True,
+                         decisions={1: "REVIEW_REQUIRED",
+                                    2: "CHANGES_REQUESTED",
+                                    3: "APPROVED"})
+        states = await self.client.get_pr_states(KEYS)
+        self.assertFalse(states[KEYS[0]]["approved"])
+        self.assertFalse(states[KEYS[1]]["approved"])
+        self.assertTrue(states[KEYS[2]]["approved"])
+
+    async def test_without_review_decision(self):
+        # reviews decide without branch protection, comments
+        # after an approval do not withdraw it
+        await self.start(approve_at={1: 0})
+        self.server.approved = False
+        states = await self.client.get_pr_states(KEYS)
+        self.assertTrue(states[KEYS[0]]["approved"])
+        self.assertFalse(states[KEYS[1]]["approved"])
+        self.assertFalse(states[KEYS[2]]["approved"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,33 +14,137 @@ class GitClient:
         :param req: request (dict)
         :return: None
         """
-        request = vars(req)
-        logging.debug(f"request data: {request}")
-
-    @staticmethod
-    def api_rate_control(func):
-        """
-        Wrapper for GitHub api rate control
-        :param func: function
-        :return: wrapper
-        """
-        @wraps(func)
-        def wrapper(self, *args, **kwargs):
-            while True:
-                core = self.get_rate_core_data()
-                if core["remaining"] == 0:
-                    time_wait = float(core["reset"])
-                    helpers.sleep_until(time_wait)
-                    continue
-                else:
-                    logging.info(f"api quota remaining: "
-                                 f"{core['remaining']} "
-                                 f"of {core['limit']}")
-
-                    logging.info(f"api quota used:"
-                                 f" {core['used']}")
-                    logging.info(f"api quota reset time:"
-                                 f" {core['reset']}")
-                    result = func(self, *args, **kwargs)
+        logging.debug(f"request data: {req}")
+
+    @staticmethod
+    def pr_key(owner: str, repo: str, number):
+        """
+        Build normalised pull request key. GitHub owner and
+        repository names are case-insensitive
+        :param owner:  owner of the repo (str)
+        :param repo:   repository name (str)
+        :param number: pull request number (int or str)
+        :return: (owner, repo, number) tuple
+        """
+        return owner.lower(), repo.lower(), int(number)
+
+    @staticmethod
+    def pr_url(key: tuple):
+        """
+        Build pull request web url
+        :param key: (owner, repo, number) tuple
+        :return: GitHub pull request web url (str)
+        """
+        owner, repo, number = key
+        return f"https://github.com/{owner}/{repo}/pull/{number}"
+
+    @staticmethod
+    def is_inaccessible(err):
+        """
+        Check if a request failed for good because the resource is
+        gone or the token cannot see it, e.g. a deleted pull request
+        or one in a private repository. Not an API failure, retrying
+        does not change the answer
+        :param err: aiohttp.ClientResponseError
+        :return: bool
+        """
+        if err.status == 403:
+            # an exhausted rate limit is not missing permissions
+            headers = err.headers or {}
+            return headers.get("X-RateLimit-Remaining") != "0"
+        return err.status in (404, 410)
+
+    @staticmethod
+    def pr_states_query(keys: list):
+        """
+        Build aliased GraphQL query resolving many pull requests
+        :param keys: list of (owner, repo, number) tuples
+        :return: tuple of query (str) and variables (dict)
+        """
+        params, fields, variables = [], [], {}
+        for index, (owner, repo, number) in enumerate(keys):
+            params.append(f"$o{index}: String!, $r{index}: String!, "
+                          f"$n{index}: Int!")
+            fields.append(f"pr{index}: repository(owner: $o{index}, "
+                          f"name: $r{index}) {{ pullRequest(number: "
+                          f"$n{index}) {{ ...state }} }}")
+            variables.update({f"o{index}": owner,
+                              f"r{index}": repo,
+                              f"n{index}": int(number)})
+
+        query = (f"query({', '.join(params)}) {{ {' '.join(fields)} }} "
+                 "fragment state on PullRequest { state merged "
+                 "reviewDecision headRefOid "
+                 "latestOpinionatedReviews(first: 100) "
+                 "{ nodes { state submittedAt author { login } } } }")
+        return query, variables
+
+    @staticmethod
+    def pr_state_from_graphql(pull: dict):
+        """
+        Convert GraphQL PullRequest object to pull request state.
+        Falls back to the latest review of every reviewer when no
+        review decision is required by branch protection. Merged
+        pull requests need no more reviews and count as approved
+        :param pull: GraphQL PullRequest (dict)
+        :return: pull request state (dict)
+        """
+        # latest approval or change request of every reviewer,
+        # latestReviews would end on trailing comments instead
+        reviews = [{"state": review.get("state"),
+                    "submitted_at": review.get("submittedAt"),
+                    "user": review.get("author")}
+                   for review in pull["latestOpinionatedReviews"]["nodes"]]
+        reviews.sort(key=lambda review: review["submitted_at"] or "")
+
+        evaluator = helpers.ReviewEvaluator()
+        evaluator.add(reviews)
+        decision = pull.get("reviewDecision")
+        if decision:
+            approved = decision == "APPROVED"
+        else:
+            approved = evaluator.approved
+
+        merged = pull.get("merged", False)
+        return {"approved": approved or merged,
+                "merged": merged,
+                "closed": pull.get("state") == "CLOSED",
+                "head_sha": pull.get("headRefOid"),
+                "reviewed_at": evaluator.reviewed_at}
+
+    @staticmethod
+    def pr_state_from_rest(pull: dict):
+        """
+        Convert REST pull request to pull request state. Merged pull
+        requests need no more reviews and count as approved, approval
+        of open pull requests is evaluated from their reviews
+        :param pull: GitHub pull request (dict)
+        :return: pull request state (dict)
+        """
+        merged = bool(pull.get("merged"))
+        return {"approved": merged,
+                "merged": merged,
+                "closed": pull.get("state") == "closed" and not merged,
+                "head_sha": (pull.get("head") or {}).get("sha")}
+
+    @staticmethod
+    def api_rate_control(resource: str = "core"):
+        """
+        Wrapper for GitHub api rate control. Waits only when the
+        local budget estimate of the rate limit resource runs out
+        :param resource: rate limit resource, e.g. core or graphql (str)
+        :return: decorator
+        """
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(self, *args, **kwargs):
+                while True:
+                    reset = self.rate_tracker.reserve(resource)
+                    if reset:
+                        # only this call waits, other services keep going
+                        await helpers.sleep_until(reset)
+                        continue
+                    result = await func(self, *args, **kwargs)
                     return result
-        return wrapper
+            return wrapper
+        return decorator
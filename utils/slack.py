@@ -1,14 +1,42 @@
+import asyncio
 from datetime import datetime, timedelta
 from functools import wraps
 import logging
+import re
 
+import aiohttp
 from slack_sdk.errors import SlackApiError
 import helpers
 
+from .git import GitClient
+
 
 class SlackClient:
     """ SlackClient class of client helper functions """
 
+    # https://api.slack.com/docs/rate-limits#tiers
+    METHOD_TIERS = {
+        "conversations.history": 3,
+        "conversations.replies": 3,
+        "reactions.add": 3
+    }
+
+    @staticmethod
+    def parse_channels(channel_ids: str):
+        """
+        Parse comma separated channel list. Channels of other
+        workspaces are suffixed with the index of their token,
+        e.g. "C01,C02,C03@1"
+        :param channel_ids: channel list (str)
+        :return: list of (channel id, token index) tuples
+        """
+        channels = []
+        for channel in channel_ids.split(","):
+            channel, _, workspace = channel.strip().partition("@")
+            if channel:
+                channels.append((channel, int(workspace or 0)))
+        return channels
+
     @staticmethod
     def set_oldest_ts(minutes: int):
         """
@@ -23,43 +51,118 @@ class SlackClient:
         return str(oldest.timestamp())
 
     @staticmethod
-    def api_rate_control(func):
-        """
-        Wrapper for GitHub api rate control
-        :param func: function
-        :return: wrapper
-        """
-        @wraps(func)
-        def wrapper(self, *args, **kwargs):
-            while True:
-                try:
-                    result = func(self, *args, **kwargs)
-                    return result
-                except SlackApiError as err:
-                    if err.response.headers['Retry-After']:
-                        time_wait = float(err.response["headers"]["Retry-After"])
-                        helpers.sleep_until(time_wait)
-                        continue
-                    else:
-                        break
-
-        return wrapper
+    def is_rate_limited(err: SlackApiError):
+        """
+        Check if Slack API error is a rate limit response
+        :param err: SlackApiError
+        :return: True or False (bool)
+        """
+        return err.response.status_code == 429 or \
+            err.response.get("error") == "ratelimited"
+
+    @staticmethod
+    def is_retryable(err: SlackApiError):
+        """
+        Check if Slack API error is a rate limit or transient server error
+        :param err: SlackApiError
+        :return: True or False (bool)
+        """
+        return SlackClient.is_rate_limited(err) or \
+            err.response.status_code >= 500
+
+    @staticmethod
+    def api_rate_control(method: str, default=None, retries: int = 5):
+        """
+        Wrapper for Slack api rate control. Waits for the client-side
+        token bucket of the method, retries rate limited requests
+        after Retry-After seconds, and transient server and connection
+        errors with jittered exponential backoff
+        see https://api.slack.com/docs/rate-limits
+        :param method:  Slack API method, e.g. reactions.add (str)
+        :param default: function returning the result
+                        once retries are exhausted
+        :param retries: max retries of server and connection errors (int)
+        :return: decorator
+        """
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(self, *args, **kwargs):
+                key = f"slack:{self.workspace}:{method}"
+                tier = SlackClient.METHOD_TIERS.get(method, 3)
+                attempt = 0
+                while True:
+                    await self.limiter.acquire(key, tier)
+                    self.metrics.inc("api_requests_total",
+                                     service="slack", method=method)
+                    try:
+                        result = await func(self, *args, **kwargs)
+                        return result
+                    except SlackApiError as err:
+                        self.count_error(method, err)
+                        if SlackClient.is_rate_limited(err):
+                            retry_after = err.response.headers.get(
+                                "Retry-After", 1)
+                            self.limiter.pause(key, tier,
+                                               float(retry_after))
+                            continue
+                        error, reason = err, err.response.status_code
+                    except (aiohttp.ClientConnectionError,
+                            asyncio.TimeoutError) as err:
+                        self.metrics.inc("api_errors_total",
+                                         service="slack", method=method,
+                                         error=type(err).__name__)
+                        error, reason = err, type(err).__name__
+                    if attempt >= retries:
+                        self.metrics.inc("api_failures_total",
+                                         service="slack", method=method)
+                        logging.error(f"{method} failed: {error}")
+                        return default() if default else None
+                    delay = helpers.backoff_delay(attempt)
+                    attempt += 1
+                    logging.warning(f"{method} failed with {reason}, "
+                                    f"retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def set_latest_ts():
+        """
+        Get current time as Slack timestamp. Kept for all pages
+        of a paginated request
+        :return: timestamp (str)
+        """
+        return str(datetime.now().timestamp())
+
+    @staticmethod
+    def next_cursor(response):
+        """
+        Get cursor of the next page
+        see https://api.slack.com/docs/pagination
+        :param response: Slack API response
+        :return: cursor (str) or None on the last page
+        """
+        if not response.get("has_more"):
+            return None
+        metadata = response.get("response_metadata") or {}
+        return metadata.get("next_cursor") or None
 
     @staticmethod
     def set_conv_params(channel: str, minutes: int,
-                        latest_ts: str = None):
+                        latest_ts: str = None, cursor: str = None):
         """
         Methods app.client.conversations_replies and app.client.conversations_history
         are accepting the same optional parameters
         :param channel: slack channel id (str)
         :param minutes: look back window in minutes (int)
         :param latest_ts: latest message timestamp
+        :param cursor: pagination cursor (str)
         :return: dict of common methods' parameters
         """
         # set oldest_ts ts based on minutes to look back
         oldest_ts = SlackClient.set_oldest_ts(minutes)
         # set latest_ts to current time if not provided
-        latest_ts = latest_ts if latest_ts else str(datetime.now().timestamp())
+        latest_ts = latest_ts if latest_ts else SlackClient.set_latest_ts()
 
         params = {
             "latest": latest_ts,
@@ -68,12 +171,24 @@ class SlackClient:
             "limit": 100,
             "inclusive": True
         }
+        if cursor:
+            params["cursor"] = cursor
         return params
 
 
 class SlackMessage:
     """ SlackMessage class of common Slack message utils """
 
+    PR_PATTERN = re.compile(
+        r"https?://github\.com/([\w.-]+)/([\w.-]+)/pull/(\d+)")
+    # rich text elements holding nested elements
+    RICH_TEXT_LISTS = frozenset(("rich_text", "rich_text_section",
+                                 "rich_text_list", "rich_text_quote",
+                                 "rich_text_preformatted"))
+    # rich text elements which can not hold links
+    RICH_TEXT_LEAVES = frozenset(("emoji", "user", "usergroup", "channel",
+                                  "broadcast", "date", "color"))
+
     @staticmethod
     def log_message(raw_message: dict):
         """
@@ -82,7 +197,8 @@ class SlackMessage:
         :return:
         """
         logging.info(f"processing message {raw_message.get('ts')}")
-        logging.debug(f"{raw_message}")
+        # formatted only in debug mode, payloads can be large
+        logging.debug("%s", raw_message)
 
     @staticmethod
     def get_msg_reactions(raw_message: dict):
@@ -91,17 +207,8 @@ class SlackMessage:
         :param raw_message: Slack message object
         :return: list of reactions
         """
-        if "reactions" in raw_message.keys():
-            reactions = [msg_reaction.get("name")
-                         for msg_reaction
-                         in raw_message.get("reactions")]
-
-            logging.info(f"found {len(reactions)} message user reactions")
-            logging.debug(f"user reactions: {reactions}")
-            return reactions
-        else:
-            logging.info("message has no user reactions")
-            return []
+        return [msg_reaction.get("name")
+                for msg_reaction in raw_message.get("reactions", ())]
 
     @staticmethod
     def lookup_reaction(raw_message: dict, reaction: str):
@@ -111,10 +218,82 @@ class SlackMessage:
         :param reaction:    Slack reaction to search for
         :return: True or False (bool) based on reaction lookup
         """
-        msg_reactions = SlackMessage.get_msg_reactions(raw_message)
-        if msg_reactions and reaction in msg_reactions:
-            logging.info(f"message has reaction '{reaction}'")
-            return True
-        else:
-            logging.info(f"message has no reaction '{reaction}'")
-            return False
+        return reaction in SlackMessage.get_msg_reactions(raw_message)
+
+    @staticmethod
+    def iter_pull_keys(raw_message: dict):
+        """
+        Stream pull requests linked by a message in a single pass
+        over its text, attachments and (nested) layout blocks
+        see https://api.slack.com/reference/block-kit/blocks
+        :param raw_message: Slack message object
+        :return: generator of unique (owner, repo, number) tuples
+        """
+        seen = set()
+        values = [raw_message.get("text")]
+        for attachment in raw_message.get("attachments", ()):
+            values.extend(attachment.get(key) for key
+                          in ("text", "pretext", "title_link", "from_url"))
+            values.extend(field.get("value") for field
+                          in attachment.get("fields", ()))
+        for value in values:
+            if value and "/pull/" in value:
+                yield from SlackMessage.match_pull_keys(value, seen)
+
+        # lists of blocks or elements, and elements which are not
+        # rich text, e.g. section blocks or buttons
+        lists = [raw_message.get("blocks", ())]
+        lists.extend(attachment.get("blocks", ()) for attachment
+                     in raw_message.get("attachments", ()))
+        nodes = []
+        while lists or nodes:
+            if nodes:
+                node = nodes.pop()
+                text = node.get("text")
+                if text.__class__ is dict:
+                    # text object of section blocks
+                    text = text.get("text")
+                url = node.get("url")
+                for value in (text, url):
+                    if value and "/pull/" in value:
+                        yield from SlackMessage.match_pull_keys(value,
+                                                                seen)
+                for key in ("elements", "fields"):
+                    if key in node:
+                        lists.append(node[key])
+                if "accessory" in node:
+                    lists.append((node["accessory"],))
+                continue
+
+            for element in lists.pop():
+                # rich text elements are the bulk of a message,
+                # check them in place instead of queueing them
+                element_type = element.get("type")
+                if element_type == "text":
+                    value = element.get("text")
+                elif element_type == "link":
+                    value = element.get("url")
+                elif element_type in SlackMessage.RICH_TEXT_LISTS:
+                    lists.append(element.get("elements", ()))
+                    continue
+                elif element_type in SlackMessage.RICH_TEXT_LEAVES:
+                    continue
+                else:
+                    nodes.append(element)
+                    continue
+                if value and "/pull/" in value:
+                    yield from SlackMessage.match_pull_keys(value, seen)
+
+    @staticmethod
+    def match_pull_keys(value: str, seen: set):
+        """
+        Match pull request links in a string
+        :param value: message text or url (str)
+        :param seen:  keys matched before (set), updated in place
+        :return: generator of new (owner, repo, number) tuples
+        """
+        for owner, repo, number in SlackMessage.PR_PATTERN.findall(value):
+            key = GitClient.pr_key(owner, repo, number)
+            if key not in seen:
+                seen.add(key)
+                yield key